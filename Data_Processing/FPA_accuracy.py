@@ -7,6 +7,7 @@ import matplotlib.pyplot as plt
 from scipy.signal import find_peaks
 
 from utils.mocap import fpa_mocap
+from utils import fpab
 
 os.makedirs('graphs', exist_ok=True)
 
@@ -54,6 +55,8 @@ def ge_from_heel_height(data, side, fs=100):
 
 
 def load_imu_fpa(imu_file):
+    if imu_file.endswith('.fpab'):
+        return fpab.load_step_fpa(imu_file)
     raw   = pd.read_csv(imu_file)
     steps = raw[raw['fpa'].notna() & (raw['fpa'] != '')].copy()
     steps['fpa'] = steps['fpa'].astype(float)
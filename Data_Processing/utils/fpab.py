@@ -0,0 +1,95 @@
+# name: fpab.py
+# description: read binary .fpab session logs written by Laptop_PIpeline
+# date: 2026/10/18
+#
+# Format (see Laptop_PIpeline/fpab.py, which also writes and exports to CSV;
+# the constants below are copied from it, bump VERSION in both together):
+#   file header  <4sHHI   magic b"FPAB", version, reserved, metadata length, then JSON metadata
+#   chunks       <4sIIQ   tag, row count, payload bytes, first row, then the payload
+#     SAMP  time <f8[n], then ax, ay, az, gx, gy, gz as <f4[n] each
+#     STEP  n records of STEP_DTYPE
+#     META  JSON merged over the header metadata
+
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"FPAB"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHHI")
+CHUNK_HEADER = struct.Struct("<4sIIQ")
+STEP_DTYPE = np.dtype([
+    ("row", "<u8"),
+    ("time", "<f8"),
+    ("step", "<u4"),
+    ("fpa", "<f8"),
+    ("drv", "S4"),
+    ("effect", "S8"),
+])
+
+
+def read_fpab(path, samples=False):
+    """ Read an .fpab session log
+
+    Only chunk headers, metadata and step tables are read unless samples is
+    set; sample chunks are skipped with a seek.
+
+    Params:
+        path: .fpab file | str
+        samples: also return the raw samples | bool
+
+    Returns:
+        meta: session metadata (algorithm, config, base_fpa, ...) | dict
+        steps: step events (row, time, step, fpa, drv, effect) | np.ndarray of STEP_DTYPE
+        times, data: per-sample time and (N, 6) ax..gz, only if samples | np.ndarray
+    """
+    steps = []
+    times, data = [], []
+    with open(path, 'rb') as f:
+        head = f.read(FILE_HEADER.size)
+        if len(head) < FILE_HEADER.size or head[:4] != MAGIC:
+            raise ValueError(f'{path} is not an .fpab session log')
+        _, version, _, meta_len = FILE_HEADER.unpack(head)
+        if version != VERSION:
+            raise ValueError(f'{path}: unsupported .fpab version {version}, this reader handles version {VERSION}')
+        meta = json.loads(f.read(meta_len))
+        while True:
+            head = f.read(CHUNK_HEADER.size)
+            if len(head) < CHUNK_HEADER.size:
+                break
+            tag, count, nbytes, _ = CHUNK_HEADER.unpack(head)
+            if tag == b'SAMP' and not samples:
+                f.seek(nbytes, 1)
+                continue
+            payload = f.read(nbytes)
+            if len(payload) < nbytes:
+                break  # last chunk still being written
+            if tag == b'STEP':
+                steps.append(np.frombuffer(payload, dtype=STEP_DTYPE, count=count))
+            elif tag == b'META':
+                meta.update(json.loads(payload))
+            elif tag == b'SAMP':
+                times.append(np.frombuffer(payload, dtype='<f8', count=count))
+                data.append(np.frombuffer(payload, dtype='<f4', count=6 * count, offset=8 * count).reshape(6, count).T)
+
+    steps = np.concatenate(steps) if steps else np.empty(0, dtype=STEP_DTYPE)
+    if not samples:
+        return meta, steps
+    times = np.concatenate(times) if times else np.empty(0)
+    data = np.concatenate(data) if data else np.empty((0, 6), dtype=np.float32)
+    return meta, steps, times, data
+
+
+def load_step_fpa(path):
+    """ Per-step FPA from an .fpab log, same values as the fpa column of the CSV
+
+    Params:
+        path: .fpab file | str
+
+    Returns:
+        fpa: per-step FPA in degrees, rounded like the CSV (0.1 deg) | np.ndarray
+    """
+    _, steps = read_fpab(path)
+    return np.round(steps['fpa'], 1)
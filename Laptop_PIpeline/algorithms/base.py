@@ -1,12 +1,48 @@
 # Shared constants and Protocol interfaces for FPA algorithm plugins.
 # A plugin must export FPA and GaitPhase classes matching these protocols.
 
+import time
 from typing import Protocol
 
+import numpy as np
+
 # Gait phase states (from SageMotion)
 EULER_INIT_LEN = 5
 stance_status = [EARLY_STANCE, MIDDLE_STANCE, LATE_STANCE, SWING] = range(4)
 
+# Column layout of a sample block: one row per sample, accel in m/s², gyro in deg/s
+BLOCK_COLUMNS = ("AccelX", "AccelY", "AccelZ", "GyroX", "GyroY", "GyroZ")
+# Column layout of the per-sample gait array returned by update_gaitphase_batch
+GAIT_COLUMNS = ("gaitphase_old", "gaitphase", "step_count")
+
+
+class SensorSample:
+    # Compact per-sample record handed to v1 plugins in place of a dict.
+    # Supports sensor_data["GyroX"] as well as sensor_data.GyroX.
+    __slots__ = BLOCK_COLUMNS
+
+    def __init__(self, row):
+        (
+            self.AccelX, self.AccelY, self.AccelZ,
+            self.GyroX, self.GyroY, self.GyroZ,
+        ) = row
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+
+class StepEvent:
+    # Emitted once per step, on the block row where the feedback window opens.
+    __slots__ = ("index", "step_count", "fpa")
+
+    def __init__(self, index, step_count, fpa):
+        self.index = index
+        self.step_count = step_count
+        self.fpa = fpa
+
+
+# v1: one sample per call. FPA_this_step is NaN after a step the plugin could
+# not compute (e.g. one longer than it buffers); the pipeline skips that step.
 
 class FPAAlgorithm(Protocol):
     FPA_this_step: float
@@ -23,3 +59,112 @@ class GaitPhaseDetector(Protocol):
 
     def update_gaitphase(self, sensor_data: dict) -> None:
         ...
+
+
+# v2: a contiguous (N, 6) float block per call, laid out as BLOCK_COLUMNS.
+# After a call the v1 attributes reflect the state after the last row.
+
+class FPAAlgorithmV2(FPAAlgorithm, Protocol):
+    def update_FPA_batch(self, block: np.ndarray, gait: np.ndarray) -> np.ndarray:
+        # gait is the (N, 3) array from update_gaitphase_batch.
+        # Returns FPA_this_step after each row, shape (N,).
+        ...
+
+
+class GaitPhaseDetectorV2(GaitPhaseDetector, Protocol):
+    def update_gaitphase_batch(self, block: np.ndarray) -> np.ndarray:
+        # Returns an (N, 3) int array laid out as GAIT_COLUMNS.
+        ...
+
+
+# edge: the foot board runs the gait phase itself and sends each step's samples
+# from step_tail_start(length) on (see edge_steps.py).
+
+class FPAAlgorithmEdge(FPAAlgorithm, Protocol):
+    def update_FPA_step(self, tail: np.ndarray, length: int) -> float:
+        # tail: the last rows of a `length`-row window laid out as BLOCK_COLUMNS.
+        # Returns FPA_this_step for that step.
+        ...
+
+    @staticmethod
+    def step_tail_start(length: int) -> int:
+        ...
+
+
+def supports_edge(fpa):
+    return hasattr(fpa, "update_FPA_step") and hasattr(fpa, "step_tail_start")
+
+
+def supports_batch(gaitphase, fpa):
+    return hasattr(gaitphase, "update_gaitphase_batch") and hasattr(fpa, "update_FPA_batch")
+
+
+# Both processors also leave `boundaries`: (row, step_count) for every
+# EARLY_STANCE -> MIDDLE_STANCE transition in the last block, where the FPA of
+# step_count was computed from the samples buffered since the one before.
+
+class BatchStepProcessor:
+    # Drives a v2 plugin pair over a whole block.
+
+    def __init__(self, gaitphase: GaitPhaseDetectorV2, fpa: FPAAlgorithmV2):
+        self.gaitphase = gaitphase
+        self.fpa = fpa
+        self.boundaries = []
+
+    def process_block(self, block, trace=None):
+        # trace, if given, gets "gait" and "fpa" stamps (see latency.py)
+        gait = self.gaitphase.update_gaitphase_batch(block)
+        if trace is not None:
+            trace.mark("gait")
+        fpas = self.fpa.update_FPA_batch(block, gait)
+        if trace is not None:
+            trace.mark("fpa")
+        computed = np.flatnonzero((gait[:, 0] == EARLY_STANCE) & (gait[:, 1] == MIDDLE_STANCE))
+        self.boundaries = [(int(i), int(gait[i, 2])) for i in computed]
+        window = np.flatnonzero(
+            (gait[:, 0] == MIDDLE_STANCE) & (gait[:, 1] == LATE_STANCE)
+        )
+        return [StepEvent(int(i), int(gait[i, 2]), float(fpas[i])) for i in window]
+
+
+class V1StepAdapter:
+    # Feeds a v1 dict-style plugin pair one SensorSample at a time.
+
+    def __init__(self, gaitphase: GaitPhaseDetector, fpa: FPAAlgorithm):
+        self.gaitphase = gaitphase
+        self.fpa = fpa
+        self.boundaries = []
+
+    def process_block(self, block, trace=None):
+        # calls interleave per sample, so with a trace the gait and fpa time is
+        # summed and stamped as if the two ran back to back
+        gp, fpa = self.gaitphase, self.fpa
+        clock = time.perf_counter
+        t_start = clock()
+        t_gait = 0.0
+        events = []
+        boundaries = []
+        for i, row in enumerate(block.tolist()):
+            sample = SensorSample(row)
+            if trace is not None:
+                t0 = clock()
+                gp.update_gaitphase(sample)
+                t_gait += clock() - t0
+            else:
+                gp.update_gaitphase(sample)
+            fpa.update_FPA(sample, gp.gaitphase_old, gp.gaitphase)
+            if gp.gaitphase_old == EARLY_STANCE and gp.gaitphase == MIDDLE_STANCE:
+                boundaries.append((i, gp.step_count))
+            if gp.in_feedback_window:
+                events.append(StepEvent(i, gp.step_count, fpa.FPA_this_step))
+        if trace is not None:
+            trace.mark("gait", t_start + t_gait)
+            trace.mark("fpa", clock())
+        self.boundaries = boundaries
+        return events
+
+
+def make_step_processor(gaitphase, fpa):
+    if supports_batch(gaitphase, fpa):
+        return BatchStepProcessor(gaitphase, fpa)
+    return V1StepAdapter(gaitphase, fpa)
@@ -0,0 +1,81 @@
+# Fixed-capacity NumPy ring buffer for per-sample sensor rows.
+# Plugins use it to hold the current step without per-sample allocation.
+
+import numpy as np
+
+# What to do when a sample arrives and the buffer is full
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # overwrite the oldest sample
+OVERFLOW_RESET = "reset"              # discard the buffered samples and start over
+OVERFLOW_COUNT = "count"              # keep the buffered samples, drop the new one
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_RESET, OVERFLOW_COUNT)
+
+
+class SampleRingBuffer:
+    # With drop_oldest every row is written twice (at i and i + capacity), so the
+    # buffered samples are always one contiguous slice and view() never copies.
+    # The other policies always start at row 0 and need no mirror.
+
+    def __init__(self, capacity, width=6, dtype=np.float64, overflow=OVERFLOW_DROP_OLDEST):
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.capacity = capacity
+        self.width = width
+        self.overflow = overflow
+        self._mirror = overflow == OVERFLOW_DROP_OLDEST
+        self._data = np.zeros([2 * capacity if self._mirror else capacity, width], dtype=dtype)
+        self._start = 0
+        self._len = 0
+        self.overflow_count = 0    # times a sample arrived with the buffer full
+        self.dropped_samples = 0   # samples lost to those overflows
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    def append(self, row):
+        if self._len == self.capacity:
+            self.overflow_count += 1
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._start = (self._start + 1) % self.capacity
+                self._len -= 1
+                self.dropped_samples += 1
+            elif self.overflow == OVERFLOW_RESET:
+                self.dropped_samples += self._len
+                self._len = 0
+            else:
+                self.dropped_samples += 1
+                return
+        pos = (self._start + self._len) % self.capacity
+        self._data[pos] = row
+        if self._mirror:
+            self._data[pos + self.capacity] = row
+        self._len += 1
+
+    def extend(self, rows):
+        n = len(rows)
+        if n == 0:
+            return
+        if self._len + n > self.capacity:
+            # overflow semantics are per sample; this path is rare
+            for row in rows:
+                self.append(row)
+            return
+        pos = (self._start + self._len + np.arange(n)) % self.capacity
+        self._data[pos] = rows
+        if self._mirror:
+            self._data[pos + self.capacity] = rows
+        self._len += n
+
+    def view(self):
+        # Zero-copy (len, width) view of the buffered samples, oldest first.
+        # Only valid until the next append/clear.
+        return self._data[self._start:self._start + self._len]
+
+    def clear(self):
+        self._start = 0
+        self._len = 0
@@ -3,84 +3,171 @@
 import math
 
 import numpy as np
-from scipy.signal import butter, filtfilt
-import transforms3d
 from algorithms.base import EARLY_STANCE, MIDDLE_STANCE, EULER_INIT_LEN
+from algorithms.ring_buffer import SampleRingBuffer, OVERFLOW_RESET
 
 
 class FPA:
 
-    def __init__(self, is_right_foot, datarate=100, alpha=0.8):
+    def __init__(
+        self,
+        is_right_foot,
+        datarate=100,
+        alpha=0.8,
+        max_step_duration=3.0,
+        buffer_dtype=np.float64,
+        overflow=OVERFLOW_RESET,
+    ):
         self.datarate = datarate
         self.ALPHA = alpha
         self.FPA_this_step = 0.0
         self.FPA_last_step = 0.0
-        self.step_data_buffer = []
+        # one row per sample: ax, ay, az (m/s^2), gx, gy, gz (deg/s). A step
+        # that outlasts it (a pause, not a stride) has lost the start of its
+        # window, so it gets no FPA: FPA_this_step is NaN for that step and
+        # the smoothing carries on from the last step that had one.
+        self.step_data_buffer = SampleRingBuffer(
+            math.ceil(max_step_duration * datarate),
+            width=6,
+            dtype=buffer_dtype,
+            overflow=overflow,
+        )
+        self._overflows = 0  # step_data_buffer.overflow_count when the step began
+        self.skipped_steps = 0
         self.is_right_foot = is_right_foot
 
     def update_FPA(self, data, gaitphase_old, gaitphase):
-        self.step_data_buffer.append(data)
-        if gaitphase_old == EARLY_STANCE and gaitphase == MIDDLE_STANCE:
-            euler_angles_esti = self.get_euler_angles(
-                self.step_data_buffer, self.datarate
-            )
-            acc_rotated = self.get_rotated_acc(self.step_data_buffer, euler_angles_esti)
-            acc_rotated_smoothed = self.smooth_acc_rotated(acc_rotated)
-            self.FPA_this_step = self.get_FPA_via_max_acc_ratio_at_norm_peak(
-                acc_rotated_smoothed
-            )
-            if self.FPA_this_step > 90:
-                self.FPA_this_step = self.FPA_this_step - 180
-            elif self.FPA_this_step < -90:
-                self.FPA_this_step = self.FPA_this_step + 180
-            self.step_data_buffer = []
-            if self.is_right_foot:
-                self.FPA_this_step = -self.FPA_this_step
-
-            self.FPA_this_step = (
-                self.FPA_this_step * self.ALPHA + (1 - self.ALPHA) * self.FPA_last_step
+        self.step_data_buffer.append(
+            (
+                data["AccelX"], data["AccelY"], data["AccelZ"],
+                data["GyroX"], data["GyroY"], data["GyroZ"],
             )
-            self.FPA_last_step = self.FPA_this_step
+        )
+        if gaitphase_old == EARLY_STANCE and gaitphase == MIDDLE_STANCE:
+            self.update_FPA_this_step()
+
+    def update_FPA_batch(self, block, gait):
+        fpas = np.empty(len(block))
+        boundaries = np.flatnonzero(
+            (gait[:, 0] == EARLY_STANCE) & (gait[:, 1] == MIDDLE_STANCE)
+        )
+        start = 0
+        for i in boundaries.tolist():
+            self.step_data_buffer.extend(block[start:i + 1])
+            fpas[start:i] = self.FPA_this_step
+            self.update_FPA_this_step()
+            fpas[i] = self.FPA_this_step
+            start = i + 1
+        self.step_data_buffer.extend(block[start:])
+        fpas[start:] = self.FPA_this_step
+        return fpas
+
+    def update_FPA_step(self, tail, length):
+        # edge mode: a whole step at once, as its last len(tail) samples of a
+        # `length`-sample window. Rows before step_tail_start(length) never
+        # reach the result, so zeros stand in for any that were not sent.
+        self.step_data_buffer.clear()
+        missing = length - len(tail)
+        if missing > 0:
+            self.step_data_buffer.extend(np.zeros((missing, 6)))
+        self.step_data_buffer.extend(tail)
+        self.update_FPA_this_step()
+        return self.FPA_this_step
+
+    @staticmethod
+    def step_tail_start(length, smooth_win_len=29):
+        # first window row update_FPA_this_step depends on: the peak search
+        # starts at 56% of the window, less half the smoothing window; and the
+        # "same"-mode smoothing needs at least a full window of rows
+        return max(0, min((56 * length) // 100 - smooth_win_len // 2, length - smooth_win_len))
+
+    def update_FPA_this_step(self):
+        if self.step_data_buffer.overflow_count != self._overflows:
+            self._overflows = self.step_data_buffer.overflow_count
+            self.step_data_buffer.clear()
+            self.skipped_steps += 1
+            self.FPA_this_step = math.nan
+            return
+        step = self.step_data_buffer.view()
+        acc, gyr = step[:, :3], step[:, 3:]
+        euler_angles_esti = self.get_euler_angles_batch(gyr, acc, self.datarate)
+        acc_rotated = self.get_rotated_acc_batch(acc, euler_angles_esti)
+        acc_rotated_smoothed = self.smooth_acc_rotated(acc_rotated)
+        self.FPA_this_step = self.get_FPA_via_max_acc_ratio_at_norm_peak(
+            acc_rotated_smoothed
+        )
+        if self.FPA_this_step > 90:
+            self.FPA_this_step = self.FPA_this_step - 180
+        elif self.FPA_this_step < -90:
+            self.FPA_this_step = self.FPA_this_step + 180
+        self.step_data_buffer.clear()
+        if self.is_right_foot:
+            self.FPA_this_step = -self.FPA_this_step
+
+        self.FPA_this_step = (
+            self.FPA_this_step * self.ALPHA + (1 - self.ALPHA) * self.FPA_last_step
+        )
+        self.FPA_last_step = self.FPA_this_step
+
+    @staticmethod
+    def buffer_to_arrays(data_buffer):
+        # (N,3) gyro (deg/s) and (N,3) accel (m/s^2) arrays from a list of sensor dicts
+        data = np.array(
+            [
+                [d["GyroX"], d["GyroY"], d["GyroZ"], d["AccelX"], d["AccelY"], d["AccelZ"]]
+                for d in data_buffer
+            ],
+            dtype=float,
+        )
+        return data[:, :3], data[:, 3:]
 
     @staticmethod
     def get_euler_angles(data_buffer, datarate):
+        gyr, acc = FPA.buffer_to_arrays(data_buffer)
+        return FPA.get_euler_angles_batch(gyr, acc, datarate)
+
+    @staticmethod
+    def get_euler_angles_batch(gyr, acc, datarate, out=None):
+        # Same backward integration as the original per-sample loop, but on (N,3)
+        # gyro (deg/s) / accel arrays. The recursion is inherently sequential, so
+        # the inner loop runs on plain floats and writes into preallocated lists.
         delta_t = 1 / datarate
-        data_len = len(data_buffer)
-        euler_angles_esti = np.zeros([data_len, 3])
-
-        gravity_vector = np.zeros([3])
-        for i_sample in range(-1, -(EULER_INIT_LEN + 1), -1):
-            sample_data = data_buffer[i_sample]
-            gravity_vector += np.array(
-                [sample_data["AccelX"], sample_data["AccelY"], sample_data["AccelZ"]]
-            )
-        gravity_vector /= EULER_INIT_LEN
+        data_len = gyr.shape[0]
+        euler_angles_esti = np.zeros([data_len, 3]) if out is None else out
+
+        gravity_vector = acc[-EULER_INIT_LEN:].sum(axis=0) / EULER_INIT_LEN
         init_sample = data_len - math.ceil(EULER_INIT_LEN / 2)
-        euler_angles_esti[init_sample:, 0] = np.arctan2(
-            gravity_vector[1], gravity_vector[2]
-        )
-        euler_angles_esti[init_sample:, 1] = np.arctan2(
-            -gravity_vector[0], np.sqrt(gravity_vector[1] ** 2 + gravity_vector[2] ** 2)
+        roll = math.atan2(gravity_vector[1], gravity_vector[2])
+        pitch = math.atan2(
+            -gravity_vector[0],
+            math.sqrt(gravity_vector[1] ** 2 + gravity_vector[2] ** 2),
         )
-
+        yaw = 0.0
+        euler_angles_esti[init_sample:, 0] = roll
+        euler_angles_esti[init_sample:, 1] = pitch
+        euler_angles_esti[init_sample:, 2] = yaw
+        if init_sample <= 0:
+            return euler_angles_esti
+
+        gyr_dt = (np.deg2rad(gyr[:init_sample]) * delta_t).tolist()
+        rolls = [0.0] * init_sample
+        pitches = [0.0] * init_sample
+        yaws = [0.0] * init_sample
+        sin, cos, tan = math.sin, math.cos, math.tan
         for i_sample in range(init_sample - 1, -1, -1):
-            sample_data = data_buffer[i_sample]
-            sample_gyr = np.deg2rad(
-                [sample_data["GyroX"], sample_data["GyroY"], sample_data["GyroZ"]]
-            )
-            roll, pitch, yaw = euler_angles_esti[i_sample + 1, :]
-            transfer_mat = np.asmatrix(
-                [
-                    [1, np.sin(roll) * np.tan(pitch), np.cos(roll) * np.tan(pitch)],
-                    [0, np.cos(roll), -np.sin(roll)],
-                    [0, np.sin(roll) / np.cos(pitch), np.cos(roll) / np.cos(pitch)],
-                ]
-            )
-            angle_augment = np.matmul(transfer_mat, sample_gyr)
-            euler_angles_esti[i_sample, :] = (
-                euler_angles_esti[i_sample + 1, :] - angle_augment * delta_t
-            )
-
+            gx, gy, gz = gyr_dt[i_sample]
+            sin_r, cos_r = sin(roll), cos(roll)
+            tan_p = tan(pitch)
+            cos_p = cos(pitch)
+            roll = roll - (gx + sin_r * tan_p * gy + cos_r * tan_p * gz)
+            pitch = pitch - (cos_r * gy - sin_r * gz)
+            yaw = yaw - (sin_r * gy + cos_r * gz) / cos_p
+            rolls[i_sample] = roll
+            pitches[i_sample] = pitch
+            yaws[i_sample] = yaw
+        euler_angles_esti[:init_sample, 0] = rolls
+        euler_angles_esti[:init_sample, 1] = pitches
+        euler_angles_esti[:init_sample, 2] = yaws
         return euler_angles_esti
 
     @staticmethod
@@ -107,22 +194,39 @@ class FPA:
 
     @staticmethod
     def get_rotated_acc(step_data_buffer, euler_angles):
-        data_len = len(step_data_buffer)
-        acc_rotated = np.zeros([data_len, 3])
-        for i_sample, sample_data in enumerate(step_data_buffer):
-            sample_acc = [
-                sample_data["AccelX"],
-                sample_data["AccelY"],
-                sample_data["AccelZ"],
-            ]
-            dcm_mat = transforms3d.euler.euler2mat(
-                euler_angles[i_sample, 0], euler_angles[i_sample, 1], 0
-            )
-            acc_rotated[i_sample, :] = np.matmul(dcm_mat, sample_acc)
-        return acc_rotated
+        _, acc = FPA.buffer_to_arrays(step_data_buffer)
+        return FPA.get_rotated_acc_batch(acc, euler_angles)
+
+    @staticmethod
+    def get_rotation_matrices(euler_angles):
+        # (N,3,3) stack of transforms3d.euler.euler2mat(roll, pitch, 0) ('sxyz'),
+        # i.e. Ry(pitch) @ Rx(roll), built in one pass
+        roll = euler_angles[:, 0]
+        pitch = euler_angles[:, 1]
+        sin_r, cos_r = np.sin(roll), np.cos(roll)
+        sin_p, cos_p = np.sin(pitch), np.cos(pitch)
+        dcm_mats = np.empty([euler_angles.shape[0], 3, 3])
+        dcm_mats[:, 0, 0] = cos_p
+        dcm_mats[:, 0, 1] = sin_p * sin_r
+        dcm_mats[:, 0, 2] = sin_p * cos_r
+        dcm_mats[:, 1, 0] = 0.0
+        dcm_mats[:, 1, 1] = cos_r
+        dcm_mats[:, 1, 2] = -sin_r
+        dcm_mats[:, 2, 0] = -sin_p
+        dcm_mats[:, 2, 1] = cos_p * sin_r
+        dcm_mats[:, 2, 2] = cos_p * cos_r
+        return dcm_mats
+
+    @staticmethod
+    def get_rotated_acc_batch(acc, euler_angles):
+        dcm_mats = FPA.get_rotation_matrices(euler_angles)
+        return np.matmul(dcm_mats, acc[:, :, np.newaxis])[:, :, 0]
 
     @staticmethod
     def data_filt(data, cut_off_fre=3.8, sampling_fre=100, filter_order=4):
+        # not on the per-step path; scipy.signal is slow to import
+        from scipy.signal import butter, filtfilt
+
         fre = cut_off_fre / (sampling_fre / 2)
         b, a = butter(filter_order, fre, "lowpass")
         if len(data.shape) == 1:
@@ -31,6 +31,17 @@ class GaitPhase:
             [sensor_data["GyroX"], sensor_data["GyroY"], sensor_data["GyroZ"]],
             ord=2,
         )
+        self.update_gaitphase_gyromag(gyroMag)
+
+    def update_gaitphase_batch(self, block):
+        gyroMags = np.sqrt(np.einsum("ij,ij->i", block[:, 3:6], block[:, 3:6])).tolist()
+        gait = [None] * len(gyroMags)
+        for i, gyroMag in enumerate(gyroMags):
+            self.update_gaitphase_gyromag(gyroMag)
+            gait[i] = (self.gaitphase_old, self.gaitphase, self.step_count)
+        return np.array(gait, dtype=np.int64).reshape(-1, 3)
+
+    def update_gaitphase_gyromag(self, gyroMag):
         if self.gaitphase == SWING:
             self.gaitphase_old = SWING
             if gyroMag < self.GYROMAG_THRESHOLD_HEELSTRIKE:
@@ -0,0 +1,2 @@
+from .fpa import FPA
+from algorithms.sage_motion.gaitphase import GaitPhase
@@ -0,0 +1,167 @@
+# Streaming FPA: same step definition and peak rule as sage_motion, but all work
+# is spread across samples so the FPA is ready the moment mid-stance is detected.
+#
+#  - orientation: forward complementary filter (gyro Euler-rate integration,
+#    pulled towards the accelerometer tilt while the foot is in stance)
+#  - smoothing: two cascaded running means (triangular window, ~29 samples)
+#    in place of the centred Hanning window
+#  - peak: running max of the smoothed planar acceleration norm over the last
+#    44% of the stride, using the previous stride's length
+#
+# Every per-sample update is O(1) and touches only floats.
+#
+# It does not reproduce sage_motion. Per step, on the recorded sessions in
+# output/, the two differ by a median of 1-2 deg on the treadmill trials and
+# up to 9 deg on overground and fast walking, with a constant bias of up to
+# 6 deg per trial; a step after a pause can be tens of degrees off. The bias
+# cancels against a baseline calibrated with this plugin, not with a
+# sage_motion one. tests/test_streaming.py holds it to these bounds.
+#
+# There is no edge mode (update_FPA_step): the filter needs each stride from
+# its first sample, and an edge-mode board sends only the window tail
+# sage_motion needs, so run_device refuses this plugin for such a board.
+
+import math
+
+import numpy as np
+from algorithms.base import EARLY_STANCE, MIDDLE_STANCE, SWING
+
+GRAVITY = 9.81
+
+
+class FPA:
+
+    def __init__(
+        self,
+        is_right_foot,
+        datarate=100,
+        alpha=0.8,
+        smooth_win_len=29,
+        tilt_time_constant=0.1,
+        peak_check_start=0.56,
+    ):
+        self.datarate = datarate
+        self.ALPHA = alpha
+        self.FPA_this_step = 0.0
+        self.FPA_last_step = 0.0
+        self.is_right_foot = is_right_foot
+
+        self.delta_t = 1 / datarate
+        self.tilt_gain = min(1.0, self.delta_t / tilt_time_constant)
+        self.peak_check_start = peak_check_start
+        self.roll = None
+        self.pitch = 0.0
+
+        # two cascaded boxcars of length box_len make a triangular window of
+        # 2 * box_len - 1 samples, delayed by box_len - 1 samples
+        self.box_len = max(1, (smooth_win_len + 1) // 2)
+        self.smooth_delay = self.box_len - 1
+        self._box1 = [(0.0, 0.0)] * self.box_len
+        self._box2 = [(0.0, 0.0)] * self.box_len
+        self._box_pos = 0
+        self._sum1 = [0.0, 0.0]
+        self._sum2 = [0.0, 0.0]
+
+        self.samples_this_step = 0
+        self.last_step_len = 0
+        self._peak_norm = -1.0
+        self._peak_acc = (0.0, 0.0)
+
+    def update_FPA(self, data, gaitphase_old, gaitphase):
+        self.update_sample(
+            data["AccelX"], data["AccelY"], data["AccelZ"],
+            data["GyroX"], data["GyroY"], data["GyroZ"],
+            gaitphase_old, gaitphase,
+        )
+
+    def update_FPA_batch(self, block, gait):
+        fpas = [0.0] * len(block)
+        update_sample = self.update_sample
+        for i, (row, (gaitphase_old, gaitphase, _)) in enumerate(zip(block.tolist(), gait.tolist())):
+            update_sample(*row, gaitphase_old, gaitphase)
+            fpas[i] = self.FPA_this_step
+        return np.array(fpas)
+
+    def update_sample(self, ax, ay, az, gx, gy, gz, gaitphase_old, gaitphase):
+        sin, cos = math.sin, math.cos
+        if self.roll is None:
+            self.roll, self.pitch = self.tilt_from_acc(ax, ay, az)
+
+        # gyro integration of the Euler angle rates (deg/s -> rad)
+        roll, pitch = self.roll, self.pitch
+        sin_r, cos_r = sin(roll), cos(roll)
+        gx_dt = math.radians(gx) * self.delta_t
+        gy_dt = math.radians(gy) * self.delta_t
+        gz_dt = math.radians(gz) * self.delta_t
+        tan_p = math.tan(pitch)
+        roll += gx_dt + sin_r * tan_p * gy_dt + cos_r * tan_p * gz_dt
+        pitch += cos_r * gy_dt - sin_r * gz_dt
+
+        # accelerometer tilt correction while the foot is (nearly) static
+        if gaitphase != SWING and abs(math.sqrt(ax * ax + ay * ay + az * az) - GRAVITY) < 0.1 * GRAVITY:
+            roll_acc, pitch_acc = self.tilt_from_acc(ax, ay, az)
+            roll += self.tilt_gain * (roll_acc - roll)
+            pitch += self.tilt_gain * (pitch_acc - pitch)
+        self.roll, self.pitch = roll, pitch
+
+        # planar components of Ry(pitch) @ Rx(roll) @ acc
+        sin_r, cos_r = sin(roll), cos(roll)
+        sin_p, cos_p = sin(pitch), cos(pitch)
+        acc_x = cos_p * ax + sin_p * sin_r * ay + sin_p * cos_r * az
+        acc_y = cos_r * ay - sin_r * az
+        acc_x, acc_y = self.smooth_sample(acc_x, acc_y)
+
+        # running peak over the tail of the stride (smoothed values lag smooth_delay samples)
+        self.samples_this_step += 1
+        if self.samples_this_step - self.smooth_delay >= self.peak_check_start * self.last_step_len:
+            norm = acc_x * acc_x + acc_y * acc_y
+            if norm > self._peak_norm:
+                self._peak_norm = norm
+                self._peak_acc = (acc_x, acc_y)
+
+        if gaitphase_old == EARLY_STANCE and gaitphase == MIDDLE_STANCE:
+            self.finish_step()
+
+    def smooth_sample(self, x, y):
+        pos = self._box_pos
+        old_x, old_y = self._box1[pos]
+        self._box1[pos] = (x, y)
+        sum1 = self._sum1
+        sum1[0] += x - old_x
+        sum1[1] += y - old_y
+        mean_x, mean_y = sum1[0] / self.box_len, sum1[1] / self.box_len
+
+        old_x, old_y = self._box2[pos]
+        self._box2[pos] = (mean_x, mean_y)
+        sum2 = self._sum2
+        sum2[0] += mean_x - old_x
+        sum2[1] += mean_y - old_y
+        self._box_pos = (pos + 1) % self.box_len
+        return sum2[0] / self.box_len, sum2[1] / self.box_len
+
+    def finish_step(self):
+        peak_x, peak_y = self._peak_acc
+        self.FPA_this_step = math.degrees(math.atan2(peak_x, peak_y))
+        if self.FPA_this_step > 90:
+            self.FPA_this_step = self.FPA_this_step - 180
+        elif self.FPA_this_step < -90:
+            self.FPA_this_step = self.FPA_this_step + 180
+        if self.is_right_foot:
+            self.FPA_this_step = -self.FPA_this_step
+
+        self.FPA_this_step = (
+            self.FPA_this_step * self.ALPHA + (1 - self.ALPHA) * self.FPA_last_step
+        )
+        self.FPA_last_step = self.FPA_this_step
+
+        self.last_step_len = self.samples_this_step
+        self.samples_this_step = 0
+        self._peak_norm = -1.0
+        self._peak_acc = (0.0, 0.0)
+        # re-sum once per step so the running sums cannot drift
+        self._sum1 = [sum(v[0] for v in self._box1), sum(v[1] for v in self._box1)]
+        self._sum2 = [sum(v[0] for v in self._box2), sum(v[1] for v in self._box2)]
+
+    @staticmethod
+    def tilt_from_acc(ax, ay, az):
+        return math.atan2(ay, az), math.atan2(-ax, math.sqrt(ay * ay + az * az))
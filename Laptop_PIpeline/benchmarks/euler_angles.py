@@ -0,0 +1,88 @@
+# Per-step cost of FPA.get_euler_angles: original per-sample loop vs. batch estimator.
+#
+#   uv run python -m benchmarks.euler_angles
+#
+# A step buffer spans one stride (mid-stance to mid-stance), so its length is
+# fixtures.STRIDE_DURATION * datarate samples.
+
+import math
+import time
+
+import numpy as np
+
+from algorithms.base import EULER_INIT_LEN
+from algorithms.sage_motion.fpa import FPA
+from benchmarks.fixtures import make_step, to_dicts
+
+RATES = (100, 200, 1000)
+REPEATS = 20
+
+
+def reference_get_euler_angles(data_buffer, datarate):
+    # The original per-sample implementation, kept for timing and equivalence.
+    delta_t = 1 / datarate
+    data_len = len(data_buffer)
+    euler_angles_esti = np.zeros([data_len, 3])
+
+    gravity_vector = np.zeros([3])
+    for i_sample in range(-1, -(EULER_INIT_LEN + 1), -1):
+        sample_data = data_buffer[i_sample]
+        gravity_vector += np.array(
+            [sample_data["AccelX"], sample_data["AccelY"], sample_data["AccelZ"]]
+        )
+    gravity_vector /= EULER_INIT_LEN
+    init_sample = data_len - math.ceil(EULER_INIT_LEN / 2)
+    euler_angles_esti[init_sample:, 0] = np.arctan2(
+        gravity_vector[1], gravity_vector[2]
+    )
+    euler_angles_esti[init_sample:, 1] = np.arctan2(
+        -gravity_vector[0], np.sqrt(gravity_vector[1] ** 2 + gravity_vector[2] ** 2)
+    )
+
+    for i_sample in range(init_sample - 1, -1, -1):
+        sample_data = data_buffer[i_sample]
+        sample_gyr = np.deg2rad(
+            [sample_data["GyroX"], sample_data["GyroY"], sample_data["GyroZ"]]
+        )
+        roll, pitch, yaw = euler_angles_esti[i_sample + 1, :]
+        transfer_mat = np.asmatrix(
+            [
+                [1, np.sin(roll) * np.tan(pitch), np.cos(roll) * np.tan(pitch)],
+                [0, np.cos(roll), -np.sin(roll)],
+                [0, np.sin(roll) / np.cos(pitch), np.cos(roll) / np.cos(pitch)],
+            ]
+        )
+        angle_augment = np.matmul(transfer_mat, sample_gyr)
+        euler_angles_esti[i_sample, :] = (
+            euler_angles_esti[i_sample + 1, :] - angle_augment * delta_t
+        )
+
+    return euler_angles_esti
+
+
+def time_call(fn, *args, repeats=REPEATS):
+    fn(*args)
+    best = math.inf
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1e6
+
+
+def main():
+    print(f"{'rate':>6} {'samples':>8} {'original us':>12} {'batch us':>10} {'speedup':>8} {'max |diff|':>11}")
+    for rate in RATES:
+        gyr, acc = make_step(rate)
+        buffer = to_dicts(gyr, acc)
+        expected = reference_get_euler_angles(buffer, rate)
+        out = np.zeros([len(buffer), 3])
+        actual = FPA.get_euler_angles_batch(gyr, acc, rate, out)
+        diff = np.max(np.abs(actual - expected))
+        t_ref = time_call(reference_get_euler_angles, buffer, rate, repeats=5)
+        t_batch = time_call(FPA.get_euler_angles_batch, gyr, acc, rate, out)
+        print(f"{rate:>6} {len(buffer):>8} {t_ref:>12.0f} {t_batch:>10.0f} {t_ref / t_batch:>7.1f}x {diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# Deterministic fixtures shared by the benchmarks.
+
+import numpy as np
+
+# A step buffer spans one stride (mid-stance to mid-stance)
+STRIDE_DURATION = 1.1
+
+
+def make_step(datarate, seed=0):
+    # (gyr deg/s, acc m/s^2) for one stride: flat foot at both ends and a
+    # sagittal swing rotation in between
+    rng = np.random.default_rng(seed)
+    n = int(STRIDE_DURATION * datarate)
+    t = np.linspace(0, 1, n)
+    swing = (t > 0.35) & (t < 0.77)
+    gyr = rng.normal(0, 2, (n, 3))
+    gyr[swing, 0] += 300 * np.sin(2 * np.pi * (t[swing] - 0.35) / 0.42)
+    acc = rng.normal(0, 0.2, (n, 3))
+    acc[:, 2] += 9.81
+    acc[swing, 1] += 12 * np.sin(2 * np.pi * (t[swing] - 0.35) / 0.42)
+    return gyr, acc
+
+
+def make_block(datarate, seed=0):
+    # the same stride as an (N, 6) v2 block: ax, ay, az, gx, gy, gz
+    gyr, acc = make_step(datarate, seed)
+    return np.hstack([acc, gyr])
+
+
+def to_dicts(gyr, acc):
+    return [
+        {"AccelX": a[0], "AccelY": a[1], "AccelZ": a[2], "GyroX": g[0], "GyroY": g[1], "GyroZ": g[2]}
+        for g, a in zip(gyr.tolist(), acc.tolist())
+    ]
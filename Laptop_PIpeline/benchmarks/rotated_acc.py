@@ -0,0 +1,54 @@
+# Per-step cost of FPA.get_rotated_acc: original per-sample transforms3d loop vs.
+# stacked rotation.
+#
+#   uv run python -m benchmarks.rotated_acc
+#
+# transforms3d is no longer a runtime dependency; install it to time the original.
+
+import numpy as np
+
+from algorithms.sage_motion.fpa import FPA
+from benchmarks.euler_angles import RATES, time_call
+from benchmarks.fixtures import make_step, to_dicts
+
+try:
+    import transforms3d
+except ImportError:
+    transforms3d = None
+
+
+def reference_get_rotated_acc(step_data_buffer, euler_angles):
+    # The original per-sample implementation, kept for timing and equivalence.
+    data_len = len(step_data_buffer)
+    acc_rotated = np.zeros([data_len, 3])
+    for i_sample, sample_data in enumerate(step_data_buffer):
+        sample_acc = [
+            sample_data["AccelX"],
+            sample_data["AccelY"],
+            sample_data["AccelZ"],
+        ]
+        dcm_mat = transforms3d.euler.euler2mat(
+            euler_angles[i_sample, 0], euler_angles[i_sample, 1], 0
+        )
+        acc_rotated[i_sample, :] = np.matmul(dcm_mat, sample_acc)
+    return acc_rotated
+
+
+def main():
+    print(f"{'rate':>6} {'samples':>8} {'original us':>12} {'batch us':>10} {'speedup':>8} {'max |diff|':>11}")
+    for rate in RATES:
+        gyr, acc = make_step(rate)
+        euler_angles = FPA.get_euler_angles_batch(gyr, acc, rate)
+        t_batch = time_call(FPA.get_rotated_acc_batch, acc, euler_angles)
+        if transforms3d is None:
+            print(f"{rate:>6} {len(acc):>8} {'-':>12} {t_batch:>10.0f} {'-':>8} {'-':>11}")
+            continue
+        buffer = to_dicts(gyr, acc)
+        expected = reference_get_rotated_acc(buffer, euler_angles)
+        diff = np.max(np.abs(FPA.get_rotated_acc_batch(acc, euler_angles) - expected))
+        t_ref = time_call(reference_get_rotated_acc, buffer, euler_angles, repeats=5)
+        print(f"{rate:>6} {len(acc):>8} {t_ref:>12.0f} {t_batch:>10.0f} {t_ref / t_batch:>7.1f}x {diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# Microbenchmarks for the per-sample and per-step hot paths.
+#
+#   uv run python -m benchmarks.suite run [--algorithm NAME] [--save FILE]
+#   uv run python -m benchmarks.suite compare BASELINE [--threshold 0.2] [--algorithm NAME]
+#
+# Each case reports the best-of-repeats time per call (µs) and the peak memory
+# allocated during one call (tracemalloc). Per-sample cases also report the
+# share of the per-sample budget at 400 Hz (2.5 ms). Step cases run on fixed
+# strides at 100, 200 and 400 Hz.
+#
+# compare re-runs the suite and exits non-zero if any case got slower than the
+# baseline by more than --threshold (a fraction, default 0.2).
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import platform
+import struct
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from algorithms.base import EARLY_STANCE, MIDDLE_STANCE, SWING, SensorSample
+from benchmarks.fixtures import make_block, make_step, to_dicts
+from bluetooth import BLEConnection
+from imu_packet import pack_frame, parse_block, parse_payload
+from ingest_ring import IngestRing
+from lra_scheduler import CommandScheduler
+
+STEP_RATES = (100, 200, 400)
+BUDGET_RATE = 400
+REPEATS = 7
+TARGET_SECONDS = 0.05
+
+
+def measure(fn, setup=None):
+    # (best-of-repeats µs per call, peak bytes allocated in one call)
+    # setup() runs before every call and is excluded from both figures
+    def run_once():
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        return time.perf_counter() - t0
+
+    run_once()
+    elapsed = run_once()
+    calls = max(1, min(10000, int(TARGET_SECONDS / max(elapsed, 1e-7))))
+    per_call = []
+    for _ in range(REPEATS):
+        total = sum(run_once() for _ in range(calls))
+        per_call.append(total / calls)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(per_call) * 1e6, peak - base
+
+
+def sample_cases(algo):
+    gyr, acc = make_step(100)
+    samples = to_dicts(gyr, acc)
+    sample = SensorSample(make_block(100)[0].tolist())
+    payload = struct.pack("<6f", *make_block(100)[0])
+    gp = algo.GaitPhase(datarate=100)
+    fpa = algo.FPA(is_right_foot=True, datarate=100)
+    scheduler = CommandScheduler(min_interval=0.0)  # no rate limit between repeats
+    frame = pack_frame(0, 0, make_block(100)[:9])
+    ring = IngestRing(4096)
+    conn = BLEConnection(ring=ring)
+
+    def ingest_frame():
+        # handle_notify's work for a 9-sample frame, then the consumer's drain
+        conn.put_packet(frame, 0.0, 0.0, 0.0)
+        ring.drain()
+
+    def lra_command():
+        # what lra_feedback does past the threshold check and print
+        scheduler.submit("1", 1, 1)
+        scheduler.sent(scheduler.poll()[0])
+
+    return {
+        "parse_payload": (lambda: parse_payload(payload), None),
+        "parse_block[1]": (lambda: parse_block(payload), None),
+        "parse_block[frame 9]": (lambda: parse_block(frame), None),
+        "BLEConnection.put_packet+drain[frame 9]": (ingest_frame, None),
+        "GaitPhase.update_gaitphase": (lambda: gp.update_gaitphase(samples[0]), None),
+        "GaitPhase.update_gaitphase[slots]": (lambda: gp.update_gaitphase(sample), None),
+        "FPA.update_FPA[non-boundary]": (lambda: fpa.update_FPA(samples[0], SWING, SWING), None),
+        "CommandScheduler.submit+send": (lra_command, None),
+    }
+
+
+def step_cases(algo, rate):
+    gyr, acc = make_step(rate)
+    samples = to_dicts(gyr, acc)
+    block = make_block(rate)
+    fpa = algo.FPA(is_right_foot=True, datarate=rate)
+
+    def fill_buffer():
+        # a full stride buffered, the next sample closes the step
+        for sample in samples[:-1]:
+            fpa.update_FPA(sample, SWING, SWING)
+
+    cases = {
+        f"FPA.update_FPA[boundary]@{rate}": (
+            lambda: fpa.update_FPA(samples[-1], EARLY_STANCE, MIDDLE_STANCE),
+            fill_buffer,
+        ),
+    }
+    if hasattr(algo.FPA, "get_euler_angles_batch"):
+        euler_angles = algo.FPA.get_euler_angles_batch(gyr, acc, rate)
+        acc_rotated = algo.FPA.get_rotated_acc_batch(acc, euler_angles)
+        cases.update({
+            f"FPA.get_euler_angles@{rate}": (lambda: algo.FPA.get_euler_angles_batch(gyr, acc, rate), None),
+            f"FPA.get_rotated_acc@{rate}": (lambda: algo.FPA.get_rotated_acc_batch(acc, euler_angles), None),
+            f"FPA.smooth@{rate}": (lambda: algo.FPA.smooth(acc_rotated[:, 0], 29, "hanning"), None),
+        })
+    return cases
+
+
+def run_suite(algorithm):
+    algo = importlib.import_module(f"algorithms.{algorithm}")
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        cases = sample_cases(algo)
+        for name, (fn, setup) in cases.items():
+            us, alloc = measure(fn, setup)
+            results[name] = {"us": us, "alloc_bytes": alloc, "per_sample": True}
+        for rate in STEP_RATES:
+            for name, (fn, setup) in step_cases(algo, rate).items():
+                us, alloc = measure(fn, setup)
+                results[name] = {"us": us, "alloc_bytes": alloc, "per_sample": False}
+    return {
+        "meta": {
+            "algorithm": algorithm,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def print_results(report):
+    budget_us = 1e6 / BUDGET_RATE
+    print(f"algorithm: {report['meta']['algorithm']}")
+    print(f"{'case':<38} {'us/call':>10} {'alloc B':>9} {f'% {BUDGET_RATE} Hz':>9}")
+    for name, r in report["results"].items():
+        share = f"{100 * r['us'] / budget_us:.2f}" if r["per_sample"] else ""
+        print(f"{name:<38} {r['us']:>10.2f} {r['alloc_bytes']:>9} {share:>9}")
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    print(f"{'case':<38} {'base us':>10} {'now us':>10} {'change':>8}")
+    for name, r in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:<38} {'-':>10} {r['us']:>10.2f} {'new':>8}")
+            continue
+        change = r["us"] / old["us"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<38} {old['us']:>10.2f} {r['us']:>10.2f} {100 * change:>+7.1f}%{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run")
+    run_p.add_argument("--algorithm", default="sage_motion")
+    run_p.add_argument("--save", metavar="FILE", help="write results as a JSON baseline")
+    cmp_p = sub.add_parser("compare")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("--algorithm")
+    cmp_p.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run_suite(args.algorithm)
+        print_results(report)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"baseline written to {args.save}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    report = run_suite(args.algorithm or baseline["meta"]["algorithm"])
+    regressions = compare(baseline, report, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than baseline by more than {100 * args.threshold:.0f}%")
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
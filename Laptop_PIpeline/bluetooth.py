@@ -2,10 +2,21 @@ import asyncio
 import time
 from collections import deque
 from bleak import BleakScanner, BleakClient
+from bleak.exc import BleakError
+
+from clock_sync import SAMPLE_PERIOD, ClockSync
+from latency import clock
+from imu_packet import SequenceTracker, parse_event, parse_info, parse_packet, parse_pong, parse_step
 
 DEVICE_NAME  = "CIRCUITPY"
 CHAR_UUID_TX = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"  # write to device
 CHAR_UUID_RX = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"  # receive from device
+SCAN_TIMEOUT = 5.0
+CONNECT_TIMEOUT = 10.0  # bleak's default
+RECONNECT_DELAY = 0.25  # first backoff after a failed reconnect, doubling from there
+RECONNECT_MAX_DELAY = 5.0
+RECONNECT_RESCAN_AFTER = 3  # failed reconnects at the last address before scanning for the board again
+LINK_ERRORS = (BleakError, asyncio.TimeoutError, OSError)
 
 
 async def find_devices(name_prefix=DEVICE_NAME):
@@ -23,10 +34,107 @@ async def find_devices(name_prefix=DEVICE_NAME):
 #CIRCUITPY4f33 -> imu
 
 
+def is_address(target):
+    # a MAC address, or the UUID macOS uses in its place
+    return ":" in target or (len(target) == 36 and target.count("-") == 4)
+
+
+class Discovery:
+    # Board names to addresses for a session. find() answers straight away for
+    # an address or a name in the device cache (device_cache.DeviceCache);
+    # anything else is looked for by one scan shared by every caller, which
+    # hands each board over the moment it is seen and stops once nobody is
+    # waiting, rather than running a full discovery window first. rescan()
+    # looks again for a board whose cached address did not answer. Addresses a
+    # scan finds go back into the cache.
+    def __init__(self, cache, scan_timeout=SCAN_TIMEOUT):
+        self.cache = cache
+        self.scan_timeout = scan_timeout  # per board, from when it is asked for
+        self.scan_time = 0.0  # seconds the scanner has run
+        self.cached = set()   # targets resolved from the cache
+        self._wanted = {}     # target -> future of its address
+        self._changed = asyncio.Event()
+        self._scanner = None
+
+    async def find(self, target):
+        # address of target, None if it is not seen within scan_timeout
+        if is_address(target):
+            return target
+        address = self.cache.get(target)
+        if address is not None:
+            self.cached.add(target)
+            print(f"Using cached address for {target} ({address})")
+            return address
+        return await self.rescan(target)
+
+    async def rescan(self, target):
+        self.cached.discard(target)
+        future = self._wanted.get(target)
+        if future is None:
+            future = self._wanted[target] = asyncio.get_running_loop().create_future()
+            print(f"Scanning for {target}...")
+        if self._scanner is None:
+            self._scanner = asyncio.create_task(self._scan())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.scan_timeout)
+        except asyncio.TimeoutError:
+            print(f"{target} not seen within {self.scan_timeout} s")
+            return None
+        finally:
+            if self._wanted.get(target) is future:
+                del self._wanted[target]
+                self._changed.set()
+
+    def _seen(self, device, advertisement_data):
+        for target in (device.name, device.address):
+            future = self._wanted.get(target)
+            if future is not None and not future.done():
+                future.set_result(device.address)
+                self.cache.put(target, device.address)
+                print(f"Found {target} ({device.address})")
+
+    async def _scan(self):
+        started = clock()
+        try:
+            async with BleakScanner(detection_callback=self._seen):
+                while self._wanted:
+                    self._changed.clear()
+                    await self._changed.wait()
+        finally:
+            self.scan_time += clock() - started
+            self._scanner = None
+
+
 class BLEConnection:
-    def __init__(self, packet_queue=None):
-        self.packet_queue = packet_queue
+    def __init__(self, ring=None, latency=None, edge=None, sync_interval=None):
+        self.ring = ring  # ingest_ring.IngestRing that samples are written into
+        self.edge = edge  # edge_steps.EdgeAssembler, used if the IMU reports edge mode or on-device feedback
+        self.latency = latency  # LatencyTracker for commands written by connect_and_write
         self.timestamps = deque(maxlen=50)
+        self.packets = 0
+        self.sequence = SequenceTracker()  # loss/duplicate/reorder counts for framed packets
+        self.capture = None  # replay.CaptureWriter to record raw notifications
+        self.device_info = None  # imu_packet.DeviceInfo the IMU board reported on connect
+        self.info_ready = asyncio.Event()
+        # clock_sync.ClockSync fed by pings every sync_interval seconds (None: no pings)
+        self.sync_interval = sync_interval
+        self.sync = ClockSync() if sync_interval else None
+        self.scheduler = None  # set by connect_and_write
+        self.client = None     # BleakClient while connect_and_read is connected, for write()
+        self.connect_timeout = CONNECT_TIMEOUT
+        self.address = None
+        self.connected_at = None     # clock() when the board first connected
+        self.first_sample_at = None  # clock() of the first notification carrying samples
+        self.first_sample = asyncio.Event()
+        self.reconnect_delay = RECONNECT_DELAY
+        self.reconnect_max = RECONNECT_MAX_DELAY
+        self.rescan_after = RECONNECT_RESCAN_AFTER
+        self._dropped = None         # set by bleak when the current link drops
+        self.down_at = None          # clock() when the link last dropped
+        self._resume_gap = False     # next samples are the first since a reconnect
+        self.disconnects = 0
+        self.outages = []            # seconds each drop lasted until reconnected
+        self.gap_samples = 0         # samples marked lost across reconnects
 
     def calc_packet_rate(self):
         if len(self.timestamps) < 2:
@@ -35,30 +143,248 @@ class BLEConnection:
         return (len(self.timestamps) - 1) / elapsed if elapsed > 0 else 0.0
 
     def handle_notify(self, sender, data):
-        self.timestamps.append(time.monotonic())
-        rate = self.calc_packet_rate()
-
-        if self.packet_queue is not None:
-            self.packet_queue.put_nowait((data, rate, time.time()))
-        else:
-            print(f"rate={rate:.1f} Hz  data={data}")
-
-    async def connect_and_read(self, address):
-        async with BleakClient(address) as client:
-            await asyncio.sleep(0.15)
-            await client.start_notify(CHAR_UUID_RX, self.handle_notify)
-            print("Listening for notifications... (Ctrl+C to stop)")
-            while True:
-                await asyncio.sleep(1)
+        self.put_packet(data, time.monotonic(), time.time(), clock())
+
+    def put_packet(self, data, t_mono, ts, t_notify):
+        # also called by replay.py with recorded timestamps
+        self.packets += 1
+        self.timestamps.append(t_mono)
+        if self.capture is not None:
+            self.capture.write(data, ts)
+        if self.ring is None:
+            print(f"rate={self.calc_packet_rate():.1f} Hz  data={data}")
+            return
+
+        info = parse_info(data)
+        if info is not None:
+            self.device_info = info
+            self.info_ready.set()
+            if self.sync is not None and info.fifo:
+                # frame ticks and pongs count samples from here on
+                self.sync = ClockSync(SAMPLE_PERIOD, nominal=1 / info.rate)
+            mode = ", on-device feedback" if info.feedback else ", edge mode" if info.edge else ""
+            print(f"IMU reports {info.rate:.2f} Hz effective (ODR {info.odr} Hz{', FIFO' if info.fifo else ''}{mode})")
+            return
+        info = self.device_info
+        edge = self.edge if info is not None and (info.edge or info.feedback) else None
+        if edge is not None:
+            step = parse_step(data)
+            if step is not None:
+                edge.put_step(step, ts, t_notify)
+                return
+            event = parse_event(data) if info.feedback else None
+            if event is not None:
+                if self.sync is not None and self.sync.ready:
+                    ts = self.sync.to_wall(event.sample)
+                edge.put_event(event, ts, t_notify)
+                self._got_samples(t_notify)
+                return
+        pong = parse_pong(data)
+        if pong is not None:
+            if self.sync is not None:
+                self.sync.pong(pong.seq, pong.tick, t_notify)
+            return
+        header, block = parse_packet(data)
+        if block is None or not len(block):
+            print(f"could not parse payload ({len(data)} bytes)")
+            return
+        if self.sync is not None and header is not None and header.version >= 2:
+            # once the clocks are mapped, each row gets its sample's own time
+            self.sync.observe(header.tick + header.count - 1, t_notify)
+            if self.sync.ready:
+                ts = self.sync.sample_times(header.tick, header.count)
+        if edge is not None and header is not None and header.version >= 2:
+            # only step tails are sent, so counter jumps between them are not loss;
+            # EdgeAssembler counts the rows a step is missing
+            if self.sequence.update(header.seq, header.count) is not None:
+                edge.put_frame(header.tick, block, ts)
+                self._got_samples(t_notify)
+            return
+        # lost: samples estimated missing before this packet (always 0 for legacy payloads)
+        lost = 0
+        if header is not None:
+            sample = header.tick if header.version >= 2 else None
+            lost = self.sequence.update(header.seq, header.count, sample)
+            if lost is None:
+                return  # duplicate or late frame
+        if self._resume_gap:
+            # first samples since a reconnect: the outage is a gap in the
+            # stream even where the counters do not show one (legacy payloads,
+            # firmware that holds its counter while unlinked)
+            self._resume_gap = False
+            if not lost:
+                lost = self._outage_samples(t_notify, len(block))
+            self.gap_samples += lost
+        self.ring.put(block, ts, t_notify, lost)
+        self._got_samples(t_notify)
+
+    def _outage_samples(self, t_notify, count):
+        # samples the board took while the link was down, from its rate
+        rate = self.device_info.rate if self.device_info is not None else count * self.calc_packet_rate()
+        return max(1, round((t_notify - self.down_at) * rate))
 
-    async def connect_and_write(self, address, cmd_queue: asyncio.Queue):
-        async with BleakClient(address) as client:
-            await asyncio.sleep(0.15)
-            print(f"Connected to LRA MCU ({address}), ready to send commands.")
+    def _got_samples(self, t_notify):
+        if self.first_sample_at is None:
+            self.first_sample_at = t_notify
+            self.first_sample.set()
+
+    async def connect(self, address, rescan=None):
+        # a connected BleakClient; if address cannot be reached and rescan is
+        # given (an async callable returning an address or None), once more
+        # at the address it finds
+        try:
+            client = await self._connect(address)
+        except (BleakError, asyncio.TimeoutError):
+            found = await rescan() if rescan is not None else None
+            if found is None:
+                raise
+            print(f"{address} did not answer, connecting to {found}")
+            client = await self._connect(found)
+        if self.connected_at is None:
+            self.connected_at = clock()
+        return client
+
+    async def _connect(self, address):
+        dropped = asyncio.Event()
+        client = BleakClient(address, disconnected_callback=lambda _: dropped.set(), timeout=self.connect_timeout)
+        await client.connect()
+        self.address = address
+        self._dropped = dropped
+        return client
+
+    async def supervise(self, address, session, rescan=None):
+        # Keeps the board connected for the whole session. session(client)
+        # runs while the link is up; when the link drops the board is
+        # reconnected straight away, then after reconnect_delay doubling up
+        # to reconnect_max between failed attempts, and session runs again.
+        # A dropped board usually comes back where it was, so reconnects try
+        # its last address alone; after rescan_after failures in a row each
+        # attempt also scans for it (rescan), which updates the device cache
+        # if it turns up somewhere new.
+        # Everything else (ring, gait phase and FPA, base FPA, log, command
+        # scheduler) is left as it is, so the stream carries on.
+        delay = 0.0
+        failures = 0
+        while True:
+            scan = rescan if self.down_at is None or failures >= self.rescan_after else None
+            try:
+                client = await self.connect(address, scan)
+            except LINK_ERRORS as e:
+                failures += 1
+                print(f"Could not connect to {address} ({e.__class__.__name__}), retrying in {delay:.2f} s")
+                await asyncio.sleep(delay)
+                delay = min(max(2 * delay, self.reconnect_delay), self.reconnect_max)
+                continue
+            address, delay, failures = self.address, 0.0, 0
+            if self.down_at is not None:
+                self.outages.append(clock() - self.down_at)
+                print(f"Reconnected to {address} after {self.outages[-1]:.2f} s")
+            try:
+                await self._while_connected(client, session)
+            finally:
+                try:
+                    await client.disconnect()
+                except LINK_ERRORS:
+                    pass
+            self.down_at = clock()
+            self.disconnects += 1
+            self._resume_gap = True
+            print(f"Lost connection to {address}, reconnecting")
+
+    async def _while_connected(self, client, session):
+        # session(client) until it fails on the link or bleak reports the drop
+        running = asyncio.ensure_future(session(client))
+        dropped = asyncio.ensure_future(self._dropped.wait())
+        try:
+            await asyncio.wait({running, dropped}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            running.cancel()
+            dropped.cancel()
+        error = running.exception() if running.done() and not running.cancelled() else None
+        if error is not None and not isinstance(error, LINK_ERRORS):
+            raise error
+
+    def link_stats(self):
+        return {
+            "disconnects": self.disconnects,
+            "reconnects": len(self.outages),
+            "downtime_s": round(sum(self.outages), 3),
+            "max_outage_s": round(max(self.outages), 3) if self.outages else None,
+            "gap_samples": self.gap_samples,
+        }
+
+    async def connect_and_read(self, address, rescan=None):
+        await self.supervise(address, self._read, rescan)
+
+    async def _read(self, client):
+        await asyncio.sleep(0.15)
+        await client.start_notify(CHAR_UUID_RX, self.handle_notify)
+        print("Listening for notifications... (Ctrl+C to stop)")
+        self.client = client
+        try:
+            await self.ping_loop(client)
+        finally:
+            self.client = None
+
+    async def write(self, data):
+        # to the board connect_and_read is connected to; False if it is not
+        if self.client is None:
+            return False
+        await self.client.write_gatt_char(CHAR_UUID_TX, data, response=False)
+        return True
+
+    async def ping_loop(self, client):
+        # clock sync probes; without sync it only keeps the connection open
+        while True:
+            await asyncio.sleep(self.sync_interval or 1)
+            if self.sync is not None:
+                await client.write_gatt_char(CHAR_UUID_TX, self.sync.ping(), response=False)
+
+    async def wait_device_info(self, timeout):
+        # the IMU's DeviceInfo, or None if it has not sent one within timeout
+        # seconds (older firmware never does)
+        try:
+            await asyncio.wait_for(self.info_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.device_info
+
+    async def connect_and_write(self, address, scheduler, rescan=None):
+        # scheduler: lra_scheduler.CommandScheduler; only fresh commands come out of next()
+        self.scheduler = scheduler
+        scheduler.sync = self.sync
+        await self.supervise(address, self._write, rescan)
+
+    async def _write(self, client):
+        scheduler = self.scheduler
+        await asyncio.sleep(0.15)
+        if scheduler.ack or self.sync is not None:
+            await client.start_notify(CHAR_UUID_RX, self.handle_lra_notify)
+        print(f"Connected to LRA MCU ({self.address}), ready to send commands.")
+        pinger = asyncio.create_task(self.ping_loop(client))
+        try:
             while True:
-                cmd = await cmd_queue.get()
-                await client.write_gatt_char(CHAR_UUID_TX, cmd.encode(), response=False)
-                print(f"[LRA Feedback] Sent cmd='{cmd}' to {address}")
+                command = await scheduler.next()
+                try:
+                    await client.write_gatt_char(CHAR_UUID_TX, scheduler.encode(command), response=False)
+                except (*LINK_ERRORS, asyncio.CancelledError):
+                    # the link went with it: the command waits for the board, still aging
+                    scheduler.retry(command)
+                    raise
+                scheduler.sent(command)
+                if command.trace is not None and self.latency is not None:
+                    command.trace.mark("write")
+                    self.latency.record(command.trace)
+                print(f"[LRA Feedback] Sent cmd='{command.cmd}' (step {command.step}) to {self.address}")
+        finally:
+            pinger.cancel()
+
+    def handle_lra_notify(self, sender, data):
+        # acks and pongs from the shank board, both newline-terminated text
+        if self.scheduler.ack:
+            self.scheduler.feed_acks(data)
+        if self.sync is not None:
+            self.sync.feed_text(data)
 
 
 
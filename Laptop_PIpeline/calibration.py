@@ -0,0 +1,68 @@
+# Running statistics of the calibration walk, and when it may stop early.
+#
+# Each calibration step's FPA updates a running mean and variance (Welford's
+# method), so nothing is kept per step. The baseline is the mean. Calibration
+# ends as soon as both
+#   - at least min_steps steps are in, and
+#   - the 95% confidence interval of the mean, 2 * 1.96 * sd / sqrt(n), is no
+#     wider than ci_width degrees,
+# or once max_duration seconds have passed, whichever comes first. With
+# ci_width None it always runs for max_duration, as before.
+#
+#   calibration = Calibration(ci_width=2.0, min_steps=20, max_duration=60)
+#   calibration.add(step_fpa)
+#   if calibration.done(elapsed): base = calibration.mean
+
+import math
+
+Z_95 = 1.96
+
+
+class Calibration:
+    def __init__(self, ci_width=None, min_steps=20, max_duration=60):
+        self.ci_width_target = ci_width
+        self.min_steps = max(min_steps, 2)
+        self.max_duration = max_duration
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared deviations from the running mean
+        self.stopped_early = False
+
+    def add(self, fpa):
+        fpa = float(fpa)
+        self.n += 1
+        delta = fpa - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (fpa - self.mean)
+
+    @property
+    def sd(self):
+        return math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else None
+
+    @property
+    def ci_width(self):
+        # full width of the 95% confidence interval of the mean, degrees
+        return 2 * Z_95 * self.sd / math.sqrt(self.n) if self.n > 1 else None
+
+    def done(self, elapsed):
+        if elapsed >= self.max_duration:
+            return True
+        if self.ci_width_target is None or self.n < self.min_steps:
+            return False
+        if self.ci_width <= self.ci_width_target:
+            self.stopped_early = True
+            return True
+        return False
+
+    def result(self, elapsed):
+        # what the profile store keeps for the wearer; None without any steps
+        if not self.n:
+            return None
+        return {
+            "base_fpa": round(self.mean, 4),
+            "steps": self.n,
+            "sd": round(self.sd, 4) if self.sd is not None else None,
+            "ci_width": round(self.ci_width, 4) if self.ci_width is not None else None,
+            "duration_s": round(elapsed, 2),
+            "stopped_early": self.stopped_early,
+        }
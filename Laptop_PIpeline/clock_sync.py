@@ -0,0 +1,175 @@
+# Round-trip probes and a device-to-host clock mapping for one BLE board.
+#
+# Every sync interval BLEConnection writes ping() ("p<seq>\n") to a board, which
+# answers with its own clock at the moment the ping arrived: the foot board as a
+# binary pong payload (imu_packet.PONG, in frame tick units), the shank board as
+# a "pong <seq> <ticks_ms>\n" line. Each answer gives a round trip time and a
+# point (device tick, host time halfway through the round trip). ClockSync fits
+# host = offset + scale * tick over the points with the shorter round trips in a
+# sliding window, so time spent waiting for a connection event mostly drops
+# out, and from then on maps device ticks (frame ticks, ack ticks) to host time:
+# perf_counter seconds with to_host(), time.time() with to_wall().
+#
+# observe() takes the device tick of the newest sample in a notification and
+# the notification's arrival time. The difference is what the board and the
+# radio added before the laptop saw the sample (uplink), as opposed to the
+# laptop's own stages in latency.py.
+#
+#   sync = ClockSync(SAMPLE_PERIOD, nominal=1 / 104)
+#   await client.write_gatt_char(CHAR_UUID_TX, sync.ping())
+#   sync.pong(seq, tick)          # when the answer arrives
+#   sync.to_wall(frame.tick)      # None until min_points answers are in
+
+import time
+from collections import deque
+
+import numpy as np
+
+from latency import clock as perf_clock
+
+TICKS_MS_PERIOD = 1 << 29  # CircuitPython supervisor.ticks_ms() wraps here
+SAMPLE_PERIOD = 1 << 32    # u32 sensor sample counter of version 2 frames
+MAX_OUTSTANDING = 16       # pings remembered while waiting for their pong
+
+
+class ClockSync:
+    def __init__(self, period=TICKS_MS_PERIOD, nominal=1e-3, window=32, min_points=4, clock=perf_clock):
+        self.period = period    # device ticks wrap here
+        self.nominal = nominal  # host seconds per device tick if both clocks were exact
+        self.min_points = min_points
+        self.clock = clock
+        self.wall_offset = time.time() - clock()
+        self._points = deque(maxlen=window)  # (unwrapped tick, host time, rtt)
+        self._outstanding = {}  # seq -> clock() when the ping was written, oldest first
+        self._next_seq = 0
+        self._last_raw = None   # newest pong tick as sent, and unwrapped
+        self._last_tick = 0
+        self._text_buf = b""
+        self._rtts = deque(maxlen=1000)
+        self._uplink = deque(maxlen=2000)
+        self._fit = None        # (tick0, host0, scale): host = host0 + scale * (tick - tick0)
+        self.residual = None    # rms of the fitted points around the line, seconds
+        self.pings = 0
+        self.pongs = 0
+        self.unanswered = 0     # fell out of MAX_OUTSTANDING without a pong
+
+    @property
+    def ready(self):
+        return self._fit is not None
+
+    @property
+    def scale(self):
+        return self._fit[2] if self._fit is not None else None
+
+    def ping(self):
+        # bytes to write to the board
+        seq = self._next_seq
+        self._next_seq = (seq + 1) & 0xFFFF
+        self._outstanding[seq] = self.clock()
+        if len(self._outstanding) > MAX_OUTSTANDING:
+            del self._outstanding[next(iter(self._outstanding))]
+            self.unanswered += 1
+        self.pings += 1
+        return f"p{seq}\n".encode()
+
+    def pong(self, seq, tick, t=None):
+        # the board's answer; returns the round trip in seconds, None if the
+        # ping is unknown (not ours, or already given up on)
+        t = self.clock() if t is None else t
+        sent = self._outstanding.pop(seq, None)
+        if sent is None:
+            return None
+        rtt = t - sent
+        self.pongs += 1
+        unwrapped = self._unwrap(tick)
+        self._last_raw, self._last_tick = tick, unwrapped
+        self._points.append((unwrapped, sent + rtt / 2, rtt))
+        self._rtts.append(rtt)
+        self._refit()
+        return rtt
+
+    def feed_text(self, data):
+        # notification bytes from a board that answers with "pong <seq> <tick>"
+        # lines; other lines (acks) are ignored
+        lines = (self._text_buf + bytes(data)).split(b"\n")
+        self._text_buf = lines.pop()
+        for line in lines:
+            fields = line.split()
+            if len(fields) == 3 and fields[0] == b"pong":
+                try:
+                    self.pong(int(fields[1]), int(fields[2]))
+                except ValueError:
+                    pass
+
+    def to_host(self, tick):
+        # perf_counter time of a device tick, None before the first fit
+        if self._fit is None:
+            return None
+        tick0, host0, scale = self._fit
+        return host0 + scale * (self._unwrap(tick) - tick0)
+
+    def to_wall(self, tick):
+        host = self.to_host(tick)
+        return None if host is None else host + self.wall_offset
+
+    def sample_times(self, tick, count):
+        # time.time() of `count` consecutive samples from sample counter `tick`,
+        # None before the first fit
+        if self._fit is None:
+            return None
+        return self.to_wall(tick) + np.arange(count) * self._fit[2]
+
+    def observe(self, tick, t_notify):
+        # tick of the newest sample in a notification that arrived at t_notify
+        if self._fit is not None:
+            self._uplink.append(t_notify - self.to_host(tick))
+
+    def stats(self):
+        rtt = _percentiles(self._rtts)
+        uplink = _percentiles(self._uplink)
+        return {
+            "pings": self.pings,
+            "pongs": self.pongs,
+            "unanswered": self.unanswered,
+            "rtt_p50_ms": rtt[0],
+            "rtt_p95_ms": rtt[1],
+            "rtt_max_ms": rtt[2],
+            "drift_ppm": round(1e6 * (self._fit[2] / self.nominal - 1), 1) if self._fit is not None else None,
+            "fit_residual_ms": round(1e3 * self.residual, 3) if self.residual is not None else None,
+            "uplink_p50_ms": uplink[0],
+            "uplink_p95_ms": uplink[1],
+            "uplink_max_ms": uplink[2],
+        }
+
+    def _unwrap(self, tick):
+        # tick on the unwrapped axis, taken as the one nearest the newest pong
+        if self._last_raw is None:
+            return tick
+        delta = (tick - self._last_raw) % self.period
+        if delta >= self.period // 2:
+            delta -= self.period
+        return self._last_tick + delta
+
+    def _refit(self):
+        if len(self._points) < self.min_points:
+            return
+        points = np.array(self._points)
+        # the shorter half of the round trips spent least time queued for a
+        # connection event, so their midpoints are closest to the true time
+        best = points[points[:, 2] <= np.median(points[:, 2])]
+        x, y = best[:, 0], best[:, 1]
+        if len(best) < 2 or np.ptp(x) == 0:
+            return
+        dx, dy = x - x.mean(), y - y.mean()
+        scale = float(dx @ dy / (dx @ dx))
+        self._fit = (float(x.mean()), float(y.mean()), scale)
+        self.residual = float(np.sqrt(np.mean((dy - scale * dx) ** 2)))
+
+
+def _percentiles(values):
+    # (p50, p95, max) in ms, Nones when empty
+    if not values:
+        return None, None, None
+    ms = np.asarray(values) * 1e3
+    p50, p95 = np.percentile(ms, [50, 95])
+    return round(float(p50), 3), round(float(p95), 3), round(float(ms.max()), 3)
@@ -0,0 +1,40 @@
+# Last known BLE address of each board, so a session can connect straight
+# away instead of scanning first (bluetooth.Discovery).
+#
+# The file maps the name a wearer lists for a board (config default or
+# devices.json "imu"/"lra") to the address it was last found at:
+#   {"CIRCUITPY4f33": "D4:2F:...", "CIRCUITPY174d": "F1:08:..."}
+# It is rewritten whenever a scan finds a board somewhere new. A missing or
+# unreadable file is an empty cache.
+
+import json
+import os
+
+
+class DeviceCache:
+    def __init__(self, path):
+        self.path = path
+        self._addresses = {}
+        try:
+            with open(path) as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                self._addresses = {str(k): str(v) for k, v in loaded.items()}
+        except (OSError, ValueError):
+            pass
+
+    def get(self, name):
+        return self._addresses.get(name)
+
+    def put(self, name, address):
+        if self._addresses.get(name) == address:
+            return
+        self._addresses[name] = address
+        self.save()
+
+    def save(self):
+        # write-then-rename, so an interrupted save leaves the old cache intact
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._addresses, f, indent=2)
+        os.replace(tmp, self.path)
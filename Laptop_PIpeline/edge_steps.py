@@ -0,0 +1,135 @@
+# Reassembles edge-mode steps sent by the foot board
+# (Wearable/foot_mounted_wearable.py with EDGE_MODE = True).
+#
+# In edge mode the board runs the gait phase state machine itself and, rather
+# than every sample, sends for each step only the rows the FPA depends on: the
+# tail of the window between two mid-stance entries, from
+# FPA.step_tail_start(length) on. The tail goes out as ordinary version 2
+# frames as soon as mid-stance begins; the step header (imu_packet.StepHeader)
+# follows when the feedback window opens, so the laptop has the whole step at
+# the moment it would have fired feedback when streaming. While no steps are
+# taken only a keepalive header arrives, about once a second.
+#
+# With on-device feedback (EDGE_FEEDBACK in the firmware) the board computes
+# the FPA and cues the shank board itself, and sends one step event per step
+# instead (imu_packet.StepEvent). They queue here as FeedbackSteps, with the
+# same keepalives in between.
+#
+# BLEConnection hands frames, headers and events to an EdgeAssembler, and
+# run_device.edge_consumer / event_consumer await whole steps from it.
+
+import asyncio
+from collections import deque, namedtuple
+
+import numpy as np
+
+# samples: (count, 6) float32 [ax, ay, az, gx, gy, gz]; ts: host time of the
+# notification each row came in; missing: rows that never arrived (left zero)
+EdgeStep = namedtuple("EdgeStep", ["step", "length", "samples", "ts", "t_notify", "missing"])
+# an on-device feedback step: fpa as computed on the board, drv the motor it
+# cued (0: none), link whether it could reach the shank board, cue_ms how long
+# the cue took to write there
+FeedbackStep = namedtuple("FeedbackStep", ["step", "fpa", "drv", "link", "cue_ms", "ts", "t_notify"])
+
+COUNTER_MASK = 0xFFFFFFFF
+
+
+class EdgeAssembler:
+    def __init__(self, max_frames=256, max_steps=64):
+        self._frames = deque(maxlen=max_frames)  # (first sensor counter, (N, 6) block, ts or (N,) times)
+        self._steps = deque()
+        self.max_steps = max_steps
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.steps = 0
+        self.keepalives = 0
+        self.last_keepalive = None  # host time of the latest keepalive
+        self.incomplete_steps = 0   # steps with rows that never arrived
+        self.missing_samples = 0
+        self.dropped_steps = 0      # consumer too far behind; oldest step dropped
+        self.tail_samples = 0
+        self.cues = 0               # on-device feedback: cues the board wrote to the shank board
+        self.unlinked_steps = 0     # steps the board could not reach the shank board for
+        self._cue_ms_total = 0
+        self.max_cue_ms = 0
+
+    def __len__(self):
+        return len(self._steps)
+
+    def put_frame(self, first, block, ts):
+        # the frame's views point into the notification, so keep a copy
+        self._frames.append((first, block.copy(), ts))
+
+    def put_step(self, header, ts, t_notify):
+        if header.count == 0:
+            self.keepalives += 1
+            self.last_keepalive = ts
+            return
+        samples = np.zeros((header.count, 6), dtype=np.float32)
+        times = np.full(header.count, ts)
+        filled = np.zeros(header.count, dtype=bool)
+        keep = deque(maxlen=self._frames.maxlen)
+        for first, block, frame_ts in self._frames:
+            start = (first - header.first) & COUNTER_MASK
+            if start >= 0x80000000:
+                start -= COUNTER_MASK + 1  # frame starts before the tail
+            a, b = max(start, 0), min(start + len(block), header.count)
+            if a < b:
+                samples[a:b] = block[a - start:b - start]
+                times[a:b] = frame_ts if np.ndim(frame_ts) == 0 else frame_ts[a - start:b - start]
+                filled[a:b] = True
+            if start + len(block) > header.count:
+                keep.append((first, block, frame_ts))  # runs past this step's tail
+        self._frames = keep
+        missing = int(header.count - filled.sum())
+        if missing:
+            self.incomplete_steps += 1
+            self.missing_samples += missing
+        self.steps += 1
+        self.tail_samples += header.count
+        self._push(EdgeStep(header.step, header.length, samples, times, t_notify, missing))
+
+    def put_event(self, event, ts, t_notify):
+        # imu_packet.StepEvent from a board running on-device feedback
+        self.steps += 1
+        if not event.link:
+            self.unlinked_steps += 1
+        elif event.drv:
+            self.cues += 1
+            self._cue_ms_total += event.cue_ms
+            self.max_cue_ms = max(self.max_cue_ms, event.cue_ms)
+        self._push(FeedbackStep(event.step, event.fpa, event.drv, event.link, event.cue_ms, ts, t_notify))
+
+    def _push(self, step):
+        if len(self._steps) == self.max_steps:
+            self._steps.popleft()
+            self.dropped_steps += 1
+        self._steps.append(step)
+        self._ready.set()
+
+    async def get(self):
+        # the next whole step, waiting for one if needed; None once closed and empty
+        while not self._steps:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._steps.popleft()
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    def stats(self):
+        return {
+            "steps": self.steps,
+            "keepalives": self.keepalives,
+            "tail_samples": self.tail_samples,
+            "incomplete_steps": self.incomplete_steps,
+            "missing_samples": self.missing_samples,
+            "dropped_steps": self.dropped_steps,
+            "cues": self.cues,
+            "unlinked_steps": self.unlinked_steps,
+            "mean_cue_ms": round(self._cue_ms_total / self.cues, 2) if self.cues else None,
+            "max_cue_ms": self.max_cue_ms,
+        }
@@ -0,0 +1,160 @@
+# Binary columnar session log (.fpab), an alternative to the fpa_log CSV.
+#
+#   file header  <4sHHI   magic b"FPAB", version, reserved, metadata length
+#                JSON     metadata: algorithm, config, base_fpa, csv_header, ...
+#   chunks       <4sIIQ   tag, row count, payload bytes, first row
+#                payload
+#
+#   SAMP  count samples, columnar: time <f8[count], then ax, ay, az, gx, gy, gz
+#         as <f4[count] each (m/s², rad/s), rows first_row .. first_row+count-1
+#   STEP  count records of STEP_DTYPE (row, time, step, fpa, drv, effect)
+#   META  JSON object merged over the header metadata (e.g. base_fpa after calibration)
+#
+# Chunks are only ever appended and each is flushed whole, so a file can be
+# read while it is still being recorded; a truncated last chunk is ignored.
+# FpabReader memory-maps the file and only reads chunk headers up front, so
+# step events come out without touching the sample blocks.
+#
+#   uv run python fpab.py export output/fpa_log_<timestamp>.fpab   # → .csv
+
+import argparse
+import csv
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"FPAB"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHHI")
+CHUNK_HEADER = struct.Struct("<4sIIQ")
+SAMPLES, STEPS, META = b"SAMP", b"STEP", b"META"
+STEP_DTYPE = np.dtype([
+    ("row", "<u8"),
+    ("time", "<f8"),
+    ("step", "<u4"),
+    ("fpa", "<f8"),
+    ("drv", "S4"),
+    ("effect", "S8"),
+])
+
+
+class FpabWriter:
+    def __init__(self, path, meta):
+        self.path = path
+        self.rows = 0
+        self._f = open(path, "wb")
+        body = json.dumps(meta).encode()
+        self._f.write(FILE_HEADER.pack(MAGIC, VERSION, 0, len(body)) + body)
+        self._f.flush()
+
+    def append(self, times, block, steps=None):
+        # times: (N,) host timestamps; block: (N, 6) samples; steps: STEP_DTYPE
+        # records with absolute row numbers
+        n = len(block)
+        if n:
+            columns = np.asarray(block, dtype="<f4").T
+            payload = np.asarray(times, dtype="<f8").tobytes() + np.ascontiguousarray(columns).tobytes()
+            self._chunk(SAMPLES, n, payload, self.rows)
+            self.rows += n
+        if steps is not None and len(steps):
+            self._chunk(STEPS, len(steps), np.asarray(steps, dtype=STEP_DTYPE).tobytes(), 0)
+        self._f.flush()
+
+    def update_meta(self, fields):
+        self._chunk(META, 0, json.dumps(fields).encode(), 0)
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def _chunk(self, tag, count, payload, first_row):
+        self._f.write(CHUNK_HEADER.pack(tag, count, len(payload), first_row))
+        self._f.write(payload)
+
+
+class FpabReader:
+    def __init__(self, path):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, _, meta_len = FILE_HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an .fpab session log")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported .fpab version {version}")
+        pos = FILE_HEADER.size
+        self.meta = json.loads(bytes(self._mm[pos:pos + meta_len]))
+        pos += meta_len
+        self.chunks = []  # (tag, count, payload offset, payload bytes, first row)
+        while pos + CHUNK_HEADER.size <= len(self._mm):
+            tag, count, nbytes, first_row = CHUNK_HEADER.unpack_from(self._mm, pos)
+            pos += CHUNK_HEADER.size
+            if pos + nbytes > len(self._mm):
+                break  # still being written
+            if tag == META:
+                self.meta.update(json.loads(bytes(self._mm[pos:pos + nbytes])))
+            self.chunks.append((tag, count, pos, nbytes, first_row))
+            pos += nbytes
+
+    def steps(self):
+        parts = [np.frombuffer(self._mm, dtype=STEP_DTYPE, count=count, offset=offset)
+                 for tag, count, offset, _, _ in self.chunks if tag == STEPS]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=STEP_DTYPE)
+
+    def sample_chunks(self):
+        # (first_row, times, (6, N) columns) per chunk, as views into the file
+        for tag, count, offset, _, first_row in self.chunks:
+            if tag != SAMPLES:
+                continue
+            times = np.frombuffer(self._mm, dtype="<f8", count=count, offset=offset)
+            columns = np.frombuffer(self._mm, dtype="<f4", count=6 * count, offset=offset + 8 * count)
+            yield first_row, times, columns.reshape(6, count)
+
+    def samples(self):
+        # (times, (N, 6) block) for the whole session
+        chunks = list(self.sample_chunks())
+        if not chunks:
+            return np.empty(0), np.empty((0, 6), dtype=np.float32)
+        times = np.concatenate([t for _, t, _ in chunks])
+        block = np.concatenate([c for _, _, c in chunks], axis=1).T
+        return times, block
+
+
+def export_csv(src, dst):
+    # Writes the same rows fpa_consumer writes to an fpa_log CSV
+    reader = FpabReader(src)
+    marks = {
+        int(s["row"]): [int(s["step"]), f"{s['fpa']:.1f}", s["drv"].decode(), s["effect"].decode()]
+        for s in reader.steps()
+    }
+    blank = ["", "", "", ""]
+    rows = 0
+    with open(dst, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(reader.meta["csv_header"])
+        for first_row, times, columns in reader.sample_chunks():
+            for i, (t, ax, ay, az, gx, gy, gz) in enumerate(zip(times.tolist(), *columns.tolist())):
+                writer.writerow([t, *marks.get(first_row + i, blank), f"{ax:.4f}", f"{ay:.4f}", f"{az:.4f}", f"{gx:.4f}", f"{gy:.4f}", f"{gz:.4f}"])
+            rows += len(times)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="convert to the fpa_log CSV layout")
+    export.add_argument("src")
+    export.add_argument("dst", nargs="?", help="default: src with a .csv extension")
+    info = sub.add_parser("info", help="print metadata and step/sample counts")
+    info.add_argument("src")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        dst = args.dst or args.src.rsplit(".", 1)[0] + ".csv"
+        rows = export_csv(args.src, dst)
+        print(f"{rows} rows written to {dst}")
+    else:
+        reader = FpabReader(args.src)
+        rows = sum(count for tag, count, _, _, _ in reader.chunks if tag == SAMPLES)
+        print(json.dumps(reader.meta, indent=2))
+        print(f"{rows} samples, {len(reader.steps())} steps, {len(reader.chunks)} chunks")
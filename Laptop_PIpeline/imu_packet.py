@@ -0,0 +1,327 @@
+# IMU notification formats sent by Wearable/foot_mounted_wearable.py.
+#
+# legacy: one sample per notification, 24 bytes
+#   <6f  ax, ay, az (m/s²), gx, gy, gz (rad/s)
+#
+# framed: 8-byte header followed by `count` legacy samples
+#   <B  version
+#   <B  count   samples in this frame
+#   <H  seq     frame counter, +1 per frame, wraps at 65536
+#   <I  tick    version 1: device ticks_ms at the first sample
+#               version 2: sensor sample counter at the first sample (samples
+#               read from the IMU's FIFO at its own output data rate)
+#
+# device info (INFO_MAGIC): 12 bytes, sent once when the central connects
+#   <4s magic b"IMUI"
+#   <B  version
+#   <B  flags   INFO_FIFO: samples come from the IMU FIFO (frame version 2)
+#               INFO_EDGE: edge mode, only step tails are sent (below)
+#               INFO_FEEDBACK: on-device feedback, only step events are sent
+#   <H  odr     output data rate configured on the IMU, Hz
+#   <f  rate    effective sample rate measured against the MCU clock, Hz
+#
+# step (STEP_MAGIC, edge mode only): 16 bytes, sent when a step's feedback
+# window opens, after the version 2 frames carrying its samples
+#   <4s magic b"IMUS"
+#   <B  version
+#   <B  reserved
+#   <H  step    step count on the board
+#   <H  length  samples in the step's whole FPA window
+#   <H  count   samples sent: the last `count` of the window (see edge_steps.py)
+#   <I  first   sensor sample counter of the first sample sent
+# A step with count 0 is a keepalive, sent while no steps are being taken.
+#
+# step event (EVENT_MAGIC, on-device feedback only): 20 bytes per step, sent
+# when the board has computed the FPA and cued the shank board itself
+#   <4s magic b"IMUF"
+#   <B  version
+#   <B  drv     motor cued, 0 for none
+#   <H  step    step count on the board
+#   <I  sample  sensor sample counter when the feedback window opened
+#   <f  fpa     the step's FPA, deg
+#   <H  cue_ms  board time from the feedback window opening to the cue written
+#   <B  link    1 if the board was connected to the shank board
+#   <B  reserved
+#
+# pong (PONG_MAGIC): 12 bytes, the answer to a "p<seq>\n" ping (clock_sync.py)
+#   <4s magic b"IMUP"
+#   <B  version
+#   <B  reserved
+#   <H  seq     the ping's sequence number
+#   <I  tick    the board's clock when the ping arrived, in frame tick units
+#               (sample counter with the FIFO firmware, counting samples the
+#               IMU has taken but the MCU has not read yet)
+#
+# A framed payload is always 8 bytes longer than a multiple of 24, the info and
+# pong payloads 12 (told apart by magic), the step payload 16 and the step event
+# 20, so the formats never collide on length.
+# Keep this in sync with the firmware and
+# Smartphone_App_Pipeline/lkr-data/lib/wearable/imuPayload.ts.
+#
+# SequenceTracker (in BLEConnection) turns frame seq numbers into loss,
+# duplicate and reorder counts; GapPolicy (in fpa_consumer) decides what to do
+# about the missing samples.
+
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+SAMPLE = struct.Struct("<6f")
+FRAME_HEADER = struct.Struct("<BBHI")
+FRAME_VERSION = 2
+FRAME_VERSIONS = (1, 2)
+INFO = struct.Struct("<4sBBHf")
+INFO_MAGIC = b"IMUI"
+INFO_VERSION = 1
+INFO_FIFO = 0x01
+INFO_EDGE = 0x02
+INFO_FEEDBACK = 0x04
+STEP = struct.Struct("<4sBBHHHI")
+STEP_MAGIC = b"IMUS"
+STEP_VERSION = 1
+EVENT = struct.Struct("<4sBBHIfHBB")
+EVENT_MAGIC = b"IMUF"
+EVENT_VERSION = 1
+PONG = struct.Struct("<4sBBHI")
+PONG_MAGIC = b"IMUP"
+PONG_VERSION = 1
+ATT_OVERHEAD = 3  # opcode + handle in every notification
+
+FrameHeader = namedtuple("FrameHeader", ["version", "count", "seq", "tick"])
+DeviceInfo = namedtuple("DeviceInfo", ["version", "fifo", "edge", "odr", "rate", "feedback"])
+StepHeader = namedtuple("StepHeader", ["step", "length", "count", "first"])
+StepEvent = namedtuple("StepEvent", ["step", "drv", "sample", "fpa", "cue_ms", "link"])
+Pong = namedtuple("Pong", ["seq", "tick"])
+
+
+def frame_capacity(mtu):
+    # samples that fit in one notification at a negotiated ATT MTU (247 → 9)
+    return max(1, (mtu - ATT_OVERHEAD - FRAME_HEADER.size) // SAMPLE.size)
+
+
+def pack_frame(seq, tick, samples):
+    # samples: (N, 6) array-like [ax, ay, az, gx, gy, gz]
+    block = np.ascontiguousarray(samples, dtype="<f4").reshape(-1, 6)
+    header = FRAME_HEADER.pack(FRAME_VERSION, len(block), seq & 0xFFFF, tick & 0xFFFFFFFF)
+    return header + block.tobytes()
+
+
+def parse_packet(payload):
+    # (header, block): block is an (N, 6) float32 view of the payload, decoded in
+    # one np.frombuffer call. header is None for legacy payloads.
+    # Returns (None, None) for anything malformed.
+    n = len(payload)
+    if n >= SAMPLE.size and n % SAMPLE.size == 0:
+        return None, np.frombuffer(payload, dtype="<f4").reshape(-1, 6)
+    if n % SAMPLE.size != FRAME_HEADER.size:
+        return None, None
+    header = FrameHeader._make(FRAME_HEADER.unpack_from(payload))
+    if header.version not in FRAME_VERSIONS or header.count * SAMPLE.size != n - FRAME_HEADER.size:
+        return None, None
+    block = np.frombuffer(payload, dtype="<f4", count=header.count * 6, offset=FRAME_HEADER.size)
+    return header, block.reshape(-1, 6)
+
+
+def parse_payload(payload: bytes):
+    # the first sample of a payload as (gyr, acc) lists, None if too short
+    if len(payload) < 24:
+        return None
+    ax, ay, az, gx, gy, gz = SAMPLE.unpack_from(payload)
+    return [gx, gy, gz], [ax, ay, az]
+
+
+def parse_block(payload: bytes):
+    # Whole notification as an (N, 6) float64 array [ax, ay, az, gx, gy, gz]:
+    # a legacy 24-byte sample or a framed multi-sample packet
+    _, block = parse_packet(payload)
+    if block is None or not len(block):
+        return None
+    return block.astype(np.float64)
+
+
+def pack_info(odr, rate, fifo=True, edge=False, feedback=False):
+    flags = (INFO_FIFO if fifo else 0) | (INFO_EDGE if edge else 0) | (INFO_FEEDBACK if feedback else 0)
+    return INFO.pack(INFO_MAGIC, INFO_VERSION, flags, odr, rate)
+
+
+def parse_info(payload):
+    # DeviceInfo for a device info payload, None for anything else
+    if len(payload) != INFO.size:
+        return None
+    magic, version, flags, odr, rate = INFO.unpack(payload)
+    if magic != INFO_MAGIC or version != INFO_VERSION:
+        return None
+    return DeviceInfo(version, bool(flags & INFO_FIFO), bool(flags & INFO_EDGE), odr, rate, bool(flags & INFO_FEEDBACK))
+
+
+def pack_step(step, length, count, first):
+    return STEP.pack(STEP_MAGIC, STEP_VERSION, 0, step & 0xFFFF, length, count, first & 0xFFFFFFFF)
+
+
+def parse_step(payload):
+    # StepHeader for an edge-mode step payload, None for anything else
+    if len(payload) != STEP.size:
+        return None
+    magic, version, _, step, length, count, first = STEP.unpack(payload)
+    if magic != STEP_MAGIC or version != STEP_VERSION:
+        return None
+    return StepHeader(step, length, count, first)
+
+
+def pack_event(step, drv, sample, fpa, cue_ms=0, link=True):
+    return EVENT.pack(EVENT_MAGIC, EVENT_VERSION, drv, step & 0xFFFF, sample & 0xFFFFFFFF, fpa, min(cue_ms, 0xFFFF), int(link), 0)
+
+
+def parse_event(payload):
+    # StepEvent for an on-device feedback step event, None for anything else
+    if len(payload) != EVENT.size:
+        return None
+    magic, version, drv, step, sample, fpa, cue_ms, link, _ = EVENT.unpack(payload)
+    if magic != EVENT_MAGIC or version != EVENT_VERSION:
+        return None
+    return StepEvent(step, drv, sample, fpa, cue_ms, bool(link))
+
+
+def pack_pong(seq, tick):
+    return PONG.pack(PONG_MAGIC, PONG_VERSION, 0, seq & 0xFFFF, tick & 0xFFFFFFFF)
+
+
+def parse_pong(payload):
+    # Pong for a ping answer, None for anything else
+    if len(payload) != PONG.size:
+        return None
+    magic, version, _, seq, tick = PONG.unpack(payload)
+    if magic != PONG_MAGIC or version != PONG_VERSION:
+        return None
+    return Pong(seq, tick)
+
+
+class SequenceTracker:
+    # Follows frame seq numbers across notifications.
+    # update() returns the number of samples lost before this frame, or None
+    # for a duplicate or a late (reordered) frame that has already been
+    # superseded and should be dropped. With version 2 frames the sensor
+    # sample counter gives the exact number; otherwise it is estimated as lost
+    # frames × this frame's sample count.
+    # A late frame is still counted in lost_frames, since its samples never reach
+    # the consumer. A jump back by more than reorder_window frames is taken as a
+    # device restart.
+
+    def __init__(self, reorder_window=64):
+        self.reorder_window = reorder_window
+        self.last_seq = None
+        self.next_sample = None  # sensor counter expected in the next version 2 frame
+        self.frames = 0
+        self.lost_frames = 0
+        self.lost_samples = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.restarts = 0
+
+    def update(self, seq, count, sample=None):
+        # sample: the frame's sensor sample counter (version 2 tick), if any
+        if self.last_seq is None:
+            self.last_seq = seq
+            self.next_sample = None if sample is None else sample + count
+            self.frames += 1
+            return 0
+        delta = (seq - self.last_seq) & 0xFFFF
+        if delta == 0:
+            self.duplicates += 1
+            return None
+        if delta >= 0x8000:
+            if 0x10000 - delta <= self.reorder_window:
+                self.reordered += 1
+                return None
+            self.restarts += 1
+            delta = 1
+        self.last_seq = seq
+        self.frames += 1
+        lost = (delta - 1) * count
+        if sample is not None and self.next_sample is not None:
+            # exact, and also covers samples the device dropped itself (FIFO overrun)
+            lost = (sample - self.next_sample) & 0xFFFFFFFF
+            if lost >= 0x80000000:
+                lost = 0  # counter went back: the device restarted sampling
+        self.next_sample = None if sample is None else sample + count
+        self.lost_frames += delta - 1
+        self.lost_samples += lost
+        return lost
+
+    def stats(self):
+        expected = self.frames + self.lost_frames
+        return {
+            "frames": self.frames,
+            "lost_frames": self.lost_frames,
+            "lost_samples_est": self.lost_samples,
+            "loss_pct": round(100 * self.lost_frames / expected, 3) if expected else 0.0,
+            "duplicates": self.duplicates,
+            "reordered": self.reordered,
+            "restarts": self.restarts,
+        }
+
+
+class GapPolicy:
+    # What the consumer does with samples lost before a block, before they reach
+    # GaitPhase/FPA: gaps of up to max_interpolate samples are filled by linear
+    # interpolation between the last good sample and the first new one; longer
+    # gaps (or any gap with max_interpolate = 0) leave the block as is and
+    # invalidate the step whose buffer spans the gap.
+
+    def __init__(self, max_interpolate):
+        self.max_interpolate = max_interpolate
+        self.last_row = None
+        self.interpolated_gaps = 0
+        self.interpolated_samples = 0
+        self.long_gaps = 0
+        self.invalid_steps = []
+
+    def repair(self, block, lost):
+        # (block, invalidate): block with interpolated rows prepended, and
+        # whether the next step must be discarded
+        invalidate = False
+        if lost:
+            if lost <= self.max_interpolate and self.last_row is not None:
+                weights = np.arange(1, lost + 1)[:, None] / (lost + 1)
+                filled = self.last_row + (block[0] - self.last_row) * weights
+                block = np.concatenate([filled, block])
+                self.interpolated_gaps += 1
+                self.interpolated_samples += lost
+            else:
+                self.long_gaps += 1
+                invalidate = True
+        self.last_row = block[-1].copy()
+        return block, invalidate
+
+    def repair_batch(self, block, lost):
+        # repair() over a drained batch whose per-row `lost` marks gaps inside it.
+        # Returns (block, index, long_gaps): index maps each output row to its
+        # input row (interpolated rows map to the sample after the gap; None when
+        # nothing was inserted) and long_gaps lists (output row, samples lost)
+        # for every gap too long to interpolate.
+        cuts = np.flatnonzero(lost)
+        if not len(cuts):
+            self.last_row = block[-1].copy()
+            return block, None, []
+        bounds = [0, *cuts.tolist(), len(block)] if cuts[0] else [*cuts.tolist(), len(block)]
+        parts, index, long_gaps = [], [], []
+        rows = 0
+        for a, b in zip(bounds, bounds[1:]):
+            part, invalidate = self.repair(block[a:b], int(lost[a]))
+            inserted = len(part) - (b - a)
+            if invalidate:
+                long_gaps.append((rows, int(lost[a])))
+            parts.append(part)
+            index.append(np.concatenate([np.full(inserted, a), np.arange(a, b)]))
+            rows += len(part)
+        return np.concatenate(parts), np.concatenate(index), long_gaps
+
+    def stats(self):
+        return {
+            "max_interpolate": self.max_interpolate,
+            "interpolated_gaps": self.interpolated_gaps,
+            "interpolated_samples": self.interpolated_samples,
+            "long_gaps": self.long_gaps,
+            "invalid_steps": self.invalid_steps,
+        }
@@ -0,0 +1,145 @@
+# Bounded ingest ring between BLEConnection.handle_notify and fpa_consumer.
+#
+# Every sample gets a preallocated slot: the (6,) float32 reading, the host
+# timestamp of its notification, the perf_counter notify time for latency
+# traces, and `lost`, the number of samples missing right before it. Writes are
+# mirrored at i + capacity (as in algorithms/ring_buffer.py), so whatever is
+# pending is always one contiguous slice and drain() hands it over without
+# copying. The views stay valid until the consumer next awaits.
+#
+# When the consumer falls behind and the ring fills, the overflow policy decides
+# what goes; either way the dropped samples are counted and reported to the gap
+# policy as `lost` on the next sample that survives.
+
+import asyncio
+from collections import deque, namedtuple
+
+import numpy as np
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # keep the newest samples (freshest feedback)
+OVERFLOW_DROP_NEWEST = "drop_newest"  # keep what is queued, drop arriving packets
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+IngestBatch = namedtuple("IngestBatch", ["samples", "ts", "t_notify", "lost"])
+
+
+class IngestRing:
+    def __init__(self, capacity=4096, overflow=OVERFLOW_DROP_OLDEST, rate_window=50):
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.capacity = capacity
+        self.overflow = overflow
+        self._samples = np.zeros((2 * capacity, 6), dtype=np.float32)
+        self._ts = np.zeros(2 * capacity)
+        self._t_notify = np.zeros(2 * capacity)
+        self._lost = np.zeros(2 * capacity, dtype=np.int64)
+        self._start = 0
+        self._len = 0
+        self._carry_lost = 0  # dropped newest samples, charged to the next put
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._arrivals = deque(maxlen=rate_window)
+        self.packets = 0
+        self.samples_in = 0
+        self.high_water = 0       # most samples ever pending
+        self.overflows = 0        # puts that found the ring full
+        self.dropped_samples = 0  # samples lost to those overflows
+
+    def __len__(self):
+        return self._len
+
+    def put(self, block, ts, t_notify, lost=0):
+        # block: (N, 6) samples of one notification; called on the event loop
+        n = len(block)
+        self.packets += 1
+        self.samples_in += n
+        self._arrivals.append(t_notify)
+        lost += self._carry_lost
+        self._carry_lost = 0
+        excess = self._len + n - self.capacity
+        if excess > 0:
+            self.overflows += 1
+            if self.overflow == OVERFLOW_DROP_NEWEST or n > self.capacity:
+                self.dropped_samples += n
+                self._carry_lost = lost + n
+                return
+            # the evicted rows and the gaps before them become one gap before
+            # the oldest survivor, or before this block if none survives
+            evicted = excess + int(self._lost[self._start:self._start + excess].sum())
+            self._start = (self._start + excess) % self.capacity
+            self._len -= excess
+            self.dropped_samples += excess
+            if self._len:
+                self._write(self._lost, self._start, 1, self._lost[self._start] + evicted)
+            else:
+                lost += evicted
+        pos = (self._start + self._len) % self.capacity
+        self._write(self._samples, pos, n, block)
+        self._write(self._ts, pos, n, ts)
+        self._write(self._t_notify, pos, n, t_notify)
+        self._write(self._lost, pos, n, 0)
+        self._write(self._lost, pos, 1, lost)
+        self._len += n
+        if self._len > self.high_water:
+            self.high_water = self._len
+        self._ready.set()
+
+    def drain(self, max_samples=None):
+        # IngestBatch of views over every pending sample (or the oldest max_samples)
+        n = self._len if max_samples is None else min(self._len, max_samples)
+        s = slice(self._start, self._start + n)
+        batch = IngestBatch(self._samples[s], self._ts[s], self._t_notify[s], self._lost[s])
+        self._start = (self._start + n) % self.capacity
+        self._len -= n
+        if self._len == 0:
+            self._ready.clear()
+        return batch
+
+    async def get(self):
+        # the next batch, waiting for one if needed; None once closed and empty
+        while self._len == 0:
+            if self._closed:
+                return None
+            await self._ready.wait()
+        return self.drain()
+
+    def close(self):
+        # end of session: get() returns None after the last batch
+        self._closed = True
+        self._ready.set()
+
+    def packet_rate(self):
+        if len(self._arrivals) < 2:
+            return 0.0
+        elapsed = self._arrivals[-1] - self._arrivals[0]
+        return (len(self._arrivals) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "overflow": self.overflow,
+            "depth": self._len,
+            "high_water": self.high_water,
+            "packets": self.packets,
+            "samples": self.samples_in,
+            "overflows": self.overflows,
+            "dropped_samples": self.dropped_samples,
+        }
+
+    def _write(self, arr, pos, n, value):
+        # rows pos .. pos+n-1 and their mirrors, as slice assignments
+        cap = self.capacity
+        end = pos + n
+        arr[pos:end] = value
+        if end <= cap:
+            arr[pos + cap:end + cap] = value
+        else:
+            split = cap - pos
+            if np.ndim(value):
+                arr[pos + cap:] = value[:split]
+                arr[:end - cap] = value[split:]
+            else:
+                arr[pos + cap:] = value
+                arr[:end - cap] = value
@@ -0,0 +1,79 @@
+# Per-stage latency tracing from BLE notify to LRA write.
+#
+# Each IMU notification gets a Trace stamped with time.perf_counter() as it moves
+# through the pipeline; the trace of a packet that produces a haptic command
+# travels with the command to the BLE write. LatencyTracker keeps a rolling
+# window of stage-to-stage intervals and reports p50/p95/p99/max.
+
+import time
+from collections import deque
+
+import numpy as np
+
+STAGES = ("notify", "dequeue", "parse", "gait", "fpa", "decision", "enqueue", "write")
+_STAGE_INDEX = {name: i for i, name in enumerate(STAGES)}
+END_TO_END = "notify->write"
+
+clock = time.perf_counter
+
+
+class Trace:
+    __slots__ = ("stamps",)
+
+    def __init__(self, t_notify=None):
+        self.stamps = [None] * len(STAGES)
+        self.stamps[0] = t_notify
+
+    def mark(self, stage, t=None):
+        self.stamps[_STAGE_INDEX[stage]] = clock() if t is None else t
+
+    def copy(self):
+        trace = Trace()
+        trace.stamps = self.stamps.copy()
+        return trace
+
+
+class LatencyTracker:
+    # Interval for a stage = its stamp minus the previous stamped stage.
+
+    def __init__(self, window=2000):
+        self.intervals = {name: deque(maxlen=window) for name in STAGES[1:] + (END_TO_END,)}
+        self.count = 0
+
+    def record(self, trace):
+        self.count += 1
+        prev = None
+        for name, t in zip(STAGES, trace.stamps):
+            if t is None:
+                continue
+            if prev is not None:
+                self.intervals[name].append(t - prev)
+            prev = t
+        first, last = trace.stamps[0], trace.stamps[-1]
+        if first is not None and last is not None:
+            self.intervals[END_TO_END].append(last - first)
+
+    def summary(self):
+        # {stage: {"n", "p50_ms", "p95_ms", "p99_ms", "max_ms"}} for stages with data
+        out = {}
+        for name, values in self.intervals.items():
+            if not values:
+                continue
+            ms = np.asarray(values) * 1e3
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            out[name] = {
+                "n": len(ms),
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+                "max_ms": round(float(ms.max()), 3),
+            }
+        return out
+
+    def format(self):
+        lines = [f"{'stage':>14} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+        for name, s in self.summary().items():
+            lines.append(
+                f"{name:>14} {s['n']:>6} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,152 @@
+# Reloads config.json while a session runs, without touching the BLE links
+# or the session log.
+#
+# ConfigWatcher checks the file's modification time every interval seconds.
+# When it changes, the file is parsed and the keys in LIVE_KEYS validated:
+#   - the feedback thresholds must be numbers, toe-in no higher than toe-out
+#   - ALGORITHM must name a plugin in algorithms/ exporting FPA and GaitPhase,
+#     and is only taken live with reload_algorithm (CONFIG_RELOAD_ALGORITHM)
+# A file that fails is reported and the running settings stay. A valid one is
+# published as a new LiveConfig in one assignment to `current`. Other changed
+# keys are reported as needing a restart.
+#
+# Nothing is applied mid-step. Each pipeline holds an AppliedConfig and asks
+# it for the latest settings at a step boundary; the first step after a change
+# runs entirely with the new ones, and the change is recorded there.
+#
+#   watcher = ConfigWatcher("config.json", cfg, interval=1.0)
+#   task = asyncio.create_task(watcher.watch())
+#   config = AppliedConfig(watcher)       # one per pipeline
+#   change = config.update(step)          # at each step; None if nothing changed
+#   toe_out = config.current.toe_out
+
+import asyncio
+import importlib
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+LIVE_KEYS = ("FEEDBACK_TOE_OUT_THRESHOLD_DEG", "FEEDBACK_TOE_IN_THRESHOLD_DEG", "ALGORITHM")
+
+# version counts the accepted reloads; 0 is the config the session started with
+LiveConfig = namedtuple("LiveConfig", ["version", "toe_out", "toe_in", "algorithm"])
+
+
+def load_algorithm(name):
+    # the plugin module algorithms/<name>, checked for FPA and GaitPhase
+    try:
+        module = importlib.import_module(f"algorithms.{name}")
+    except ImportError as e:
+        raise ValueError(f"ALGORITHM '{name}' cannot be imported: {e}") from e
+    if not hasattr(module, "FPA") or not hasattr(module, "GaitPhase"):
+        raise ValueError(f"ALGORITHM '{name}' does not export FPA and GaitPhase")
+    return module
+
+
+def validate(cfg, version=0):
+    # LiveConfig from a parsed config.json; ValueError naming the first bad key
+    for key in LIVE_KEYS:
+        if key not in cfg:
+            raise ValueError(f"{key} is missing")
+    toe_out = cfg["FEEDBACK_TOE_OUT_THRESHOLD_DEG"]
+    toe_in = cfg["FEEDBACK_TOE_IN_THRESHOLD_DEG"]
+    for key, value in (("FEEDBACK_TOE_OUT_THRESHOLD_DEG", toe_out), ("FEEDBACK_TOE_IN_THRESHOLD_DEG", toe_in)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} must be a number, got {value!r}")
+    if toe_in > toe_out:
+        raise ValueError(f"FEEDBACK_TOE_IN_THRESHOLD_DEG ({toe_in}) is above FEEDBACK_TOE_OUT_THRESHOLD_DEG ({toe_out})")
+    if not isinstance(cfg["ALGORITHM"], str):
+        raise ValueError(f"ALGORITHM must be a string, got {cfg['ALGORITHM']!r}")
+    return LiveConfig(version, toe_out, toe_in, cfg["ALGORITHM"])
+
+
+def changed_keys(old, new):
+    # {key: [old value, new value]} for the live settings that differ
+    names = dict(zip(("toe_out", "toe_in", "algorithm"), LIVE_KEYS))
+    return {names[field]: [getattr(old, field), getattr(new, field)]
+            for field in names if getattr(old, field) != getattr(new, field)}
+
+
+class ConfigWatcher:
+    def __init__(self, path, cfg, interval=1.0, reload_algorithm=False):
+        self.path = path
+        self.interval = interval
+        self.reload_algorithm = reload_algorithm
+        self.current = validate(cfg)
+        self._cfg = dict(cfg)  # the file as last read, for reporting restart-only changes
+        self._mtime = self._stat()
+        self.reloads = 0
+        self.rejected = 0
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.check()
+
+    def check(self):
+        # reload if the file changed; True if new live settings were published
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            with open(self.path) as f:
+                cfg = json.load(f)
+            if not isinstance(cfg, dict):
+                raise ValueError("not a JSON object")
+            live = validate(cfg, self.current.version + 1)
+            if live.algorithm != self.current.algorithm:
+                if not self.reload_algorithm:
+                    raise ValueError("ALGORITHM changed but CONFIG_RELOAD_ALGORITHM is off; restart to switch plugins")
+                load_algorithm(live.algorithm)
+        except (OSError, ValueError) as e:
+            self.rejected += 1
+            print(f"[Config] {self.path} not reloaded, keeping the running settings: {e}")
+            return False
+
+        restart = sorted(key for key in set(cfg) | set(self._cfg)
+                         if key not in LIVE_KEYS and cfg.get(key) != self._cfg.get(key))
+        self._cfg = cfg
+        if restart:
+            print(f"[Config] {', '.join(restart)} changed; takes effect on restart")
+        changes = changed_keys(self.current, live)
+        if not changes:
+            return False
+        self.current = live
+        self.reloads += 1
+        print(f"[Config] reloaded {self.path} (version {live.version}): "
+              + ", ".join(f"{key} {old} -> {new}" for key, (old, new) in changes.items()))
+        return True
+
+    def stats(self):
+        return {"version": self.current.version, "reloads": self.reloads, "rejected": self.rejected}
+
+
+class AppliedConfig:
+    # The live settings one pipeline runs with. They only change when its
+    # consumer calls update() at a step boundary, and every change is kept.
+    def __init__(self, watcher: ConfigWatcher):
+        self.watcher = watcher
+        self.current = watcher.current
+        self.changes = []
+
+    def update(self, step):
+        latest = self.watcher.current
+        if latest is self.current:
+            return None
+        change = {
+            "version": latest.version,
+            "step": step,
+            "applied": datetime.now().isoformat(timespec="seconds"),
+            "changed": changed_keys(self.current, latest),
+        }
+        self.current = latest
+        self.changes.append(change)
+        return change
@@ -0,0 +1,211 @@
+# Deadline-aware scheduling of LRA commands between lra_feedback and
+# BLEConnection.connect_and_write.
+#
+# A late haptic cue is worse than none, so instead of a FIFO:
+#   - every command carries its step number and a deadline (created + max_age)
+#   - a newer command supersedes one still waiting (counted as coalesced)
+#   - each motor is rate limited to one command per min_interval, the
+#     actuator's buzz length; a command that could only go out after its
+#     deadline is dropped rather than delayed
+#   - a command whose deadline has passed by the time the link is free is dropped
+#
+# On the wire (Wearable/shank_mounted_wearable.py) a command is
+# "<drv>[!][#tag]\n": "!" makes it preempt whatever the board is playing, and a
+# tag asks for an ack, "ack <tag> play <ms> <ticks>" once the motor starts (ms
+# from receipt to actuation, ticks the board clock at actuation) or
+# "ack <tag> drop <ms> <ticks>" if the board discarded it. Older firmware leaves
+# out the ticks, and reads only the first character of a command, so it still
+# buzzes. With the shank board's clock mapped (sync, a clock_sync.ClockSync),
+# an ack also tells how long the write took to reach the board.
+#
+#   scheduler = CommandScheduler(max_age=0.3, min_interval=0.5)
+#   scheduler.submit("1", drv=1, step=12, trace=trace)  # from the consumer
+#   cmd = await scheduler.next()                        # in the writer
+#   ...write scheduler.encode(cmd)...
+#   scheduler.sent(cmd)                                 # or retry(cmd) if the link dropped
+#   scheduler.feed_acks(data)                           # from the board's notifications
+
+import asyncio
+import math
+
+from latency import clock as perf_clock
+
+
+ACK_WINDOW = 32  # sent commands remembered while their ack is outstanding
+
+
+class LRACommand:
+    __slots__ = ("cmd", "drv", "step", "trace", "created", "deadline", "tag")
+
+    def __init__(self, cmd, drv, step, trace, created, deadline, tag):
+        self.cmd = cmd
+        self.drv = drv
+        self.step = step
+        self.trace = trace
+        self.created = created
+        self.deadline = deadline
+        self.tag = tag
+
+
+class CommandScheduler:
+    def __init__(self, max_age=0.3, min_interval=0.5, clock=perf_clock, preempt=True, ack=True):
+        self.max_age = max_age
+        self.min_interval = min_interval
+        self.clock = clock
+        self.preempt = preempt  # newest cue cuts off the one playing on the board
+        self.ack = ack          # tag commands and track the board's acks
+        self._pending = None
+        self._ready = asyncio.Event()
+        self._last_sent = {}  # drv -> clock() of its last write
+        self.submitted = 0
+        self.sent_count = 0
+        self.coalesced = 0          # superseded by a newer command before being sent
+        self.dropped_stale = 0      # deadline passed while waiting for the link
+        self.dropped_rate_limit = 0 # motor would still be busy at the deadline
+        self.retried = 0            # write failed with the link; held for the reconnect
+        self._age_total = 0.0
+        self.max_send_age = 0.0     # slowest submit-to-send, seconds
+        self._next_tag = 0
+        self._unacked = {}          # tag -> (command, clock() when sent), oldest first
+        self._ack_buf = b""
+        self.played = 0             # acked as started on the board
+        self.dropped_device = 0     # acked as discarded by the board's queue
+        self.ack_missing = 0        # fell out of ACK_WINDOW without an ack
+        self._device_delay_total = 0
+        self.max_device_delay_ms = 0  # slowest receive-to-actuate reported by the board
+        self._ack_rtt_total = 0.0
+        self.sync = None            # clock_sync.ClockSync of the shank board, set by BLEConnection
+        self._radio_total = 0.0
+        self.radio_acks = 0         # acks the write's radio time was measured for
+        self.max_write_radio_ms = 0.0
+
+    def submit(self, cmd, drv, step, trace=None):
+        now = self.clock()
+        self.submitted += 1
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = LRACommand(cmd, drv, step, trace, now, now + self.max_age, self._next_tag)
+        self._next_tag = (self._next_tag + 1) & 0xFFFF
+        self._ready.set()
+        return self._pending
+
+    def poll(self):
+        # (command to send now or None, seconds until the pending one may go or None)
+        while self._pending is not None:
+            command = self._pending
+            now = self.clock()
+            if now > command.deadline:
+                self.dropped_stale += 1
+                self._pending = None
+                continue
+            ready_at = self._last_sent.get(command.drv, -math.inf) + self.min_interval
+            if ready_at > command.deadline:
+                self.dropped_rate_limit += 1
+                self._pending = None
+                continue
+            if ready_at > now:
+                return None, ready_at - now
+            self._pending = None
+            return command, None
+        self._ready.clear()
+        return None, None
+
+    async def next(self):
+        while True:
+            command, wait = self.poll()
+            if command is not None:
+                return command
+            self._ready.clear()
+            try:
+                # a newer submit may supersede the command we are waiting on
+                await asyncio.wait_for(self._ready.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def retry(self, command):
+        # a command whose write failed because the link dropped: back in line
+        # unless a newer one has taken its place. It keeps its deadline, so
+        # across an outage it still goes stale like any waiting command.
+        self.retried += 1
+        if self._pending is not None:
+            self.coalesced += 1
+            return
+        self._pending = command
+        self._ready.set()
+
+    def encode(self, command):
+        # bytes to write to the shank board
+        text = command.cmd
+        if self.preempt:
+            text += "!"
+        if self.ack:
+            text += f"#{command.tag}"
+        return (text + "\n").encode()
+
+    def sent(self, command):
+        now = self.clock()
+        self._last_sent[command.drv] = now
+        self.sent_count += 1
+        age = now - command.created
+        self._age_total += age
+        self.max_send_age = max(self.max_send_age, age)
+        if self.ack:
+            self._unacked[command.tag] = (command, now)
+            if len(self._unacked) > ACK_WINDOW:
+                del self._unacked[next(iter(self._unacked))]
+                self.ack_missing += 1
+
+    def feed_acks(self, data):
+        # notification bytes from the board; lines may be split across notifications
+        lines = (self._ack_buf + bytes(data)).split(b"\n")
+        self._ack_buf = lines.pop()
+        for line in lines:
+            fields = line.split()
+            if len(fields) in (4, 5) and fields[0] == b"ack":
+                try:
+                    tick = int(fields[4]) if len(fields) == 5 else None
+                    self.acked(int(fields[1]), fields[2].decode(), int(fields[3]), tick)
+                except ValueError:
+                    pass
+
+    def acked(self, tag, status, ms, tick=None):
+        entry = self._unacked.pop(tag, None)
+        if entry is None:
+            return  # untracked tag, or one that already fell out of the window
+        command, sent_at = entry
+        self._ack_rtt_total += self.clock() - sent_at
+        if status == "play":
+            self.played += 1
+            self._device_delay_total += ms
+            self.max_device_delay_ms = max(self.max_device_delay_ms, ms)
+            actuated = self.sync.to_host(tick) if self.sync is not None and tick is not None else None
+            if actuated is not None:
+                # board clock at actuation, less the board's own delay: when the write landed
+                radio = actuated - ms / 1e3 - sent_at
+                self._radio_total += radio
+                self.radio_acks += 1
+                self.max_write_radio_ms = max(self.max_write_radio_ms, 1e3 * radio)
+        else:
+            self.dropped_device += 1
+
+    def stats(self):
+        acked = self.played + self.dropped_device
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent_count,
+            "coalesced": self.coalesced,
+            "dropped_stale": self.dropped_stale,
+            "dropped_rate_limit": self.dropped_rate_limit,
+            "retried": self.retried,
+            "pending": int(self._pending is not None),
+            "mean_send_age_ms": round(1e3 * float(self._age_total) / self.sent_count, 2) if self.sent_count else None,
+            "max_send_age_ms": round(1e3 * float(self.max_send_age), 2),
+            "played": self.played,
+            "dropped_device": self.dropped_device,
+            "ack_missing": self.ack_missing,
+            "mean_device_delay_ms": round(self._device_delay_total / self.played, 2) if self.played else None,
+            "max_device_delay_ms": self.max_device_delay_ms,
+            "mean_ack_rtt_ms": round(1e3 * float(self._ack_rtt_total) / acked, 2) if acked else None,
+            "mean_write_radio_ms": round(1e3 * self._radio_total / self.radio_acks, 2) if self.radio_acks else None,
+            "max_write_radio_ms": round(self.max_write_radio_ms, 2),
+        }
@@ -0,0 +1,47 @@
+# Calibrated baselines, one profile per wearer and foot.
+#
+# The file maps "<user>/<right|left>" to the latest calibration of that foot
+# (calibration.Calibration.result plus when it was taken):
+#   {"rhea/right": {"base_fpa": -4.21, "steps": 24, "sd": 1.9, "ci_width": 1.52,
+#                   "duration_s": 27.4, "stopped_early": true,
+#                   "calibrated": "2026-10-18T14:02:11"}, ...}
+# The single wearer of a session without --devices is "default". The whole
+# file is held in a dict, so a lookup never touches the disk; it is rewritten
+# after each calibration. A missing or unreadable file is an empty store.
+
+import json
+import os
+
+
+def profile_key(user, is_right_foot):
+    return f"{user or 'default'}/{'right' if is_right_foot else 'left'}"
+
+
+class ProfileStore:
+    def __init__(self, path):
+        self.path = path
+        self._profiles = {}
+        try:
+            with open(path) as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                self._profiles = {str(k): v for k, v in loaded.items() if isinstance(v, dict) and "base_fpa" in v}
+        except (OSError, ValueError):
+            pass
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def get(self, user, is_right_foot):
+        return self._profiles.get(profile_key(user, is_right_foot))
+
+    def put(self, user, is_right_foot, profile):
+        self._profiles[profile_key(user, is_right_foot)] = profile
+        self.save()
+
+    def save(self):
+        # write-then-rename, so an interrupted save leaves the old profiles intact
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._profiles, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
@@ -0,0 +1,234 @@
+# Offline replay of recorded sessions through fpa_consumer, without BLE.
+#
+#   uv run python run_device.py --replay output/fpa_log_<timestamp>.csv
+#   uv run python run_device.py --replay output/fpa_log_<timestamp>_capture.bin
+#   uv run python run_device.py --replay output/fpa_log_<timestamp>.fpab --out output/replay.fpab
+#
+# Every packet is put in the ingest ring up front and the consumer's clock
+# follows the recorded timestamps, so calibration and rate reporting behave as
+# they did live while the session runs as fast as the CPU allows. LRA commands go to an in-memory
+# list instead of the shank board, released by the same CommandScheduler on
+# simulated time.
+
+import asyncio
+import csv
+import os
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+from edge_steps import EdgeAssembler
+from fpab import FpabReader
+from ingest_ring import IngestRing
+from lra_scheduler import CommandScheduler
+from profiles import ProfileStore
+from session_log import open_session_log
+
+CSV_COLUMNS = ("ax", "ay", "az", "gx", "gy", "gz")
+
+# Raw capture: one record per BLE notification
+#   <d timestamp (time.time() at notify)> <I payload length> <payload bytes>
+CAPTURE_RECORD = struct.Struct("<dI")
+
+
+class CaptureWriter:
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "wb")
+
+    def write(self, payload, ts):
+        self._f.write(CAPTURE_RECORD.pack(ts, len(payload)))
+        self._f.write(payload)
+
+    def close(self):
+        self._f.close()
+
+
+def read_capture(path):
+    # [(payload, ts)] from a CaptureWriter file; a truncated last record is ignored
+    packets = []
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos + CAPTURE_RECORD.size <= len(data):
+        ts, length = CAPTURE_RECORD.unpack_from(data, pos)
+        pos += CAPTURE_RECORD.size
+        if pos + length > len(data):
+            break
+        packets.append((data[pos:pos + length], ts))
+        pos += length
+    return packets
+
+
+def read_csv_log(path):
+    # [(payload, ts)] rebuilt from the ax..gz columns of an fpa_log CSV.
+    # Columns are found by name, so older logs without drv/effect also work.
+    packets = []
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        names = [h.split(" ")[0] for h in header]
+        cols = [names.index(c) for c in CSV_COLUMNS]
+        t_col = names.index("time")
+        for row in reader:
+            if len(row) < len(header):
+                continue
+            payload = struct.pack("<6f", *(float(row[c]) for c in cols))
+            packets.append((payload, float(row[t_col])))
+    return packets
+
+
+def read_fpab_log(path):
+    # [(payload, ts)] from the sample chunks of an .fpab log, one row per packet
+    times, block = FpabReader(path).samples()
+    data = np.ascontiguousarray(block, dtype="<f4").tobytes()
+    return [(data[i * 24:(i + 1) * 24], t) for i, t in enumerate(times.tolist())]
+
+
+def read_session(path):
+    if path.endswith(".bin"):
+        return read_capture(path)
+    if path.endswith(".fpab"):
+        return read_fpab_log(path)
+    return read_csv_log(path)
+
+
+class SimulatedClock:
+    # Consumer clock that reads the timestamp of the packet last handed out
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+class ReplayRing(IngestRing):
+    # Holds the whole session and hands it out one packet (one timestamp) at a
+    # time, advancing the simulated clock, so the consumer sees the same batches
+    # and clock readings it saw live.
+    def __init__(self, capacity, clock, on_advance=None):
+        super().__init__(capacity)
+        self.clock = clock
+        self.on_advance = on_advance  # called each time simulated time moves on
+        self._sizes = deque()
+
+    def put(self, block, ts, t_notify, lost=0):
+        super().put(block, ts, t_notify, lost)
+        self._sizes.append(len(block))
+
+    def drain(self, max_samples=None):
+        batch = super().drain(self._sizes.popleft())
+        self.clock.now = batch.ts[0]
+        if self.on_advance is not None:
+            self.on_advance()
+        return batch
+
+
+class ReplayEdge(EdgeAssembler):
+    # ReplayRing for edge-mode captures: hands out one step at a time, with the
+    # simulated clock at the step header's arrival
+    def __init__(self, max_steps, clock, on_advance=None):
+        super().__init__(max_steps=max_steps)
+        self.clock = clock
+        self.on_advance = on_advance
+
+    async def get(self):
+        step = await super().get()
+        if step is not None and self.on_advance is not None:
+            # steps are far apart: let the last step's command out on the way
+            self.on_advance(until=step.t_notify)
+        if step is not None:
+            self.clock.now = step.t_notify
+            if self.on_advance is not None:
+                self.on_advance()
+        return step
+
+
+class ReplayLRA:
+    # Stands in for the shank board: writes whatever the scheduler releases,
+    # instantly, as simulated time passes
+    def __init__(self, scheduler, clock=None):
+        self.scheduler = scheduler
+        self.clock = clock
+        self.commands = []
+
+    def pump(self, until=None):
+        # with until, simulated time may run on towards it while a command
+        # waits out the per-motor rate limit, as the live writer would
+        while True:
+            command, wait = self.scheduler.poll()
+            if command is None:
+                if wait is None or until is None or self.clock.now + wait > until:
+                    return
+                self.clock.now += wait
+                continue
+            self.scheduler.sent(command)
+            self.commands.append(command.cmd)
+
+
+async def replay(path, out_path=None):
+    import run_device
+    from bluetooth import BLEConnection
+
+    packets = read_session(path)
+    if not packets:
+        print(f"No packets in {path}")
+        return None
+    if out_path is None:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        out_path = os.path.join("output", f"replay_{stem}.csv")
+    # a replayed calibration must not overwrite the live profiles
+    profiles = ProfileStore(run_device.PROFILE_FILE)
+    if run_device.CALIBRATION:
+        profiles = ProfileStore(out_path.replace(".csv", "_profiles.json"))
+
+    clock = SimulatedClock()
+    clock.now = packets[0][1]
+    # upper bound on samples; an on-device feedback capture has none
+    capacity = max(sum(len(payload) // 24 for payload, _ in packets), 1)
+    scheduler = CommandScheduler(run_device.LRA_COMMAND_MAX_AGE, run_device.LRA_MIN_INTERVAL, clock=clock.time, ack=False)
+    lra = ReplayLRA(scheduler, clock)
+    ring = ReplayRing(capacity, clock, on_advance=lra.pump)
+    edge = ReplayEdge(len(packets), clock, on_advance=lra.pump)
+    conn = BLEConnection(ring=ring, edge=edge)
+    for payload, ts in packets:
+        conn.put_packet(payload, ts, ts, ts)
+    ring.close()  # end of session
+    edge.close()
+    info = conn.device_info
+    edge_mode = info is not None and (info.edge or info.feedback)
+
+    # a capture of newer firmware starts with the IMU's reported rate
+    datarate = run_device.sample_rate(conn.device_info)
+    gp = run_device.GaitPhase(datarate=datarate)
+    fpa = run_device.FPA(is_right_foot=run_device.IS_RIGHT_FOOT, datarate=datarate)
+
+    t0 = time.perf_counter()
+    log = open_session_log(out_path, run_device.CSV_HEADER, meta={"algorithm": run_device.ALGORITHM, "replay_of": path})
+    try:
+        if edge_mode and info.feedback:
+            await run_device.event_consumer(edge, log, clock=clock.time, profiles=profiles)
+        elif edge_mode:
+            await run_device.edge_consumer(edge, fpa, log, scheduler, clock=clock.time, profiles=profiles)
+        else:
+            await run_device.fpa_consumer(ring, gp, fpa, log, scheduler, clock=clock.time, profiles=profiles)
+    finally:
+        log.close()
+    elapsed = time.perf_counter() - t0
+
+    lra.pump()
+    lra_commands = lra.commands
+    cues = f"{edge.cues} cues on the IMU board" if edge_mode and info.feedback else f"{len(lra_commands)} LRA commands"
+
+    samples = edge.tail_samples if edge_mode else ring.samples_in
+    steps = edge.steps if edge_mode else gp.step_count
+    duration = packets[-1][1] - packets[0][1]
+    print(
+        f"[Replay] {samples} samples ({duration:.1f} s recorded) in {elapsed * 1e3:.0f} ms "
+        f"→ {samples / elapsed:,.0f} samples/s, {steps} steps, "
+        f"{cues}, log written to {out_path}"
+    )
+    print(f"[Replay] commands: {scheduler.stats()}")
+    return lra_commands
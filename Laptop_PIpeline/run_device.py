@@ -1,14 +1,17 @@
+import argparse
 import asyncio
-import struct
-import math
 import csv
 import json
 import os
+import traceback
 from datetime import datetime
 
 import importlib
 
-with open(os.path.join(os.path.dirname(__file__), "config.json")) as _f:
+import numpy as np
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+with open(CONFIG_FILE) as _f:
     _cfg = json.load(_f)
 
 ALGORITHM                    = _cfg["ALGORITHM"]
@@ -16,174 +19,761 @@ IS_RIGHT_FOOT                = _cfg["IS_RIGHT_FOOT"]
 DATA_RATE                    = _cfg["DATA_RATE"]
 CALIBRATION                  = _cfg["CALIBRATION"]
 CALIBRATION_DURATION         = _cfg["CALIBRATION_DURATION"]
+CALIBRATION_CI_WIDTH_DEG     = _cfg["CALIBRATION_CI_WIDTH_DEG"]
+CALIBRATION_MIN_STEPS        = _cfg["CALIBRATION_MIN_STEPS"]
 FEEDBACK_TOE_OUT_THRESHOLD_DEG = _cfg["FEEDBACK_TOE_OUT_THRESHOLD_DEG"]
 FEEDBACK_TOE_IN_THRESHOLD_DEG  = _cfg["FEEDBACK_TOE_IN_THRESHOLD_DEG"]
+LATENCY_REPORT_INTERVAL      = _cfg["LATENCY_REPORT_INTERVAL"]
+GAP_INTERPOLATE_MAX_SAMPLES  = _cfg["GAP_INTERPOLATE_MAX_SAMPLES"]
+LOG_FORMAT                   = _cfg["LOG_FORMAT"]
+INGEST_RING_CAPACITY         = _cfg["INGEST_RING_CAPACITY"]
+INGEST_OVERFLOW              = _cfg["INGEST_OVERFLOW"]
+LRA_COMMAND_MAX_AGE          = _cfg["LRA_COMMAND_MAX_AGE"]
+LRA_MIN_INTERVAL             = _cfg["LRA_MIN_INTERVAL"]
+LRA_PREEMPT                  = _cfg["LRA_PREEMPT"]
+LRA_ACK                      = _cfg["LRA_ACK"]
+DEVICE_INFO_TIMEOUT          = _cfg["DEVICE_INFO_TIMEOUT"]
+CLOCK_SYNC_INTERVAL          = _cfg["CLOCK_SYNC_INTERVAL"]
+SCAN_TIMEOUT                 = _cfg["SCAN_TIMEOUT"]
+CONNECT_TIMEOUT              = _cfg["CONNECT_TIMEOUT"]
+RECONNECT_DELAY              = _cfg["RECONNECT_DELAY"]
+RECONNECT_MAX_DELAY          = _cfg["RECONNECT_MAX_DELAY"]
+RECONNECT_RESCAN_AFTER       = _cfg["RECONNECT_RESCAN_AFTER"]
+CONFIG_RELOAD_INTERVAL       = _cfg["CONFIG_RELOAD_INTERVAL"]
+CONFIG_RELOAD_ALGORITHM      = _cfg["CONFIG_RELOAD_ALGORITHM"]
 
 # Swap ALGORITHM in config.json to use a different FPA plugin.
 # Each plugin lives in algorithms/<name>/ and must export FPA and GaitPhase.
+# With CONFIG_RELOAD_ALGORITHM it can also be switched mid-session (live_config.py).
 _algo = importlib.import_module(f"algorithms.{ALGORITHM}")
 FPA = _algo.FPA
 GaitPhase = _algo.GaitPhase
 
-from bluetooth import find_devices, BLEConnection
+from algorithms.base import make_step_processor, supports_edge, BatchStepProcessor
+
+from bluetooth import BLEConnection, Discovery
+from calibration import Calibration
+from device_cache import DeviceCache
+from edge_steps import EdgeAssembler, FeedbackStep
+from imu_packet import GapPolicy
+from ingest_ring import IngestRing
+from live_config import AppliedConfig, ConfigWatcher, LiveConfig, load_algorithm
+from lra_scheduler import CommandScheduler
+from profiles import ProfileStore, profile_key
+from latency import LatencyTracker, Trace, clock as perf_clock
+from session_log import SessionLog, open_session_log
 
 os.makedirs("output", exist_ok=True)
 CSV_FILE = f"output/fpa_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-
-
-def parse_payload(payload: bytes):
-    if len(payload) < 24:
-        return None
-    ax, ay, az, gx, gy, gz = struct.unpack_from('<6f', payload)
-    acc = [ax, ay, az]
-    gyr = [gx, gy, gz]
-    return gyr, acc
-
-def lra_feedback(diff, cmd_queue: asyncio.Queue):
-    if diff > FEEDBACK_TOE_OUT_THRESHOLD_DEG:
+BASE_FPA_FILE = "base_fpa.csv"  # read only for wearers with no profile yet
+PROFILE_FILE = "profiles.json"
+DEVICE_CACHE_FILE = "device_cache.json"
+CSV_HEADER = ["time", "step num", "fpa", "drv", "effect", "ax (m/s2)", "ay (m/s2)", "az (m/s2)", "gx (rad/s)", "gy (rad/s)", "gz (rad/s)"]
+
+
+def sample_rate(info):
+    # the rate the IMU measured and reported on connect (imu_packet.DeviceInfo),
+    # DATA_RATE from config.json for firmware that does not report one
+    return info.rate if info is not None else DATA_RATE
+
+def lra_feedback(diff, scheduler: CommandScheduler, step=None, trace: Trace = None, label="", live: LiveConfig = None):
+    # live: reloaded thresholds (live_config.py); the config.json ones otherwise
+    toe_out = FEEDBACK_TOE_OUT_THRESHOLD_DEG if live is None else live.toe_out
+    toe_in = FEEDBACK_TOE_IN_THRESHOLD_DEG if live is None else live.toe_in
+    if diff > toe_out:
         drv = 1  # left
-    elif diff < FEEDBACK_TOE_IN_THRESHOLD_DEG:
+    elif diff < toe_in:
         drv = 2  # right
     else:
         return None  # within threshold, no feedback
 
     direction = "left (drv1)" if drv == 1 else "right (drv2)"
     cmd = str(drv)
-    print(f"[LRA Feedback] diff={diff:.2f} deg → {direction} → cmd='{cmd}'")
-    cmd_queue.put_nowait(cmd)
+    if trace is not None:
+        trace.mark("decision")
+    scheduler.submit(cmd, drv, step, trace)
+    if trace is not None:
+        trace.mark("enqueue")
+    prefix = f"[{label}] " if label else ""
+    print(f"{prefix}[LRA Feedback] diff={diff:.2f} deg → {direction} → cmd='{cmd}'")
     return cmd
 
-async def fpa_consumer(packet_queue: asyncio.Queue, gp: GaitPhase, fpa: FPA, writer: csv.writer, cmd_queue: asyncio.Queue):
-    start_time = asyncio.get_running_loop().time()
-    calibration_fpas = []
+def apply_config(config: AppliedConfig, step, log, prefix=""):
+    # at a step boundary: take up reloaded settings, recording the change in
+    # the log; the live settings to use, None without hot reload
+    if config is None:
+        return None
+    change = config.update(step)
+    if change is not None:
+        log.meta(config_changes=config.changes)
+        print(f"{prefix}[Config] version {change['version']} from step {step}: "
+              + ", ".join(f"{key} {old} -> {new}" for key, (old, new) in change["changed"].items()))
+    return config.current
+
+def swap_algorithm(name, gp, fpa):
+    # the named plugin's FPA, at the running one's rate and foot and carrying
+    # its step-to-step smoothing; its GaitPhase too if it has its own, at the
+    # same step count
+    algo = load_algorithm(name)
+    new_fpa = algo.FPA(is_right_foot=fpa.is_right_foot, datarate=fpa.datarate)
+    new_fpa.FPA_last_step = fpa.FPA_last_step
+    if gp is not None and type(gp) is not algo.GaitPhase:
+        step_count = gp.step_count
+        gp = algo.GaitPhase(datarate=gp.DATARATE)
+        gp.step_count = step_count
+    return gp, new_fpa
+
+def new_calibration():
+    return Calibration(CALIBRATION_CI_WIDTH_DEG, CALIBRATION_MIN_STEPS, CALIBRATION_DURATION)
+
+def load_base_fpa(profiles, user, is_right_foot, base_fpa_file, log, prefix=""):
+    # the wearer's calibrated profile, or base_fpa_file for one who has none yet
+    profile = profiles.get(user, is_right_foot)
+    if profile is not None:
+        base = profile["base_fpa"]
+        key = profile_key(user, is_right_foot)
+        print(f"{prefix}Loaded base FPA: {base:.2f} deg (profile {key}, {profile.get('steps')} steps)")
+        log.meta(base_fpa=base, profile=key)
+        return base
+    with open(base_fpa_file, "r", newline="") as cal_f:
+        cal_reader = csv.reader(cal_f)
+        next(cal_reader)  # skip header
+        base = float(next(cal_reader)[0])
+    print(f"{prefix}Loaded base FPA: {base:.2f} deg from {base_fpa_file}")
+    log.meta(base_fpa=base, base_fpa_file=base_fpa_file)
+    return base
+
+def save_base_fpa(calibration: Calibration, elapsed, profiles, user, is_right_foot, log, prefix=""):
+    # the calibration mean, or None if no steps were collected
+    result = calibration.result(elapsed)
+    if result is None:
+        print(f"{prefix}Calibration complete but no FPA values were collected.")
+        return None
+    result["calibrated"] = datetime.now().isoformat(timespec="seconds")
+    profiles.put(user, is_right_foot, result)
+    key = profile_key(user, is_right_foot)
+    ci = f" ± {result['ci_width'] / 2:.2f}" if result["ci_width"] is not None else ""
+    early = ", stopped early" if result["stopped_early"] else ""
+    print(f"{prefix}Calibration complete. Base FPA = {calibration.mean:.2f}{ci} deg "
+          f"({result['steps']} steps in {elapsed:.1f} s{early}) saved to profile {key} in {profiles.path}")
+    log.meta(base_fpa=calibration.mean, profile=key, calibration=result)
+    return calibration.mean
+
+async def fpa_consumer(ring: IngestRing, gp: GaitPhase, fpa: FPA, log: SessionLog, scheduler: CommandScheduler, latency: LatencyTracker = None, clock=None, base_fpa_file=BASE_FPA_FILE, label="", gaps: GapPolicy = None, profiles: ProfileStore = None, user=None, config: AppliedConfig = None):
+    # clock defaults to the event loop's; replay.py passes a simulated one.
+    # Each pass drains everything pending in the ring as one batch; the consumer
+    # returns once the ring is closed and empty (end of a replayed session).
+    # With config (hot reload) new settings are taken up at each step; a new
+    # algorithm takes over after the batch, and the step whose window it only
+    # saw part of is skipped.
+    if clock is None:
+        clock = asyncio.get_running_loop().time
+    if gaps is None:
+        gaps = GapPolicy(GAP_INTERPOLATE_MAX_SAMPLES)
+    if profiles is None:
+        profiles = ProfileStore(PROFILE_FILE)
+    gap_in_buffer = False  # a long gap landed in the FPA buffer being collected
+    gap_steps = set()      # steps whose FPA was computed from a buffer spanning a gap
+    prefix = f"[{label}] " if label else ""
+    start_time = clock()
+    calibration = new_calibration()
     calibrating = CALIBRATION
     seen_steps = set()
+    live = config.current if config is not None else None
+    algorithm = ALGORITHM
+    swap_step = None     # last step computed before an algorithm switch
 
     base = None
     if not calibrating:
-        with open("base_fpa.csv", "r", newline="") as cal_f:
-            cal_reader = csv.reader(cal_f)
-            next(cal_reader)  # skip header
-            base = float(next(cal_reader)[0])
-        print(f"Loaded base FPA: {base:.2f} deg")
-
-    while True:
-        payload, rate, ts = await packet_queue.get()
+        base = load_base_fpa(profiles, user, fpa.is_right_foot, base_fpa_file, log, prefix)
 
-        parsed = parse_payload(payload)
-        if parsed is None:
-            print(f"could not parse payload")
-            continue
+    processor = make_step_processor(gp, fpa)
+    path = "v2 batch" if isinstance(processor, BatchStepProcessor) else "v1 per-sample"
+    print(f"{prefix}Algorithm '{ALGORITHM}' running on the {path} path")
 
-        gyr, acc = parsed
-
-        # Expected payload format from MCU:
-        #   6 little-endian 32-bit floats = 24 bytes total
+    batches = 0
+    while True:
+        # a replayed backlog is otherwise drained without ever yielding, which
+        # would starve other wearers' pipelines on the same loop
+        batches += 1
+        if batches % 32 == 0:
+            await asyncio.sleep(0)
+
+        batch = await ring.get()
+        if batch is None:
+            return
+        # latency is traced from the oldest sample in the batch
+        trace = Trace(batch.t_notify[0]) if latency is not None else None
+        if trace is not None:
+            trace.mark("dequeue")
+
+        # Samples as decoded by BLEConnection from the MCU payloads (imu_packet.py):
         #   [ax, ay, az, gx, gy, gz]
         #   ax/ay/az: accelerometer in m/s²
         #   gx/gy/gz: gyroscope in rad/s
+        # The ring's views are only valid until the next await, so copy them now.
+        block = batch.samples.astype(np.float64)
+        block, index, long_gaps = gaps.repair_batch(block, batch.lost)
+        times = batch.ts.copy() if index is None else batch.ts[index]
+        for row, lost in long_gaps:
+            print(f"{prefix}[Gap] {lost} samples lost; the step whose FPA buffer holds the gap will be discarded")
+        long_gap_rows = [row for row, _ in long_gaps]
 
         # convert gyro from rad/s to deg/s for FPA algorithm
-        sensor_data = {
-            "AccelX": acc[0], "AccelY": acc[1], "AccelZ": acc[2],
-            "GyroX": math.degrees(gyr[0]),
-            "GyroY": math.degrees(gyr[1]),
-            "GyroZ": math.degrees(gyr[2]),
-        }
+        sensor_block = block.copy()
+        sensor_block[:, 3:] = np.degrees(block[:, 3:])
+        if trace is not None:
+            trace.mark("parse")
 
-        gp.update_gaitphase(sensor_data)
-        fpa.update_FPA(sensor_data, gp.gaitphase_old, gp.gaitphase)
+        events = {event.index: event for event in processor.process_block(sensor_block, trace)}
+        boundaries = dict(processor.boundaries)  # row -> step whose FPA was computed there
+        cmd_trace = None
+
+        # rows go to the log thread as raw numbers; nothing is logged while calibrating
+        first_logged = None if calibrating else 0
+        steps = []
 
         #RIGHT NOW WE PRINT. BUT LATER, WE RUN SCRIPT THAT SENDS VIB FEEDBACK COMMANDS TO SHANK COMPONENT
-        row_acc = [f"{acc[0]:.4f}", f"{acc[1]:.4f}", f"{acc[2]:.4f}"]
-        row_gyr = [f"{gyr[0]:.4f}", f"{gyr[1]:.4f}", f"{gyr[2]:.4f}"]
+        for i in range(len(block)):
+            event = events.get(i)
+            # A gap belongs to the FPA buffer its first row after the gap goes
+            # into, which closes (row included) where that step's FPA is
+            # computed. The step is reported later, when its feedback window opens.
+            while long_gap_rows and i >= long_gap_rows[0]:
+                long_gap_rows.pop(0)
+                gap_in_buffer = True
+            if i in boundaries:
+                if gap_in_buffer:
+                    gap_steps.add(boundaries[i])
+                gap_in_buffer = False
+            if event is not None and np.isnan(event.fpa) and event.step_count not in seen_steps:
+                seen_steps.add(event.step_count)
+                gap_steps.discard(event.step_count)
+                print(f"{prefix}Step {event.step_count}: no FPA, the step outlasted the FPA buffer")
+                event = None
+            if event is not None and event.step_count in gap_steps and event.step_count not in seen_steps:
+                seen_steps.add(event.step_count)
+                gap_steps.discard(event.step_count)
+                gaps.invalid_steps.append(event.step_count)
+                print(f"{prefix}[Gap] Step {event.step_count}: FPA discarded, its buffer spans a gap")
+                event = None
+            if event is not None and swap_step is not None and event.step_count not in seen_steps:
+                if event.step_count == swap_step + 1:
+                    seen_steps.add(event.step_count)
+                    print(f"{prefix}[Config] Step {event.step_count}: FPA discarded, its window straddles the algorithm switch")
+                    event = None
+                else:
+                    swap_step = None
+            if event is not None and config is not None and event.step_count not in seen_steps:
+                live = apply_config(config, event.step_count, log, prefix)
+                if live.algorithm != algorithm and swap_step is None:
+                    swap_step = event.step_count
+
+            if calibrating:
+                elapsed = clock() - start_time
+
+                if event is not None and event.step_count not in seen_steps:
+                    seen_steps.add(event.step_count)
+                    calibration.add(event.fpa)
+                    print(f"{prefix}[Calibration] Step {event.step_count}: FPA = {event.fpa:.1f} deg  elapsed={elapsed:.1f}s")
+
+                if calibration.done(elapsed):
+                    base = save_base_fpa(calibration, elapsed, profiles, user, fpa.is_right_foot, log, prefix)
+                    if base is None:
+                        return
+
+                    # Switch to feedback mode
+                    calibrating = False
+                    first_logged = i + 1
+                    seen_steps = set()
+                    print(f"{prefix}Starting feedback...")
+            else:
+                if event is not None and event.step_count not in seen_steps:
+                    seen_steps.add(event.step_count)
+                    print(f"{prefix}Step {event.step_count}: FPA = {event.fpa:.1f} deg  rate={ring.packet_rate():.1f} Hz")
+
+                    diff = event.fpa - base
+                    if trace is not None:
+                        cmd_trace = trace.copy()
+                    cmd = lra_feedback(diff, scheduler, event.step_count, cmd_trace, label, live)
+                    if cmd is not None:
+                        drv_id, effect = cmd[0], cmd[1:]
+                        steps.append((i - first_logged, event.step_count, event.fpa, f"DRV{drv_id}", effect))
+                    else:
+                        steps.append((i - first_logged, event.step_count, event.fpa, "", ""))
+
+        if first_logged is not None and first_logged < len(block):
+            if index is None:
+                log.write(times[first_logged:], block[first_logged:], steps)
+            else:
+                # only received samples are logged; rows filled in by the gap
+                # policy feed GaitPhase/FPA but would pass for measurements in
+                # the CSV. A step on a filled row goes on the next received one.
+                received = np.append(index[1:] != index[:-1], True)[first_logged:]
+                kept = np.flatnonzero(received)
+                steps = [(int(np.searchsorted(kept, row)), *mark) for row, *mark in steps]
+                log.write(times[first_logged:][kept], block[first_logged:][kept], steps)
+
+        # commands record their own trace once written; every batch records up to "fpa"
+        if trace is not None:
+            latency.record(trace)
+
+        if live is not None and live.algorithm != algorithm:
+            algorithm = live.algorithm
+            gp, fpa = swap_algorithm(algorithm, gp, fpa)
+            processor = make_step_processor(gp, fpa)
+            path = "v2 batch" if isinstance(processor, BatchStepProcessor) else "v1 per-sample"
+            print(f"{prefix}[Config] Algorithm '{algorithm}' running on the {path} path from step {swap_step + 2}")
+
+async def edge_consumer(steps: EdgeAssembler, fpa: FPA, log: SessionLog, scheduler: CommandScheduler, latency: LatencyTracker = None, clock=None, base_fpa_file=BASE_FPA_FILE, label="", gaps: GapPolicy = None, profiles: ProfileStore = None, user=None, config: AppliedConfig = None):
+    # Edge mode (edge_steps.py): the foot board segments steps itself, so each
+    # item is one whole step and there is no gait phase to run here. Only the
+    # rows each step was computed from are logged, the step on its last row.
+    # Reloaded settings, a new algorithm included, apply from the next step.
+    if clock is None:
+        clock = asyncio.get_running_loop().time
+    if gaps is None:
+        gaps = GapPolicy(GAP_INTERPOLATE_MAX_SAMPLES)
+    if not supports_edge(fpa):
+        # e.g. streaming: it filters each stride from its first sample, and the
+        # board sends only the window tail that update_FPA_step needs
+        raise ValueError(
+            f"ALGORITHM '{ALGORITHM}' cannot compute FPA from edge-mode steps (no update_FPA_step); "
+            "use 'sage_motion', or set EDGE_MODE = False in Wearable/foot_mounted_wearable.py"
+        )
+    if profiles is None:
+        profiles = ProfileStore(PROFILE_FILE)
+    prefix = f"[{label}] " if label else ""
+    start_time = clock()
+    calibration = new_calibration()
+    calibrating = CALIBRATION
+
+    algorithm = ALGORITHM
+    refused = None  # a reloaded algorithm without edge support
+
+    base = None
+    if not calibrating:
+        base = load_base_fpa(profiles, user, fpa.is_right_foot, base_fpa_file, log, prefix)
+    print(f"{prefix}Algorithm '{ALGORITHM}' running on the edge path (steps segmented on the IMU board)")
+
+    while True:
+        step = await steps.get()
+        if step is None:
+            return
+        trace = Trace(step.t_notify) if latency is not None else None
+        if trace is not None:
+            trace.mark("dequeue")
+        block = step.samples.astype(np.float64)
+        sensor_block = block.copy()
+        sensor_block[:, 3:] = np.degrees(block[:, 3:])
+        if trace is not None:
+            trace.mark("parse")
+
+        if step.missing:
+            # rows that never arrived are zeros; the FPA would be wrong
+            gaps.invalid_steps.append(step.step)
+            print(f"{prefix}[Gap] Step {step.step}: FPA discarded, {step.missing} of its samples were lost")
+            if trace is not None:
+                latency.record(trace)
+            continue
+        live = apply_config(config, step.step, log, prefix)
+        if live is not None and live.algorithm not in (algorithm, refused):
+            _, new_fpa = swap_algorithm(live.algorithm, None, fpa)
+            if supports_edge(new_fpa):
+                algorithm, fpa = live.algorithm, new_fpa
+                print(f"{prefix}[Config] Algorithm '{algorithm}' running on the edge path from step {step.step}")
+            else:
+                refused = live.algorithm
+                print(f"{prefix}[Config] algorithm '{refused}' cannot compute FPA from edge-mode steps; keeping '{algorithm}'")
+        step_fpa = fpa.update_FPA_step(sensor_block, step.length)
+        if trace is not None:
+            trace.mark("fpa")
+        if np.isnan(step_fpa):
+            print(f"{prefix}Step {step.step}: no FPA, the step outlasted the FPA buffer")
+            if trace is not None:
+                latency.record(trace)
+            continue
 
         if calibrating:
-            elapsed = asyncio.get_running_loop().time() - start_time
-
-            if gp.in_feedback_window and gp.step_count not in seen_steps:
-                seen_steps.add(gp.step_count)
-                calibration_fpas.append(fpa.FPA_this_step)
-                print(f"[Calibration] Step {gp.step_count}: FPA = {fpa.FPA_this_step:.1f} deg  elapsed={elapsed:.1f}s")
-
-            if elapsed >= CALIBRATION_DURATION:
-                if calibration_fpas:
-                    avg_fpa = sum(calibration_fpas) / len(calibration_fpas)
-                    with open("base_fpa.csv", "w", newline="") as cal_f:
-                        cal_writer = csv.writer(cal_f)
-                        cal_writer.writerow(["base_fpa"])
-                        cal_writer.writerow([f"{avg_fpa:.4f}"])
-                    print(f"Calibration complete. Average FPA = {avg_fpa:.2f} deg ({len(calibration_fpas)} steps) written to base_fpa.csv")
-                    base = avg_fpa
-                else:
-                    print("Calibration complete but no FPA values were collected.")
+            elapsed = clock() - start_time
+            calibration.add(step_fpa)
+            print(f"{prefix}[Calibration] Step {step.step}: FPA = {step_fpa:.1f} deg  elapsed={elapsed:.1f}s")
+            if calibration.done(elapsed):
+                base = save_base_fpa(calibration, elapsed, profiles, user, fpa.is_right_foot, log, prefix)
+                if base is None:
                     return
+                calibrating = False
+                print(f"{prefix}Starting feedback...")
+            if trace is not None:
+                latency.record(trace)
+            continue
+
+        print(f"{prefix}Step {step.step}: FPA = {step_fpa:.1f} deg ({len(block)} of {step.length} samples sent)")
+        cmd = lra_feedback(step_fpa - base, scheduler, step.step, trace.copy() if trace is not None else None, label, live)
+        row = len(block) - 1
+        if cmd is not None:
+            log.write(step.ts, block, [(row, step.step, step_fpa, f"DRV{cmd[0]}", cmd[1:])])
+        else:
+            log.write(step.ts, block, [(row, step.step, step_fpa, "", "")])
+        if trace is not None:
+            latency.record(trace)
+
+
+def feedback_settings(base, is_right_foot, enable, live: LiveConfig = None):
+    # the "c" message that configures on-device feedback on the foot board
+    # (Wearable/foot_mounted_wearable.py): base FPA, thresholds, foot, on/off
+    toe_out = FEEDBACK_TOE_OUT_THRESHOLD_DEG if live is None else live.toe_out
+    toe_in = FEEDBACK_TOE_IN_THRESHOLD_DEG if live is None else live.toe_in
+    return f"c{base:.2f},{toe_out},{toe_in},{int(is_right_foot)},{int(enable)}\n".encode()
+
+
+async def event_consumer(steps: EdgeAssembler, log: SessionLog, configure=None, clock=None, is_right_foot=IS_RIGHT_FOOT, base_fpa_file=BASE_FPA_FILE, label="", profiles: ProfileStore = None, user=None, config: AppliedConfig = None):
+    # On-device feedback: the foot board computes each step's FPA and cues the
+    # shank board itself, so the laptop is off the critical path. It only sends
+    # the board its settings (configure: BLEConnection.write, None in replays),
+    # runs calibration from the boards' FPAs and logs one row per step, with no
+    # samples. Reloaded thresholds are sent to the board at the next step.
+    if clock is None:
+        clock = asyncio.get_running_loop().time
+    if profiles is None:
+        profiles = ProfileStore(PROFILE_FILE)
+    prefix = f"[{label}] " if label else ""
+    start_time = clock()
+    calibration = new_calibration()
+    calibrating = CALIBRATION
+    live = config.current if config is not None else None
 
-                # Switch to feedback mode
+    if calibrating:
+        settings = feedback_settings(0.0, is_right_foot, False, live)
+    else:
+        base = load_base_fpa(profiles, user, is_right_foot, base_fpa_file, log, prefix)
+        settings = feedback_settings(base, is_right_foot, True, live)
+    if configure is not None:
+        await configure(settings)
+    print(f"{prefix}Feedback runs on the IMU board; logging its step events")
+    no_samples = np.full((1, 6), np.nan, dtype=np.float32)
+
+    while True:
+        step = await steps.get()
+        if step is None:
+            return
+        if not isinstance(step, FeedbackStep):
+            continue
+        latest = apply_config(config, step.step, log, prefix)
+        if latest is not live:
+            live = latest
+            if configure is not None and not calibrating:
+                await configure(feedback_settings(base, is_right_foot, True, live))
+        if calibrating:
+            elapsed = clock() - start_time
+            calibration.add(step.fpa)
+            print(f"{prefix}[Calibration] Step {step.step}: FPA = {step.fpa:.1f} deg  elapsed={elapsed:.1f}s")
+            if calibration.done(elapsed):
+                base = save_base_fpa(calibration, elapsed, profiles, user, is_right_foot, log, prefix)
+                if base is None:
+                    return
                 calibrating = False
-                seen_steps = set()
-                print("Starting feedback...")
+                if configure is not None:
+                    await configure(feedback_settings(base, is_right_foot, True, live))
+                print(f"{prefix}Starting feedback...")
+            continue
+
+        if step.drv and step.link:
+            print(f"{prefix}Step {step.step}: FPA = {step.fpa:.1f} deg, board cued drv{step.drv} in {step.cue_ms} ms")
+            log.write(np.array([step.ts]), no_samples, [(0, step.step, step.fpa, f"DRV{step.drv}", "")])
         else:
-            if gp.in_feedback_window and gp.step_count not in seen_steps:
-                seen_steps.add(gp.step_count)
-                print(f"Step {gp.step_count}: FPA = {fpa.FPA_this_step:.1f} deg  rate={rate:.1f} Hz")
-
-                diff = fpa.FPA_this_step - base
-                cmd = lra_feedback(diff, cmd_queue)
-                if cmd is not None:
-                    drv_id, effect = cmd[0], cmd[1:]
-                    writer.writerow([ts, gp.step_count, f"{fpa.FPA_this_step:.1f}", f"DRV{drv_id}", effect] + row_acc + row_gyr)
-                else:
-                    writer.writerow([ts, gp.step_count, f"{fpa.FPA_this_step:.1f}", "", ""] + row_acc + row_gyr)
+            note = " (shank board not linked)" if step.drv else ""
+            print(f"{prefix}Step {step.step}: FPA = {step.fpa:.1f} deg{note}")
+            log.write(np.array([step.ts]), no_samples, [(0, step.step, step.fpa, "", "")])
+
+
+class Wearer:
+    # One IMU/LRA board pair and the person wearing it.
+    # imu and lra match either the BLE address or the advertised name.
+    def __init__(self, user, imu, lra, is_right_foot=IS_RIGHT_FOOT, base_fpa_file=BASE_FPA_FILE):
+        self.user = user
+        self.imu = imu
+        self.lra = lra
+        self.is_right_foot = is_right_foot
+        self.base_fpa_file = base_fpa_file
+
+
+def load_wearers(path):
+    # devices.json: {"wearers": [{"user", "imu", "lra", "is_right_foot"?, "base_fpa_file"?}, ...]}
+    # (base_fpa_file: the baseline to fall back on until the wearer has a profile)
+    with open(path) as f:
+        entries = json.load(f)["wearers"]
+    wearers = [Wearer(**entry) for entry in entries]
+    users = [w.user for w in wearers]
+    if len(set(users)) != len(users):
+        raise ValueError(f"duplicate user in {path}: {users}")
+    return wearers
+
+
+class WearerPipeline:
+    # Everything one wearer needs: queues, algorithm instances, BLE links, log and stats.
+    # Pipelines share the event loop and nothing else.
+
+    def __init__(self, wearer: Wearer, csv_file, discovery: Discovery, profiles: ProfileStore, capture=False, started=None, watcher: ConfigWatcher = None):
+        self.wearer = wearer
+        self.discovery = discovery  # board names to addresses, shared by all pipelines
+        self.profiles = profiles    # calibrated baselines, shared by all pipelines
+        self.config = AppliedConfig(watcher) if watcher is not None else None  # hot-reloaded settings
+        self.started = perf_clock() if started is None else started  # launch, for the startup metrics
+        self.label = wearer.user or ""
+        self.csv_file = csv_file
+        # LOG_FORMAT "fpab" swaps the CSV for a binary log (fpab.py) with the same rows
+        self.log_file = csv_file if LOG_FORMAT == "csv" else csv_file.replace(".csv", ".fpab")
+        self.latency_file = csv_file.replace(".csv", "_latency.json")
+        self.loss_file = csv_file.replace(".csv", "_loss.json")
+        self.ring = IngestRing(INGEST_RING_CAPACITY, overflow=INGEST_OVERFLOW)
+        self.scheduler = CommandScheduler(
+            max_age=LRA_COMMAND_MAX_AGE, min_interval=LRA_MIN_INTERVAL, preempt=LRA_PREEMPT, ack=LRA_ACK,
+        )
+        self.latency = LatencyTracker()
+        self.gaps = GapPolicy(GAP_INTERPOLATE_MAX_SAMPLES)
+        self.datarate = DATA_RATE  # replaced by the IMU's reported rate in consume()
+        self.gp = None   # GaitPhase and FPA, built at that rate in consume()
+        self.fpa = None
+        self.edge = EdgeAssembler()
+        self.conn = BLEConnection(ring=self.ring, edge=self.edge, sync_interval=CLOCK_SYNC_INTERVAL)
+        self.lra_conn = BLEConnection(latency=self.latency, sync_interval=CLOCK_SYNC_INTERVAL)
+        for conn in (self.conn, self.lra_conn):
+            conn.connect_timeout = CONNECT_TIMEOUT
+            conn.reconnect_delay, conn.reconnect_max = RECONNECT_DELAY, RECONNECT_MAX_DELAY
+            conn.rescan_after = RECONNECT_RESCAN_AFTER
+        if capture:
+            from replay import CaptureWriter
+            self.conn.capture = CaptureWriter(csv_file.replace(".csv", "_capture.bin"))
+        self.log = None  # SessionLog, opened by run()
+        self.imu_address = None
+        self.lra_address = None
+
+    def stats(self):
+        return {
+            "packet_rate_hz": round(self.conn.calc_packet_rate(), 1),
+            "packets": self.conn.packets,
+            "ingest": self.ring.stats(),
+            "commands": self.scheduler.stats(),
+            "edge": self.edge.stats() if self.edge_mode() else None,
+            "clock_sync": self.sync_stats(),
+            "startup": self.startup_stats(),
+            "traces": self.latency.count,
+            "stages": self.latency.summary(),
+            "log": self.log.stats() if self.log is not None else None,
+            "config": self.config_stats(),
+        }
 
-            else:
-                writer.writerow([ts, "", "", "", ""] + row_acc + row_gyr)
-
-
-async def main():
-    addresses = await find_devices()
-    if not addresses:
-        print("Device not found.")
-        return
-    elif len(addresses) == 1:
-        print("Only one device connected.")
-    elif len(addresses) == 2:
-        print(f"Both devices connected! {', '.join(f'{name} ({addr})' for addr, name in addresses)}")
-
-    packet_queue = asyncio.Queue()
-    cmd_queue = asyncio.Queue()
-    gp  = GaitPhase(datarate=DATA_RATE)
-    fpa = FPA(is_right_foot=IS_RIGHT_FOOT, datarate=DATA_RATE)
-
-    conn = BLEConnection(packet_queue=packet_queue)
-    lra_conn = BLEConnection()
-
-    imu_mcu, lra_mcu = None, None
-
-    for addr, name in addresses:
-        if name == "CIRCUITPY4f33":
-            imu_mcu = addr
-            print("Assigned imu_mcu address")
-        elif name == "CIRCUITPY174d":
-            lra_mcu = addr
-            print("Assigned lra_mcu address")
-
-    if lra_mcu == None:
-        print("Did not connect to LRA")
-        return
-
-    if imu_mcu == None:
-        print("Did not connect to IMU")
-        return
-
-    with open(CSV_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["time", "step num", "fpa", "drv", "effect", "ax (m/s2)", "ay (m/s2)", "az (m/s2)", "gx (rad/s)", "gy (rad/s)", "gz (rad/s)"])
-        await asyncio.gather(
-            conn.connect_and_read(imu_mcu),
-            lra_conn.connect_and_write(lra_mcu, cmd_queue),
-            fpa_consumer(packet_queue, gp, fpa, writer, cmd_queue),
+    def config_stats(self):
+        # reloads of config.json and the changes this pipeline took up, None without hot reload
+        if self.config is None:
+            return None
+        return dict(self.config.watcher.stats(), changes=self.config.changes)
+
+    def edge_mode(self):
+        info = self.conn.device_info
+        return info is not None and (info.edge or info.feedback)
+
+    def sync_stats(self):
+        # round trips, drift and uplink latency per board, None without CLOCK_SYNC_INTERVAL
+        if self.conn.sync is None:
+            return None
+        return {"imu": self.conn.sync.stats(), "lra": self.lra_conn.sync.stats()}
+
+    def startup_stats(self):
+        # seconds from launch to each board connecting and to the first sample
+        def since(t):
+            return round(t - self.started, 3) if t is not None else None
+        return {
+            "scan_s": round(self.discovery.scan_time, 3),
+            "imu_cached": self.wearer.imu in self.discovery.cached,
+            "lra_cached": self.wearer.lra in self.discovery.cached,
+            "imu_connect_s": since(self.conn.connected_at),
+            "lra_connect_s": since(self.lra_conn.connected_at),
+            "first_sample_s": since(self.conn.first_sample_at),
+        }
+
+    async def report_startup(self):
+        await self.conn.first_sample.wait()
+        startup = self.startup_stats()
+        self.log.meta(startup=startup)
+        prefix = f"[{self.label}] " if self.label else ""
+        print(f"{prefix}[Startup] first sample {startup['first_sample_s']:.2f} s after launch "
+              f"(IMU connected at {startup['imu_connect_s']} s, LRA at {startup['lra_connect_s']} s, "
+              f"{startup['scan_s']} s scanning)")
+
+    def rescan(self, target):
+        # for BLEConnection.connect: look for target again if its address fails
+        return lambda: self.discovery.rescan(target)
+
+    def loss_stats(self):
+        info = self.conn.device_info
+        return {
+            "packets": self.conn.packets,
+            "device": info._asdict() if info is not None else None,
+            "sequence": self.conn.sequence.stats(),
+            "gaps": self.gaps.stats(),
+            "links": {"imu": self.conn.link_stats(), "lra": self.lra_conn.link_stats()},
+        }
+
+    async def consume(self):
+        # samples wait in the ring until the IMU has said what rate it runs at
+        info = await self.conn.wait_device_info(DEVICE_INFO_TIMEOUT)
+        self.datarate = sample_rate(info)
+        prefix = f"[{self.label}] " if self.label else ""
+        if info is None:
+            print(f"{prefix}IMU did not report its rate; using DATA_RATE = {DATA_RATE} Hz")
+        self.log.meta(datarate=self.datarate)
+        if info is not None and info.feedback:
+            await event_consumer(
+                self.edge, self.log, self.conn.write, is_right_foot=self.wearer.is_right_foot,
+                base_fpa_file=self.wearer.base_fpa_file, label=self.label,
+                profiles=self.profiles, user=self.wearer.user, config=self.config,
+            )
+            return
+        self.gp = GaitPhase(datarate=self.datarate)
+        self.fpa = FPA(is_right_foot=self.wearer.is_right_foot, datarate=self.datarate)
+        if info is not None and info.edge:
+            await edge_consumer(
+                self.edge, self.fpa, self.log, self.scheduler, self.latency,
+                base_fpa_file=self.wearer.base_fpa_file, label=self.label, gaps=self.gaps,
+                profiles=self.profiles, user=self.wearer.user, config=self.config,
+            )
+            return
+        await fpa_consumer(
+            self.ring, self.gp, self.fpa, self.log, self.scheduler, self.latency,
+            base_fpa_file=self.wearer.base_fpa_file, label=self.label, gaps=self.gaps,
+            profiles=self.profiles, user=self.wearer.user, config=self.config,
         )
 
+    async def drive_lra(self, lra_address):
+        # the shank board link, found and connected alongside the IMU board;
+        # given up if the IMU board turns out to drive the shank board itself
+        link = asyncio.create_task(self.link_lra(lra_address))
+        info = await self.conn.wait_device_info(DEVICE_INFO_TIMEOUT)
+        if info is not None and info.feedback:
+            link.cancel()
+            await asyncio.gather(link, return_exceptions=True)
+            return
+        await link
+
+    async def link_lra(self, lra_address):
+        self.lra_address = await lra_address
+        if self.lra_address is None:
+            prefix = f"[{self.label}] " if self.label else ""
+            print(f"{prefix}Did not connect to LRA")
+            return
+        await self.lra_conn.connect_and_write(self.lra_address, self.scheduler, self.rescan(self.wearer.lra))
+
+    async def run(self):
+        lra_address = asyncio.ensure_future(self.discovery.find(self.wearer.lra))  # looked for alongside the IMU
+        self.imu_address = await self.discovery.find(self.wearer.imu)
+        if self.imu_address is None:
+            lra_address.cancel()
+            print(f"{'[' + self.label + '] ' if self.label else ''}Did not connect to IMU")
+            return
+        self.log = open_session_log(self.log_file, CSV_HEADER, meta={
+            "algorithm": ALGORITHM,
+            "config": _cfg,
+            "user": self.wearer.user,
+            "is_right_foot": self.wearer.is_right_foot,
+            "started": datetime.now().isoformat(timespec="seconds"),
+        })
+        try:
+            await asyncio.gather(
+                self.conn.connect_and_read(self.imu_address, self.rescan(self.wearer.imu)),
+                self.drive_lra(lra_address),
+                self.consume(),
+                self.report_startup(),
+            )
+        finally:
+            self.log.meta(clock_sync=self.sync_stats(), startup=self.startup_stats())
+            self.log.close()
+            if self.conn.capture is not None:
+                self.conn.capture.close()
+            with open(self.latency_file, "w") as stats_f:
+                json.dump(self.stats(), stats_f, indent=2)
+            with open(self.loss_file, "w") as loss_f:
+                json.dump(self.loss_stats(), loss_f, indent=2)
+            prefix = f" {self.label}" if self.label else ""
+            print(f"[Latency{prefix}] stats written to {self.latency_file}\n{self.latency.format()}")
+            print(f"[Loss{prefix}] {self.loss_stats()['sequence']} written to {self.loss_file}")
+            print(f"[Log{prefix}] {self.log.rows} rows, queue high-water {self.log.high_water}/{self.log.max_queue}, {self.log.dropped_rows} dropped")
+
+
+async def run_pipeline(pipeline: WearerPipeline):
+    # One wearer's session. An error ends that session only: it is printed as
+    # it happens and returned, while the other wearers keep logging and cueing.
+    try:
+        await pipeline.run()
+    except Exception as e:
+        prefix = f"[{pipeline.label}] " if pipeline.label else ""
+        print(f"{prefix}Session stopped by an error: {type(e).__name__}: {e}")
+        traceback.print_exc()
+        return e
+    return None
+
+
+async def report_pipelines(pipelines, interval):
+    while True:
+        await asyncio.sleep(interval)
+        for p in pipelines:
+            prefix = f" {p.label}" if p.label else ""
+            print(
+                f"[Latency{prefix}] rate={p.conn.calc_packet_rate():.1f} Hz  packets={p.conn.packets}  "
+                f"ring={len(p.ring)} (high-water {p.ring.high_water}, dropped {p.ring.dropped_samples})  "
+                f"commands={p.scheduler.stats()}\n{p.latency.format()}"
+            )
+            if p.conn.sync is not None:
+                print(f"[Clock{prefix}] {p.sync_stats()}")
+
+
+async def main(capture=False, registry=None):
+    # Without a registry: the single wearer from config.json on the default boards.
+    # With one: every wearer in devices.json, one pipeline each, on one event loop.
+    # Boards seen before are connected to straight away at their cached
+    # address; the others are picked out of one shared scan as they appear,
+    # and each board connects as soon as its address is known.
+    started = perf_clock()
+    if registry is None:
+        wearers = [Wearer(None, "CIRCUITPY4f33", "CIRCUITPY174d")]
+    else:
+        wearers = load_wearers(registry)
+
+    discovery = Discovery(DeviceCache(DEVICE_CACHE_FILE), SCAN_TIMEOUT)
+    profiles = ProfileStore(PROFILE_FILE)
+    # config.json is watched for threshold (and, optionally, algorithm) changes
+    watcher = None
+    if CONFIG_RELOAD_INTERVAL:
+        watcher = ConfigWatcher(CONFIG_FILE, _cfg, CONFIG_RELOAD_INTERVAL, CONFIG_RELOAD_ALGORITHM)
+    pipelines = []
+    for wearer in wearers:
+        csv_file = CSV_FILE if wearer.user is None else CSV_FILE.replace(".csv", f"_{wearer.user}.csv")
+        pipelines.append(WearerPipeline(wearer, csv_file, discovery, profiles, capture=capture, started=started, watcher=watcher))
+
+    tasks = [asyncio.create_task(report_pipelines(pipelines, LATENCY_REPORT_INTERVAL))]
+    if watcher is not None:
+        tasks.append(asyncio.create_task(watcher.watch()))
+    try:
+        errors = await asyncio.gather(*(run_pipeline(pipeline) for pipeline in pipelines))
+    finally:
+        for task in tasks:
+            task.cancel()
+    failed = [f"{p.label or 'default'} ({type(e).__name__}: {e})" for p, e in zip(pipelines, errors) if e is not None]
+    if failed:
+        print(f"[Session] {len(failed)} of {len(pipelines)} wearer(s) stopped by an error: {'; '.join(failed)}")
+    return errors
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", metavar="LOG", help="replay a recorded fpa_log CSV or _capture.bin instead of connecting over BLE")
+    parser.add_argument("--out", help="log file for --replay (default: output/replay_<name>.csv)")
+    parser.add_argument("--capture", action="store_true", help="also record raw BLE notifications to output/fpa_log_<timestamp>_capture.bin")
+    parser.add_argument("--devices", metavar="REGISTRY", help="serve every wearer listed in a devices.json registry")
+    args = parser.parse_args()
+
+    if args.replay:
+        from replay import replay
+        asyncio.run(replay(args.replay, args.out))
+    else:
+        asyncio.run(main(capture=args.capture, registry=args.devices))
@@ -0,0 +1,193 @@
+# Session log written off the event loop.
+#
+# fpa_consumer hands each packet's rows to SessionLog.write() as a raw (N, 6)
+# array plus the step annotations that land in it; a background thread formats
+# them into the same CSV rows run_device used to write inline and flushes them
+# in large blocks, every flush_rows rows or flush_interval seconds.
+#
+# write() never blocks the event loop. If the thread falls max_queue writes
+# behind (a stalled disk), further writes are dropped and counted
+# (dropped_writes/dropped_rows in stats()) until it catches up: BLE handling and
+# LRA commands keep running, and the gap shows in the stats rather than as a
+# stall. Metadata is never dropped.
+# BinarySessionLog writes the same rows to an .fpab file instead (see fpab.py).
+# Session metadata (meta(): base FPA, calibration, config changes, ...) goes
+# through the same queue, so it stays in order with the rows. The CSV log
+# keeps it in a <log>_meta.json next to the CSV, rewritten on every update;
+# the binary log keeps it in the file.
+#
+#   log = SessionLog("output/fpa_log.csv", CSV_HEADER)
+#   log.write(times, block, [(row, step, fpa, drv, effect)])
+#   log.close()  # drains the queue and flushes; also on Ctrl+C via finally
+
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from fpab import STEP_DTYPE, FpabWriter
+
+
+class SessionLog:
+    def __init__(self, path, header, meta=None, max_queue=1024, flush_rows=4096, flush_interval=1.0):
+        self.path = path
+        self._meta = dict(meta or {})
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue = queue.Queue()  # bounded by max_queue in write(), not here
+        self.rows = 0
+        self.flushes = 0
+        self.high_water = 0      # deepest the queue has been
+        self.dropped_writes = 0  # writes dropped while the queue was full
+        self.dropped_rows = 0
+        self._open(path, header)
+        self._thread = threading.Thread(target=self._run, name=f"SessionLog({path})", daemon=True)
+        self._thread.start()
+
+    def write(self, times, block, steps=()):
+        # times: (N,) host timestamps; block: (N, 6) [ax, ay, az, gx, gy, gz];
+        # steps: (row, step_count, fpa, drv, effect) for rows that carry a step.
+        # The thread reads both arrays later, so pass copies, not ring views.
+        if self._queue.qsize() >= self.max_queue:
+            self.dropped_writes += 1
+            self.dropped_rows += len(block)
+            return
+        self._put((times, block, steps))
+
+    def meta(self, **fields):
+        # session metadata such as base_fpa, merged over what is there
+        self._put((fields,))
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._close()
+
+    def stats(self):
+        return {
+            "rows": self.rows,
+            "flushes": self.flushes,
+            "queue_high_water": self.high_water,
+            "queue_capacity": self.max_queue,
+            "dropped_writes": self.dropped_writes,
+            "dropped_rows": self.dropped_rows,
+        }
+
+    def _put(self, item):
+        self._queue.put_nowait(item)
+        depth = self._queue.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+
+    def _run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False  # time trigger only
+            if item is None:
+                break
+            if item:
+                added = self._add(*item)
+                pending += added
+                self.rows += added
+            if pending and (pending >= self.flush_rows or time.monotonic() - last_flush >= self.flush_interval):
+                self._flush()
+                self.flushes += 1
+                pending = 0
+                last_flush = time.monotonic()
+        if pending:
+            self._flush()
+            self.flushes += 1
+
+    # CSV sink: the fpa_log layout Data_Processing reads
+
+    def _open(self, path, header):
+        self._f = open(path, "w", newline="")
+        csv.writer(self._f).writerow(header)
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+        self.meta_path = os.path.splitext(path)[0] + "_meta.json"
+        self._write_meta()
+
+    def _write_meta(self):
+        # write-then-rename, so a reader never sees half a file
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._meta, f, indent=2)
+        os.replace(tmp, self.meta_path)
+
+    def _add(self, *item):
+        if len(item) == 1:
+            self._meta.update(item[0])
+            self._write_meta()
+            return 0
+        times, block, steps = item
+        marks = {row: (step, f"{fpa:.1f}", drv, effect) for row, step, fpa, drv, effect in steps}
+        blank = ("", "", "", "")
+        for i, (ts, (ax, ay, az, gx, gy, gz)) in enumerate(zip(times.tolist(), block.tolist())):
+            self._writer.writerow([ts, *marks.get(i, blank), f"{ax:.4f}", f"{ay:.4f}", f"{az:.4f}", f"{gx:.4f}", f"{gy:.4f}", f"{gz:.4f}"])
+        return len(block)
+
+    def _flush(self):
+        self._f.write(self._buf.getvalue())
+        self._f.flush()
+        self._buf.seek(0)
+        self._buf.truncate()
+
+    def _close(self):
+        self._f.close()
+
+
+class BinarySessionLog(SessionLog):
+    # Same interface, written as .fpab chunks: one SAMP and one STEP chunk per flush.
+
+    def __init__(self, path, header, meta=None, **kwargs):
+        super().__init__(path, header, meta=dict(meta or {}, csv_header=list(header)), **kwargs)
+
+    def _open(self, path, header):
+        self._file = FpabWriter(path, self._meta)
+        self._pending = []
+
+    def _add(self, *item):
+        if len(item) == 1:
+            self._flush()  # keep metadata ordered with the rows around it
+            self._file.update_meta(item[0])
+            return 0
+        self._pending.append(item)
+        return len(item[1])
+
+    def _flush(self):
+        if not self._pending:
+            return
+        first_row = self._file.rows
+        times, blocks, steps = [], [], []
+        for ts, block, marks in self._pending:
+            for row, step, fpa, drv, effect in marks:
+                steps.append((first_row + row, ts[row], step, fpa, drv, effect))
+            times.append(ts)
+            blocks.append(block)
+            first_row += len(block)
+        self._pending = []
+        self._file.append(np.concatenate(times), np.concatenate(blocks), np.array(steps, dtype=STEP_DTYPE))
+
+    def _close(self):
+        self._file.close()
+
+
+def open_session_log(path, header, meta=None):
+    # .fpab paths get the binary log, anything else the CSV one
+    if path.endswith(".fpab"):
+        return BinarySessionLog(path, header, meta=meta)
+    return SessionLog(path, header, meta=meta)
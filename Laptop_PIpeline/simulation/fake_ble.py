@@ -0,0 +1,419 @@
+# In-process stand-ins for bleak's BleakScanner and BleakClient.
+#
+# install() swaps them into the bluetooth module, so Discovery and
+# BLEConnection run unchanged against fake boards:
+#   - FakeIMUBoard streams a GaitRecording as notifications at its data rate,
+#     either one legacy 24-byte sample each or framed (imu_packet.py) like the
+#     firmware: up to frame_samples per notification, flushed after max_frame_age,
+#     with the recording's rate reported first as a device info payload; with
+#     edge=True it segments steps like the firmware's edge mode and sends only
+#     step tails, step headers and keepalives (edge_steps.py); with
+#     feedback=True it computes each step's FPA itself, cues its shank board
+#     (a FakeLRABoard) directly and sends only step events, like the firmware's
+#     EDGE_FEEDBACK mode
+#   - FakeLRABoard records every write and acks tagged commands like the shank
+#     firmware ("ack <tag> play <ms> <ticks>")
+#   - FakeBleakScanner reports each board not already connected once every
+#     advertise_interval to its detection callback, like advertisements;
+#     FakeBleakClient cannot connect to a board that is gone or already held
+#   - drop(outage) breaks a board's link and keeps it out of reach for outage
+#     seconds, as if it had left radio range; the IMU board's sample counter
+#     keeps running meanwhile, like the firmware's
+#   - both answer clock sync pings ("p<seq>"; clock_sync.py) with their clock:
+#     samples taken so far for the IMU board, loop time in ms for the LRA board
+#
+#   import bluetooth
+#   from simulation.fake_ble import FakeIMUBoard, FakeLRABoard, install
+#   install(bluetooth, [FakeIMUBoard("CIRCUITPY4f33", recording), FakeLRABoard("CIRCUITPY174d")])
+
+import asyncio
+import itertools
+import math
+import random
+import struct
+from collections import deque
+
+import numpy as np
+from bleak.exc import BleakDeviceNotFoundError
+
+from algorithms.base import EARLY_STANCE, LATE_STANCE, MIDDLE_STANCE
+from algorithms.sage_motion.fpa import FPA
+from algorithms.sage_motion.gaitphase import GaitPhase
+from imu_packet import pack_event, pack_frame, pack_info, pack_pong, pack_step
+
+_addresses = itertools.count(1)
+TICKS_MASK = (1 << 29) - 1  # the boards' ticks_ms wraps at 2**29
+
+
+class FakeBoard:
+    def __init__(self, name, address=None):
+        self.name = name
+        if address is None:
+            n = next(_addresses)
+            address = f"FA:KE:00:00:{n >> 8:02X}:{n & 0xFF:02X}"
+        self.address = address
+        self.connected = False
+        self.back_at = 0.0  # loop time before which the board cannot be reached
+        self.disconnected_callback = None  # set by the FakeBleakClient holding the link
+        self.registry = None  # address -> board of the installed fakes, set by install()
+
+    def on_connect(self):
+        self.connected = True
+
+    def on_disconnect(self):
+        self.connected = False
+
+    def drop(self, outage, move=False):
+        # out of reach for outage seconds; with move, back at a new address
+        self.back_at = asyncio.get_running_loop().time() + outage
+        if move:
+            n = next(_addresses)
+            old, self.address = self.address, f"FA:KE:00:00:{n >> 8:02X}:{n & 0xFF:02X}"
+            if self.registry is not None:
+                del self.registry[old]
+                self.registry[self.address] = self
+        if self.connected:
+            self.on_disconnect()
+            if self.disconnected_callback is not None:
+                self.disconnected_callback()
+
+    async def start_notify(self, callback):
+        pass
+
+    async def stop_notify(self):
+        pass
+
+    def on_write(self, data):
+        pass
+
+
+class FakeIMUBoard(FakeBoard):
+    def __init__(self, name, recording, address=None, loop_recording=True, frame_samples=None, max_frame_age=0.02, loss=0.0, seed=0, edge=False, keepalive=1.0, feedback=False, shank=None):
+        super().__init__(name, address)
+        self.loss = loss  # probability that a notification never arrives
+        self.dropped = 0
+        self._rng = random.Random(seed)
+        self.recording = recording
+        self.loop_recording = loop_recording
+        self.frame_samples = frame_samples  # None: legacy one-sample payloads
+        self.max_frame_age = max_frame_age
+        self.sent = 0
+        self.frames = 0
+        self._task = None
+        self.edge = edge  # needs frame_samples
+        self.keepalive = keepalive
+        self.notifications = 0
+        self.edge_samples = 0  # samples actually sent in edge mode
+        self.feedback = feedback  # needs frame_samples
+        self.shank = shank        # FakeLRABoard cued directly in feedback mode
+        self.cues = 0
+        # the firmware's defaults until the laptop sends its "c" settings
+        self.settings = {"base": 0.0, "toe_out": -1.0, "toe_in": -9.0, "right": True, "enable": True}
+        self._callback = None
+        self._t0 = None
+
+    def payload(self, i):
+        return struct.pack("<6f", *self.recording.samples[i % len(self.recording.samples)])
+
+    def frame(self, start, count):
+        samples = self.recording.samples
+        rows = [samples[i % len(samples)] for i in range(start, start + count)]
+        return pack_frame(self.frames, start, rows)  # tick: sensor sample counter
+
+    async def start_notify(self, callback):
+        self._callback = callback
+        if self.frame_samples is not None:
+            rate = self.recording.datarate
+            callback(None, bytearray(pack_info(round(rate), rate, edge=self.edge, feedback=self.feedback)))
+        self._task = asyncio.create_task(self._stream(callback))
+
+    async def stop_notify(self):
+        self._callback = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def on_write(self, data):
+        if self._callback is None or self._t0 is None:
+            return
+        loop = asyncio.get_running_loop()
+        taken = int((loop.time() - self._t0) * self.recording.datarate)
+        for token in bytes(data).decode().split():
+            if token.startswith("p"):
+                loop.call_soon(self._callback, None, bytearray(pack_pong(int(token[1:]), taken)))
+            elif token.startswith("c"):
+                base, toe_out, toe_in, right, enable = token[1:].split(",")
+                self.settings = {"base": float(base), "toe_out": float(toe_out), "toe_in": float(toe_in),
+                                 "right": right == "1", "enable": enable == "1"}
+
+    def _notify(self, callback, payload):
+        self.notifications += 1
+        if self.loss and self._rng.random() < self.loss:
+            self.dropped += 1
+            return
+        callback(None, bytearray(payload))
+
+    async def _stream(self, callback):
+        # sends whatever is due on the wall clock, so the rate holds on average
+        # even when the event loop wakes up late
+        loop = asyncio.get_running_loop()
+        rate = self.recording.datarate
+        total = len(self.recording.samples)
+        segment = self.edge or self.feedback
+        if self._t0 is None:
+            t0 = self._t0 = loop.time()
+            if segment:
+                # the firmware's state: gait phase, the open step window, a header to send
+                self._gp = GaitPhase(datarate=rate)
+                self._window = deque(maxlen=math.ceil(3.0 * rate))
+                self._pending_step = None
+                self._window_hole = False
+                self._last_tx = t0
+                self._fpa = FPA(is_right_foot=self.settings["right"], datarate=rate)
+        elif self.feedback:
+            # back after a dropout: the firmware kept sampling and cueing
+            # without the laptop, so only the step events in between are gone
+            t0 = self._t0
+            due = int((loop.time() - t0) * rate)
+            while self.sent < due:
+                self._edge_sample(lambda sender, data: None, self.sent)
+                self.sent += 1
+        else:
+            # back after a dropout: the counter skips what was taken unlinked,
+            # and the step window the outage cut into is skipped
+            t0 = self._t0
+            self.sent = max(self.sent, int((loop.time() - t0) * rate))
+            if segment:
+                self._window.clear()
+                self._window_hole = True
+                self._pending_step = None
+        while self.connected:
+            due = int((loop.time() - t0) * rate)
+            if not self.loop_recording:
+                due = min(due, total)
+            if segment:
+                while self.sent < due:
+                    self._edge_sample(callback, self.sent)
+                    self.sent += 1
+                if loop.time() - self._last_tx >= self.keepalive:
+                    self._notify(callback, pack_step(self._gp.step_count, 0, 0, self.sent))
+                    self._last_tx = loop.time()
+            elif self.frame_samples is None:
+                while self.sent < due:
+                    self._notify(callback, self.payload(self.sent))
+                    self.sent += 1
+            else:
+                # full frames as soon as they fill, a partial one once its
+                # oldest sample has waited max_frame_age
+                oldest_age = loop.time() - t0 - self.sent / rate
+                while due - self.sent >= self.frame_samples or (due > self.sent and oldest_age >= self.max_frame_age):
+                    count = min(self.frame_samples, due - self.sent)
+                    self._notify(callback, self.frame(self.sent, count))
+                    self.sent += count
+                    self.frames += 1
+                    oldest_age = loop.time() - t0 - self.sent / rate
+            if not self.loop_recording and self.sent >= total:
+                return
+            await asyncio.sleep(min(1 / rate, 0.005))
+
+    def _edge_sample(self, callback, i):
+        row = self.recording.samples[i % len(self.recording.samples)]
+        self._window.append((i, row))
+        gp = self._gp
+        gp.update_gaitphase_gyromag(math.degrees(math.sqrt(row[3] ** 2 + row[4] ** 2 + row[5] ** 2)))
+        if self.feedback:
+            self._feedback_sample(callback, i)
+        elif gp.gaitphase_old == EARLY_STANCE and gp.gaitphase == MIDDLE_STANCE and self._window_hole:
+            self._window.clear()
+            self._window_hole = False
+        elif gp.gaitphase_old == EARLY_STANCE and gp.gaitphase == MIDDLE_STANCE:
+            # the window closes: send its tail now, the header with the feedback window
+            window = list(self._window)
+            tail = window[FPA.step_tail_start(len(window)):]
+            for k in range(0, len(tail), self.frame_samples):
+                chunk = tail[k:k + self.frame_samples]
+                self._notify(callback, pack_frame(self.frames, chunk[0][0], [r for _, r in chunk]))
+                self.frames += 1
+            self.edge_samples += len(tail)
+            self._pending_step = pack_step(gp.step_count, len(window), len(tail), tail[0][0])
+            self._window.clear()
+            self._last_tx = asyncio.get_running_loop().time()
+        elif gp.gaitphase_old == MIDDLE_STANCE and gp.gaitphase == LATE_STANCE and self._pending_step is not None:
+            self._notify(callback, self._pending_step)
+            self._pending_step = None
+
+    def _feedback_sample(self, callback, i):
+        # EDGE_FEEDBACK: the FPA when the window closes, the cue and the step
+        # event when the feedback window opens
+        gp = self._gp
+        if gp.gaitphase_old == EARLY_STANCE and gp.gaitphase == MIDDLE_STANCE:
+            window = [row for _, row in self._window]
+            tail = np.array(window[FPA.step_tail_start(len(window)):], dtype=np.float64)
+            tail[:, 3:] = np.degrees(tail[:, 3:])
+            self._fpa.is_right_foot = self.settings["right"]
+            self._pending_step = self._fpa.update_FPA_step(tail, len(window))
+            self._window.clear()
+        elif gp.gaitphase_old == MIDDLE_STANCE and gp.gaitphase == LATE_STANCE and self._pending_step is not None:
+            fpa = self._pending_step
+            diff = fpa - self.settings["base"]
+            drv = 0
+            if self.settings["enable"]:
+                drv = 1 if diff > self.settings["toe_out"] else 2 if diff < self.settings["toe_in"] else 0
+            link = self.shank is not None and self.shank.connected
+            if drv and link:
+                self.shank.on_write(f"{drv}!\n".encode())
+                self.cues += 1
+            self._notify(callback, pack_event(gp.step_count, drv, i, fpa, cue_ms=0, link=link))
+            self._pending_step = None
+            self._last_tx = asyncio.get_running_loop().time()
+
+
+class FakeLRABoard(FakeBoard):
+    def __init__(self, name, address=None, actuate_ms=1):
+        super().__init__(name, address)
+        self.writes = []  # (loop time, bytes) of command writes
+        self.pings = 0
+        self.actuate_ms = actuate_ms  # receive-to-actuate delay reported in acks
+        self._callback = None
+
+    async def start_notify(self, callback):
+        self._callback = callback
+
+    async def stop_notify(self):
+        self._callback = None
+
+    def on_write(self, data):
+        loop = asyncio.get_running_loop()
+        now_ms = int(loop.time() * 1e3)
+        if bytes(data).startswith(b"p"):
+            # clock sync ping, not a command
+            self.pings += 1
+            if self._callback is not None:
+                pong = bytearray(f"pong {bytes(data)[1:].decode().strip()} {now_ms & TICKS_MASK}\n".encode())
+                loop.call_soon(self._callback, None, pong)
+            return
+        self.writes.append((loop.time(), bytes(data)))
+        if self._callback is None:
+            return
+        # the ack comes back over the air after the motor starts, not inside the write
+        for token in bytes(data).decode().split():
+            _, _, tag = token.partition("#")
+            if tag:
+                ack = bytearray(f"ack {tag} play {self.actuate_ms} {(now_ms + self.actuate_ms) & TICKS_MASK}\n".encode())
+                loop.call_later(self.actuate_ms / 1e3, self._callback, None, ack)
+
+
+class FakeBLEDevice:
+    # what BleakScanner.discover() returns
+    def __init__(self, board):
+        self.name = board.name
+        self.address = board.address
+
+
+class FakeBleakScanner:
+    boards = {}
+    advertise_interval = 0.1  # seconds between advertisements of each board
+
+    def __init__(self, detection_callback=None, **kwargs):
+        self.detection_callback = detection_callback
+        self._task = None
+
+    @classmethod
+    async def discover(cls, timeout=5.0, **kwargs):
+        await asyncio.sleep(0)
+        return [FakeBLEDevice(board) for board in cls.boards.values()]
+
+    async def start(self):
+        self._task = asyncio.create_task(self._advertise())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _advertise(self):
+        # every board not already connected, once per advertise_interval, in a random order
+        rng = random.Random(len(self.boards))
+        while True:
+            boards = list(self.boards.values())
+            rng.shuffle(boards)
+            for board in boards:
+                await asyncio.sleep(self.advertise_interval / len(boards))
+                if not board.connected and self.detection_callback is not None:
+                    self.detection_callback(FakeBLEDevice(board), None)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+class FakeBleakClient:
+    boards = {}
+
+    def __init__(self, address_or_device, disconnected_callback=None, timeout=10.0, **kwargs):
+        self.address = getattr(address_or_device, "address", address_or_device)
+        self.board = self.boards.get(self.address)
+        self.disconnected_callback = disconnected_callback
+        self.timeout = timeout
+
+    @property
+    def is_connected(self):
+        return self.board is not None and self.board.connected
+
+    async def connect(self, **kwargs):
+        if self.board is None or self.board.connected:
+            # not advertising: bleak gives up after its scan timeout
+            await asyncio.sleep(min(self.timeout, 0.2))
+            raise BleakDeviceNotFoundError(self.address, f"Device with address {self.address} was not found.")
+        away = self.board.back_at - asyncio.get_running_loop().time()
+        if away > self.timeout:
+            await asyncio.sleep(self.timeout)
+            raise BleakDeviceNotFoundError(self.address, f"Device with address {self.address} was not found.")
+        if away > 0:
+            await asyncio.sleep(away)  # found once it advertises again
+        self.board.on_connect()
+        if self.disconnected_callback is not None:
+            self.board.disconnected_callback = lambda: self.disconnected_callback(self)
+        return True
+
+    async def disconnect(self):
+        await self.board.stop_notify()
+        self.board.on_disconnect()
+        return True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        await self.board.start_notify(callback)
+
+    async def stop_notify(self, char_specifier):
+        await self.board.stop_notify()
+
+    async def write_gatt_char(self, char_specifier, data, response=None):
+        self.board.on_write(data)
+
+
+def install(bluetooth_module, boards):
+    # Point bluetooth_module at fake classes serving these boards.
+    # Returns the previous (BleakScanner, BleakClient) for uninstall().
+    registry = {board.address: board for board in boards}
+    for board in boards:
+        board.registry = registry
+    scanner = type("FakeBleakScanner", (FakeBleakScanner,), {"boards": registry})
+    client = type("FakeBleakClient", (FakeBleakClient,), {"boards": registry})
+    previous = (bluetooth_module.BleakScanner, bluetooth_module.BleakClient)
+    bluetooth_module.BleakScanner = scanner
+    bluetooth_module.BleakClient = client
+    return previous
+
+
+def uninstall(bluetooth_module, previous):
+    bluetooth_module.BleakScanner, bluetooth_module.BleakClient = previous
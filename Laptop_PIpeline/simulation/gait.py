@@ -0,0 +1,84 @@
+# Synthetic foot IMU streams with known step timing and known FPA.
+#
+# Each stride starts with a flat-foot stance (gravity only) followed by a swing
+# in which the foot rotates about the sensor x axis and back, while accelerating
+# and decelerating in the walking direction. The walking direction in the
+# sensor's horizontal plane is set by the requested FPA, so sage_motion's
+# peak-acceleration rule recovers it; body-frame samples are the world signal
+# rotated into the tilted sensor frame, as a real IMU would measure it.
+
+import math
+
+import numpy as np
+
+GRAVITY = 9.81
+
+
+class GaitRecording:
+    def __init__(self, samples, datarate, heel_strikes, fpa_per_step):
+        self.samples = samples            # (N, 6) ax, ay, az (m/s^2), gx, gy, gz (rad/s), as sent by the MCU
+        self.datarate = datarate
+        self.heel_strikes = heel_strikes  # sample index of each heel strike
+        self.fpa_per_step = fpa_per_step  # FPA (deg) the pipeline should report for each step
+
+
+def generate_gait(
+    fpa_deg,
+    datarate=100,
+    n_steps=30,
+    stride_duration=1.1,
+    stance_fraction=0.6,
+    is_right_foot=True,
+    swing_gyro_peak=300.0,
+    swing_acc_peak=12.0,
+    acc_noise=0.05,
+    gyro_noise=0.5,
+    standing_duration=1.0,
+    seed=0,
+):
+    # fpa_deg is one angle for every step or a sequence with one angle per step.
+    # Noise is in m/s^2 and deg/s; standing_duration pads both ends with quiet stance.
+    rng = np.random.default_rng(seed)
+    fpas = np.broadcast_to(np.asarray(fpa_deg, dtype=float), (n_steps,)).copy()
+
+    stride_len = int(round(stride_duration * datarate))
+    stance_len = int(round(stance_fraction * stride_len))
+    swing_len = stride_len - stance_len
+    pad_len = int(round(standing_duration * datarate))
+    n = 2 * pad_len + n_steps * stride_len
+
+    roll = np.zeros(n)
+    roll_rate = np.zeros(n)        # deg/s about sensor x
+    acc_world = np.zeros([n, 3])
+    acc_world[:, 2] = GRAVITY
+    heel_strikes = []
+
+    u = np.arange(swing_len) / swing_len
+    swing_rate = swing_gyro_peak * np.sin(2 * np.pi * u)
+    swing_roll = swing_gyro_peak * (swing_len / datarate) / (2 * np.pi) * (1 - np.cos(2 * np.pi * u))
+    swing_acc = swing_acc_peak * np.sin(2 * np.pi * u)
+    for i_step, fpa in enumerate(fpas):
+        start = pad_len + i_step * stride_len
+        heel_strikes.append(start)
+        swing = slice(start + stance_len, start + stride_len)
+        # the pipeline negates the angle for the right foot
+        heading = math.radians(-fpa if is_right_foot else fpa)
+        roll_rate[swing] = swing_rate
+        roll[swing] = np.radians(swing_roll)
+        acc_world[swing, 0] = swing_acc * math.sin(heading)
+        acc_world[swing, 1] = swing_acc * math.cos(heading)
+
+    # body frame: Rx(roll)^T @ world
+    cos_r, sin_r = np.cos(roll), np.sin(roll)
+    acc_body = np.empty_like(acc_world)
+    acc_body[:, 0] = acc_world[:, 0]
+    acc_body[:, 1] = cos_r * acc_world[:, 1] + sin_r * acc_world[:, 2]
+    acc_body[:, 2] = -sin_r * acc_world[:, 1] + cos_r * acc_world[:, 2]
+
+    gyr = np.zeros([n, 3])
+    gyr[:, 0] = roll_rate
+    acc_body += rng.normal(0, acc_noise, acc_body.shape)
+    gyr += rng.normal(0, gyro_noise, gyr.shape)
+
+    samples = np.hstack([acc_body, np.radians(gyr)]).astype(np.float32)
+    return GaitRecording(samples, datarate, np.array(heel_strikes), fpas)
@@ -0,0 +1,217 @@
+# Drive run_device.main end to end against fake BLE boards and check that the
+# FPA the pipeline logs matches the FPA that was generated.
+#
+#   uv run python -m simulation.load_test --rate 400 --duration 20 --fpa 8
+#   uv run python -m simulation.load_test --wearers 5
+#
+# With --wearers N > 1 every wearer gets its own fake IMU/LRA pair (each with a
+# different FPA) and runs through a devices.json registry, one pipeline each.
+# The fake IMUs send framed packets like the firmware (--frame-samples 0 for
+# the legacy one-sample payloads), or with --edge only step tails, as in the
+# firmware's edge mode. With --on-device they run the firmware's EDGE_FEEDBACK
+# mode instead: each fake IMU computes the FPA and cues its own fake LRA, which
+# is linked to the IMU rather than to the laptop, and sends only step events.
+# With --cached the boards' addresses are in the device cache before launch,
+# so the pipeline connects without scanning. --dropout S breaks every board's
+# link halfway through and keeps it out of reach for S seconds, to exercise
+# the reconnect (with --move the boards come back at new addresses, so they
+# must be scanned for again). --calibrate starts with a calibration walk instead of a saved
+# baseline, with each step's FPA varying by --fpa-sd, and reports when it
+# stopped and the profile it saved. --reload S rewrites the session's
+# config.json S seconds in, widening the feedback thresholds so no more cues
+# should go out (and with --reload-algorithm switching the FPA plugin), to
+# exercise the hot reload.
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import bluetooth
+import run_device
+from fpab import FpabReader
+from imu_packet import frame_capacity
+from profiles import ProfileStore
+from simulation.fake_ble import FakeIMUBoard, FakeLRABoard, install, uninstall
+from simulation.gait import generate_gait
+
+IMU_NAME = "CIRCUITPY4f33"
+LRA_NAME = "CIRCUITPY174d"
+
+
+def read_log(path):
+    # (rows, per-step FPAs) from a CSV or .fpab session log
+    if path.endswith(".fpab"):
+        reader = FpabReader(path)
+        rows = sum(count for tag, count, _, _, _ in reader.chunks if tag == b"SAMP")
+        return rows, np.round(reader.steps()["fpa"], 1)
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    return len(rows), np.array([float(row["fpa"]) for row in rows if row["fpa"]])
+
+
+async def run_load_test(rate, duration, fpa, wearers=1, frame_samples=frame_capacity(247), loss=0.0, skip_steps=5, edge=False, on_device=False, cached=False, dropout=None, move=False, calibrate=False, fpa_sd=0.0, reload=None, reload_algorithm=None):
+    n_steps = max(10, int(duration / 1.1) + 2)
+    out_dir = tempfile.mkdtemp(prefix="load_test_")
+    run_device.CSV_FILE = os.path.join(out_dir, "fpa_log.csv")
+    run_device.DATA_RATE = rate
+    run_device.CALIBRATION = calibrate
+    run_device.DEVICE_CACHE_FILE = os.path.join(out_dir, "device_cache.json")
+    run_device.PROFILE_FILE = os.path.join(out_dir, "profiles.json")
+    run_device.CONFIG_FILE = os.path.join(out_dir, "config.json")
+    run_device.CONFIG_RELOAD_INTERVAL = 0.25 if reload else None
+    run_device.CONFIG_RELOAD_ALGORITHM = reload_algorithm is not None
+    with open(run_device.CONFIG_FILE, "w") as f:
+        json.dump(run_device._cfg, f, indent=2)
+
+    def step_fpas(mean, seed=0):
+        # one FPA per step around mean, or mean for every step
+        if not fpa_sd:
+            return mean
+        return np.random.default_rng(seed).normal(mean, fpa_sd, n_steps)
+
+    pairs = []  # (user, generated fpa, imu board, lra board, log file)
+
+    def board_pair(imu_name, lra_name, recording, seed=0):
+        lra = FakeLRABoard(lra_name)
+        if on_device:
+            lra.on_connect()  # held by the IMU board, not visible to the laptop
+        imu = FakeIMUBoard(imu_name, recording, frame_samples=frame_samples, loss=loss, seed=seed, edge=edge,
+                           feedback=on_device, shank=lra if on_device else None)
+        return imu, lra
+
+    if wearers == 1:
+        recording = generate_gait(step_fpas(fpa), datarate=rate, n_steps=n_steps, is_right_foot=run_device.IS_RIGHT_FOOT)
+        pairs.append((None, fpa, *board_pair(IMU_NAME, LRA_NAME, recording), run_device.CSV_FILE))
+        registry = None
+    else:
+        entries = []
+        for i in range(wearers):
+            user = f"wearer{i + 1}"
+            wearer_fpa = fpa + 3 * i
+            recording = generate_gait(step_fpas(wearer_fpa, seed=i), datarate=rate, n_steps=n_steps, seed=i)
+            imu, lra = board_pair(f"CIRCUITPYi{i:03d}", f"CIRCUITPYl{i:03d}", recording, seed=i)
+            log_file = run_device.CSV_FILE.replace(".csv", f"_{user}.csv")
+            pairs.append((user, wearer_fpa, imu, lra, log_file))
+            entries.append({"user": user, "imu": imu.name, "lra": lra.name, "is_right_foot": True})
+        registry = os.path.join(out_dir, "devices.json")
+        with open(registry, "w") as f:
+            json.dump({"wearers": entries}, f)
+
+    boards = [pair[2] for pair in pairs] if on_device else [board for pair in pairs for board in pair[2:4]]
+    if cached:
+        with open(run_device.DEVICE_CACHE_FILE, "w") as f:
+            json.dump({board.name: board.address for board in boards}, f)
+    previous = install(bluetooth, boards)
+
+    async def drop_links():
+        await asyncio.sleep(duration / 2)
+        for board in boards:
+            board.drop(dropout, move)
+
+    async def reload_config():
+        await asyncio.sleep(reload)
+        cfg = dict(run_device._cfg, FEEDBACK_TOE_OUT_THRESHOLD_DEG=90, FEEDBACK_TOE_IN_THRESHOLD_DEG=-90)
+        if reload_algorithm is not None:
+            cfg["ALGORITHM"] = reload_algorithm
+        with open(run_device.CONFIG_FILE, "w") as f:
+            json.dump(cfg, f, indent=2)
+
+    tasks = []
+    if dropout:
+        tasks.append(asyncio.create_task(drop_links()))
+    if reload:
+        tasks.append(asyncio.create_task(reload_config()))
+    started = asyncio.get_running_loop().time()
+    try:
+        await asyncio.wait_for(run_device.main(registry=registry), timeout=duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        uninstall(bluetooth, previous)
+
+    packing = "legacy 24-byte payloads" if frame_samples is None else f"frames of up to {frame_samples} samples"
+    if edge:
+        packing += ", edge mode"
+    if on_device:
+        packing += ", on-device feedback"
+    print(f"\n[Load test] {wearers} wearer(s) at {rate} Hz for {duration:.0f} s, {packing}")
+    results = {}
+    profiles = ProfileStore(run_device.PROFILE_FILE)
+    for user, wearer_fpa, imu, lra, log_file in pairs:
+        if run_device.LOG_FORMAT == "fpab":
+            log_file = log_file.replace(".csv", ".fpab")
+        logged, fpas = read_log(log_file)
+        fpas = fpas[skip_steps:]
+        name = user or imu.name
+        summary = (f"[Load test] {name}: {imu.sent} samples sent ({imu.sent / duration:.0f}/s), "
+                   f"{imu.notifications} notifications ({imu.dropped} dropped), {logged} logged, {len(lra.writes)} LRA writes")
+        with open(log_file.replace(".csv", "_latency.json").replace(".fpab", "_latency.json")) as f:
+            stats = json.load(f)
+        startup = stats["startup"]
+        summary += f", first sample {startup['first_sample_s']} s after launch ({startup['scan_s']} s scanning)"
+        if dropout:
+            with open(log_file.replace(".csv", "_loss.json").replace(".fpab", "_loss.json")) as f:
+                loss = json.load(f)
+            imu_link = loss["links"]["imu"]
+            summary += (f", {dropout:.1f} s dropout: IMU back after {imu_link['max_outage_s']} s, "
+                        f"{imu_link['gap_samples']} samples marked lost, steps discarded {loss['gaps']['invalid_steps']}")
+        if calibrate:
+            profile = profiles.get(user, True)
+            if profile is not None:
+                early = ", stopped early" if profile["stopped_early"] else ""
+                summary += (f", calibrated base {profile['base_fpa']:.2f} deg from {profile['steps']} steps "
+                            f"in {profile['duration_s']} s{early}")
+            else:
+                summary += ", calibration did not finish"
+        if reload:
+            changes = stats["config"]["changes"]
+            if changes:
+                # allow for the poll interval and the step in flight
+                late = sum(t > started + reload + 2.0 for t, _ in lra.writes)
+                summary += (f", config reloaded from step {changes[0]['step']} "
+                            f"({', '.join(changes[0]['changed'])}), {late} cues after")
+            else:
+                summary += ", config reload not applied"
+        if on_device:
+            summary += f", {imu.cues} cues from the IMU board"
+        if edge:
+            summary += f", {imu.edge_samples} samples sent in step tails ({imu.edge_samples / max(imu.sent, 1):.0%})"
+        if len(fpas):
+            summary += (f", FPA generated {wearer_fpa:.1f} deg, logged {fpas.mean():.2f} ± {fpas.std():.2f} deg "
+                        f"over {len(fpas)} steps (max |error| {np.abs(fpas - wearer_fpa).max():.2f} deg)")
+        else:
+            summary += ", no steps logged"
+        print(summary)
+        results[name] = fpas
+    print(f"[Load test] logs in {out_dir}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=100, help="IMU sample rate (Hz), 50-1000")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run")
+    parser.add_argument("--fpa", type=float, default=8.0, help="generated FPA (deg); wearer i gets fpa + 3i")
+    parser.add_argument("--wearers", type=int, default=1, help="number of simulated IMU/LRA pairs")
+    parser.add_argument("--frame-samples", type=int, default=frame_capacity(247), help="samples per framed notification; 0 sends legacy payloads")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of dropping each notification")
+    parser.add_argument("--edge", action="store_true", help="fake IMUs segment steps on the board and send only step tails")
+    parser.add_argument("--on-device", action="store_true", help="fake IMUs compute the FPA and cue their LRA themselves, sending only step events")
+    parser.add_argument("--cached", action="store_true", help="start with the fake boards in the device cache, so nothing is scanned for")
+    parser.add_argument("--dropout", type=float, help="break every board's link halfway through for this many seconds")
+    parser.add_argument("--move", action="store_true", help="with --dropout, boards come back at a new address")
+    parser.add_argument("--calibrate", action="store_true", help="start with a calibration walk and save a profile instead of loading base_fpa.csv")
+    parser.add_argument("--fpa-sd", type=float, default=0.0, help="step-to-step standard deviation of the generated FPA (deg)")
+    parser.add_argument("--reload", type=float, help="rewrite config.json this many seconds in, widening the thresholds so cues stop")
+    parser.add_argument("--reload-algorithm", help="with --reload, also switch to this FPA plugin")
+    parser.add_argument("--log-format", choices=["csv", "fpab"], default=run_device.LOG_FORMAT, help="session log format")
+    args = parser.parse_args()
+    run_device.LOG_FORMAT = args.log_format
+    asyncio.run(run_load_test(int(args.rate), args.duration, args.fpa, args.wearers, args.frame_samples or None, args.loss, edge=args.edge, on_device=args.on_device, cached=args.cached, dropout=args.dropout, move=args.move, calibrate=args.calibrate, fpa_sd=args.fpa_sd, reload=args.reload, reload_algorithm=args.reload_algorithm))
@@ -0,0 +1,57 @@
+# The FPA as it was before the optimizations, for equivalence tests: an
+# unbounded list of sample dicts per step and the original per-sample Euler
+# integration and rotation.
+
+import os
+import struct
+
+import numpy as np
+
+from algorithms.base import EARLY_STANCE, MIDDLE_STANCE
+from algorithms.sage_motion.fpa import FPA
+from benchmarks.euler_angles import reference_get_euler_angles
+from replay import read_csv_log
+
+try:
+    from benchmarks.rotated_acc import reference_get_rotated_acc
+    import transforms3d  # noqa: F401
+except ImportError:
+    reference_get_rotated_acc = FPA.get_rotated_acc
+
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "output")
+
+
+class ReferenceFPA:
+    def __init__(self, is_right_foot, datarate=100, alpha=0.8):
+        self.datarate = datarate
+        self.ALPHA = alpha
+        self.FPA_this_step = 0.0
+        self.FPA_last_step = 0.0
+        self.step_data_buffer = []
+        self.is_right_foot = is_right_foot
+
+    def update_FPA(self, data, gaitphase_old, gaitphase):
+        self.step_data_buffer.append(dict(data))
+        if gaitphase_old == EARLY_STANCE and gaitphase == MIDDLE_STANCE:
+            euler_angles_esti = reference_get_euler_angles(self.step_data_buffer, self.datarate)
+            acc_rotated = reference_get_rotated_acc(self.step_data_buffer, euler_angles_esti)
+            acc_rotated_smoothed = FPA.smooth_acc_rotated(acc_rotated)
+            self.FPA_this_step = FPA.get_FPA_via_max_acc_ratio_at_norm_peak(acc_rotated_smoothed)
+            if self.FPA_this_step > 90:
+                self.FPA_this_step = self.FPA_this_step - 180
+            elif self.FPA_this_step < -90:
+                self.FPA_this_step = self.FPA_this_step + 180
+            self.step_data_buffer = []
+            if self.is_right_foot:
+                self.FPA_this_step = -self.FPA_this_step
+            self.FPA_this_step = self.FPA_this_step * self.ALPHA + (1 - self.ALPHA) * self.FPA_last_step
+            self.FPA_last_step = self.FPA_this_step
+
+
+def load_trial(name):
+    # (N, 6) sensor block of a recorded session in output/: ax, ay, az in m/s²,
+    # gx, gy, gz in deg/s, as the pipeline hands it to the plugins
+    packets = read_csv_log(os.path.join(OUTPUT_DIR, f"{name}.csv"))
+    block = np.array([struct.unpack("<6f", payload) for payload, _ in packets], dtype=np.float64)
+    block[:, 3:] = np.degrees(block[:, 3:])
+    return block
@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_suite_does_not_import_run_device():
+    # run_device reads config.json and creates output/ on import
+    check = "import sys, benchmarks.suite; sys.exit('run_device' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", check], cwd=ROOT).returncode == 0
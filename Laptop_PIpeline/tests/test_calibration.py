@@ -0,0 +1,85 @@
+import math
+import statistics
+
+import numpy as np
+import pytest
+
+from calibration import Z_95, Calibration
+from profiles import ProfileStore, profile_key
+
+
+def test_running_statistics_match_the_batch_ones():
+    values = np.random.default_rng(0).normal(-4, 2, size=50)
+    calibration = Calibration()
+    for value in values:
+        calibration.add(value)
+    assert calibration.n == 50
+    assert calibration.mean == pytest.approx(values.mean(), abs=1e-12)
+    assert calibration.sd == pytest.approx(statistics.stdev(values), abs=1e-12)
+    assert calibration.ci_width == pytest.approx(2 * Z_95 * statistics.stdev(values) / math.sqrt(50))
+
+
+def test_no_spread_before_two_steps():
+    calibration = Calibration()
+    assert calibration.result(1.0) is None
+    calibration.add(3.0)
+    assert calibration.sd is None and calibration.ci_width is None
+    assert calibration.result(1.0)["base_fpa"] == 3.0
+
+
+def test_without_a_target_it_runs_the_full_duration():
+    # the behaviour before early stopping: mean of every step in max_duration
+    calibration = Calibration(ci_width=None, max_duration=60)
+    for _ in range(200):
+        calibration.add(1.0)
+        assert not calibration.done(59.9)
+    assert calibration.done(60.0) and not calibration.stopped_early
+
+
+def test_stops_early_once_the_interval_is_narrow():
+    calibration = Calibration(ci_width=2.0, min_steps=5, max_duration=60)
+    for value in (0.0, 1.0, 0.0, 1.0):
+        calibration.add(value)
+        assert not calibration.done(10.0)  # fewer than min_steps
+    calibration.add(0.5)
+    assert calibration.ci_width < 2.0
+    assert calibration.done(10.0) and calibration.stopped_early
+    result = calibration.result(10.0)
+    assert (result["steps"], result["base_fpa"], result["stopped_early"]) == (5, 0.5, True)
+
+
+def test_keeps_going_while_the_interval_is_wide():
+    calibration = Calibration(ci_width=2.0, min_steps=5, max_duration=60)
+    for value in (-10.0, 10.0) * 5:
+        calibration.add(value)
+    assert not calibration.done(30.0)
+    assert calibration.done(60.0) and not calibration.stopped_early
+
+
+def test_min_steps_is_at_least_two():
+    calibration = Calibration(ci_width=5.0, min_steps=0)
+    calibration.add(1.0)
+    assert not calibration.done(0.0)  # no interval from one step
+    calibration.add(1.0)
+    assert calibration.done(0.0)
+
+
+def test_profiles_round_trip(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    store = ProfileStore(path)
+    assert len(store) == 0 and store.get("rhea", True) is None
+    store.put("rhea", True, {"base_fpa": -4.2, "steps": 24})
+    store.put(None, False, {"base_fpa": 1.5, "steps": 20})
+    reloaded = ProfileStore(path)
+    assert len(reloaded) == 2
+    assert reloaded.get("rhea", True)["base_fpa"] == -4.2
+    assert reloaded.get("rhea", False) is None
+    assert reloaded.get("", False)["base_fpa"] == 1.5
+    assert profile_key(None, False) == "default/left"
+
+
+@pytest.mark.parametrize("content", ["", "{not json", "[1, 2]", '{"rhea/right": {"steps": 3}}'])
+def test_unreadable_profiles_are_an_empty_store(tmp_path, content):
+    path = tmp_path / "profiles.json"
+    path.write_text(content)
+    assert len(ProfileStore(str(path))) == 0
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from clock_sync import MAX_OUTSTANDING, SAMPLE_PERIOD, TICKS_MS_PERIOD, ClockSync
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class Board:
+    # a device clock running `ppm` fast (negative: slow) from `tick0`, answering after `up` s
+    # and heard back after `down` s
+    def __init__(self, sync, clock, nominal, tick0=0, ppm=0.0, period=TICKS_MS_PERIOD):
+        self.sync, self.clock, self.nominal = sync, clock, nominal
+        self.host0, self.tick0, self.rate, self.period = clock.now, tick0, (1 + ppm * 1e-6) / nominal, period
+
+    def tick(self, host):
+        return (self.tick0 + round((host - self.host0) * self.rate)) % self.period
+
+    def exchange(self, up, down):
+        seq = int(self.sync.ping()[1:])
+        self.clock.now += up
+        tick = self.tick(self.clock.now)
+        self.clock.now += down
+        return self.sync.pong(seq, tick)
+
+
+def test_nothing_is_mapped_before_the_first_fit():
+    clock = Clock()
+    sync = ClockSync(clock=clock, min_points=4)
+    board = Board(sync, clock, 1e-3)
+    for _ in range(3):
+        assert board.exchange(0.01, 0.01) == pytest.approx(0.02)
+        clock.now += 1
+    assert not sync.ready
+    assert sync.to_host(5) is None and sync.to_wall(5) is None
+    assert sync.sample_times(5, 9) is None
+    sync.observe(5, clock.now)  # ignored, nothing to compare against yet
+    assert sync.stats()["uplink_p50_ms"] is None and sync.stats()["drift_ppm"] is None
+
+
+def test_fit_maps_ticks_and_measures_drift():
+    clock = Clock()
+    sync = ClockSync(clock=clock, nominal=1e-3)
+    board = Board(sync, clock, 1e-3, tick0=12345, ppm=-50)
+    for i in range(32):
+        # symmetric 10 ms legs, every third exchange held up 30 ms on the way
+        # back: those midpoints are off by 15 ms and must be left out
+        board.exchange(0.01, 0.04 if i % 3 == 0 else 0.01)
+        clock.now += 30  # long enough for 1 ms ticks to resolve the drift
+    assert sync.ready
+    # a board running slow has longer ticks than nominal: positive drift
+    assert sync.stats()["drift_ppm"] == pytest.approx(50, abs=5)
+    host = clock.now - 100.0
+    assert sync.to_host(board.tick(host)) == pytest.approx(host, abs=2e-3)
+    assert sync.to_wall(board.tick(host)) == pytest.approx(host + sync.wall_offset, abs=2e-3)
+
+
+def test_sample_times_are_consecutive_samples():
+    clock = Clock()
+    sync = ClockSync(SAMPLE_PERIOD, nominal=1 / 104, clock=clock)
+    board = Board(sync, clock, 1 / 104, tick0=1000, period=SAMPLE_PERIOD)
+    for _ in range(8):
+        board.exchange(0.005, 0.005)
+        clock.now += 0.5
+    times = sync.sample_times(board.tick(clock.now), 9)
+    assert times[0] == pytest.approx(clock.now + sync.wall_offset, abs=0.01)
+    np.testing.assert_allclose(np.diff(times), sync.scale, rtol=0, atol=1e-6)
+    assert sync.scale == pytest.approx(1 / 104, rel=2e-3)  # ticks are whole samples
+
+
+def test_ticks_unwrap_across_the_period():
+    clock = Clock()
+    sync = ClockSync(clock=clock)
+    board = Board(sync, clock, 1e-3, tick0=TICKS_MS_PERIOD - 5000)
+    for _ in range(10):
+        board.exchange(0.01, 0.01)
+        clock.now += 1
+    # the board clock wrapped a few seconds in; mapping stays continuous
+    assert board.tick(clock.now) < 10000
+    assert sync.to_host(board.tick(clock.now)) == pytest.approx(clock.now, abs=0.02)
+    assert sync.to_host(TICKS_MS_PERIOD - 4000) == pytest.approx(board.host0 + 1.0, abs=0.02)
+
+
+def test_pongs_from_text_lines():
+    clock = Clock()
+    sync = ClockSync(clock=clock, min_points=2)
+    sync.ping()
+    clock.now += 0.02
+    sync.feed_text(b"ack 3 play 5 100\npong 0 10")
+    assert sync.pongs == 0
+    sync.feed_text(b"00\npong 7 2000\n")  # 7 was never sent
+    assert sync.pongs == 1
+    assert sync.stats()["rtt_p50_ms"] == pytest.approx(20.0)
+
+
+def test_unanswered_pings_are_given_up():
+    sync = ClockSync(clock=Clock())
+    for _ in range(MAX_OUTSTANDING + 2):
+        sync.ping()
+    assert sync.unanswered == 2
+    assert sync.pong(0, 0) is None and sync.pong(2, 0) is not None
@@ -0,0 +1,43 @@
+# FPA.get_euler_angles_batch against the original per-sample loop.
+
+import numpy as np
+import pytest
+
+from algorithms.sage_motion.fpa import FPA
+from benchmarks.euler_angles import reference_get_euler_angles
+from benchmarks.fixtures import make_step, to_dicts
+
+
+@pytest.mark.parametrize("rate", [50, 100, 200, 400, 1000])
+def test_batch_matches_original(rate):
+    gyr, acc = make_step(rate)
+    expected = reference_get_euler_angles(to_dicts(gyr, acc), rate)
+    np.testing.assert_allclose(FPA.get_euler_angles_batch(gyr, acc, rate), expected, rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_matches_original_on_other_strides(seed):
+    gyr, acc = make_step(100, seed=seed)
+    expected = reference_get_euler_angles(to_dicts(gyr, acc), 100)
+    np.testing.assert_allclose(FPA.get_euler_angles_batch(gyr, acc, 100), expected, rtol=0, atol=1e-10)
+
+
+def test_dict_buffer_matches_original():
+    gyr, acc = make_step(100)
+    buffer = to_dicts(gyr, acc)
+    np.testing.assert_allclose(FPA.get_euler_angles(buffer, 100), reference_get_euler_angles(buffer, 100), rtol=0, atol=1e-10)
+
+
+def test_writes_into_out():
+    gyr, acc = make_step(100)
+    out = np.full((len(gyr), 3), np.nan)
+    result = FPA.get_euler_angles_batch(gyr, acc, 100, out)
+    assert result is out
+    np.testing.assert_allclose(out, FPA.get_euler_angles_batch(gyr, acc, 100), rtol=0, atol=0)
+
+
+def test_buffer_shorter_than_init_window():
+    # every row takes the gravity-derived attitude of the last samples
+    acc = np.tile([0.0, 0.0, 9.81], (3, 1))
+    angles = FPA.get_euler_angles_batch(np.zeros((3, 3)), acc, 100)
+    np.testing.assert_allclose(angles, np.zeros((3, 3)), atol=1e-12)
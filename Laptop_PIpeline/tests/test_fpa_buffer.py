@@ -0,0 +1,95 @@
+# sage_motion.FPA with its bounded step buffer against the original unbounded
+# list, on recorded sessions. Steps that fit the buffer must come out the same;
+# longer ones (pauses) must come out NaN, never truncated.
+
+import math
+
+import numpy as np
+import pytest
+
+from algorithms.base import BLOCK_COLUMNS, EARLY_STANCE, MIDDLE_STANCE, SensorSample
+from algorithms.sage_motion import FPA, GaitPhase
+from reference_fpa import ReferenceFPA, load_trial
+
+RATE = 100
+CAPACITY = math.ceil(3.0 * RATE)
+
+
+def step_lengths(block):
+    # samples buffered by the time each step's FPA is computed
+    gait = GaitPhase(datarate=RATE).update_gaitphase_batch(block)
+    boundaries = np.flatnonzero((gait[:, 0] == EARLY_STANCE) & (gait[:, 1] == MIDDLE_STANCE))
+    return np.diff(np.concatenate([[-1], boundaries]))
+
+
+def per_sample_steps(fpa, block):
+    gp = GaitPhase(datarate=RATE)
+    fpas = []
+    for row in block.tolist():
+        gp.update_gaitphase(SensorSample(row))
+        if isinstance(fpa, ReferenceFPA):
+            fpa.update_FPA(dict(zip(BLOCK_COLUMNS, row)), gp.gaitphase_old, gp.gaitphase)
+        else:
+            fpa.update_FPA(SensorSample(row), gp.gaitphase_old, gp.gaitphase)
+        if gp.gaitphase_old == EARLY_STANCE and gp.gaitphase == MIDDLE_STANCE:
+            fpas.append(fpa.FPA_this_step)
+    return np.array(fpas)
+
+
+def batch_steps(fpa, block, chunk=9):
+    # fed in notification-sized blocks, like the live pipeline
+    gp = GaitPhase(datarate=RATE)
+    fpas = []
+    for start in range(0, len(block), chunk):
+        part = block[start:start + chunk]
+        gait = gp.update_gaitphase_batch(part)
+        values = fpa.update_FPA_batch(part, gait)
+        fpas.extend(values[(gait[:, 0] == EARLY_STANCE) & (gait[:, 1] == MIDDLE_STANCE)])
+    return np.array(fpas)
+
+
+@pytest.fixture(scope="module")
+def toe_in():
+    block = load_trial("Trial_1_Haptic_TreadmillWalking_ToeIn_Rhea")
+    return block, step_lengths(block), per_sample_steps(ReferenceFPA(True, RATE, alpha=1.0), block)
+
+
+@pytest.mark.parametrize("steps", [per_sample_steps, batch_steps])
+def test_steps_that_fit_match_the_original(toe_in, steps):
+    # without smoothing each step stands alone, so every step that fits the
+    # buffer must match exactly and every longer one must be skipped
+    block, lengths, expected = toe_in
+    actual = steps(FPA(True, RATE, alpha=1.0), block)
+    fits = lengths <= CAPACITY
+    assert (~fits).sum() >= 3  # the trial has pauses, including its first steps
+    np.testing.assert_allclose(actual[fits], expected[fits], rtol=0, atol=1e-9)
+    assert np.isnan(actual[~fits]).all()
+
+
+def test_walking_without_pauses_matches_the_original():
+    block = load_trial("Trial_1_Slow_TreadmillWalking_Rhea")
+    assert step_lengths(block).max() <= CAPACITY
+    expected = per_sample_steps(ReferenceFPA(True, RATE), block)
+    np.testing.assert_allclose(batch_steps(FPA(True, RATE), block), expected, rtol=0, atol=1e-9)
+
+
+def test_skipped_step_leaves_the_smoothing_alone():
+    # a cap between the trial's step lengths skips some steps and not others;
+    # each computed step smooths against the last computed one
+    fpa = FPA(True, RATE, max_step_duration=1.1)
+    block = load_trial("Trial_1_Slow_TreadmillWalking_Rhea")[:3000]
+    fpas = per_sample_steps(fpa, block)
+    raw = per_sample_steps(FPA(True, RATE, alpha=1.0, max_step_duration=1.1), block)
+    skipped = np.isnan(fpas)
+    assert fpa.skipped_steps == skipped.sum() > 0 and not skipped.all()
+    np.testing.assert_array_equal(np.isnan(raw), skipped)
+    last = 0.0
+    for value, expected in zip(fpas[~skipped], raw[~skipped]):
+        last = 0.8 * expected + 0.2 * last
+        assert value == pytest.approx(last, abs=1e-9)
+
+
+def test_edge_step_longer_than_the_buffer_is_skipped():
+    fpa = FPA(True, RATE)
+    assert math.isnan(fpa.update_FPA_step(np.zeros((200, 6)), CAPACITY + 1))
+    assert fpa.FPA_last_step == 0.0
@@ -0,0 +1,91 @@
+# Wearable/fpa_edge.py, the foot board's port of sage_motion, against the
+# laptop plugin on a recorded session quantized to the IMU's int16 records.
+
+import importlib.util
+import math
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from algorithms.base import EARLY_STANCE, MIDDLE_STANCE
+from algorithms.sage_motion import FPA, GaitPhase
+from reference_fpa import load_trial
+
+RATE = 100
+GYRO_SCALE = 8.75e-3 * math.pi / 180  # Wearable/foot_mounted_wearable.py, rad/s per LSB
+ACCEL_SCALE = 0.061e-3 * 9.80665      # ±2 g, m/s² per LSB
+
+spec = importlib.util.spec_from_file_location(
+    "fpa_edge", os.path.join(os.path.dirname(__file__), "..", "..", "Wearable", "fpa_edge.py"))
+fpa_edge = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fpa_edge)
+
+
+@pytest.fixture(scope="module")
+def session():
+    # int16 records as the FIFO delivers them, and the same samples as the
+    # laptop sees them (m/s², deg/s)
+    block = load_trial("Trial_1_Slow_TreadmillWalking_Rhea")[:4000]
+    gyro = np.round(np.radians(block[:, 3:]) / GYRO_SCALE)
+    accel = np.round(block[:, :3] / ACCEL_SCALE)
+    records = np.clip(np.hstack([gyro, accel]), -32768, 32767).astype("<i2")
+    sensor = np.hstack([records[:, 3:] * ACCEL_SCALE, np.degrees(records[:, :3] * GYRO_SCALE)])
+    return records, sensor
+
+
+def boundaries(gait):
+    return np.flatnonzero((gait[:, 0] == EARLY_STANCE) & (gait[:, 1] == MIDDLE_STANCE))
+
+
+def test_gait_phase_matches(session):
+    _, sensor = session
+    expected = GaitPhase(datarate=RATE).update_gaitphase_batch(sensor)
+    gp = fpa_edge.GaitPhase(RATE)
+    actual = []
+    for gx, gy, gz in sensor[:, 3:].tolist():
+        gp.update(math.sqrt(gx * gx + gy * gy + gz * gz))
+        actual.append((gp.gaitphase_old, gp.gaitphase, gp.step_count))
+    np.testing.assert_array_equal(np.array(actual), expected[:, :3])
+
+
+@pytest.mark.parametrize("capacity", [300, 317])
+def test_step_fpa_matches_sage_motion(session, capacity):
+    # steps computed from the firmware's ring as it wraps, each right after
+    # its last sample is written, like foot_mounted_wearable.edge_sample
+    records, sensor = session
+    gait = GaitPhase(datarate=RATE).update_gaitphase_batch(sensor)
+    expected = FPA(True, RATE).update_FPA_batch(sensor, gait)[boundaries(gait)]
+
+    step_fpa = fpa_edge.StepFPA(capacity, RATE, GYRO_SCALE)
+    raw = bytearray(12 * capacity)
+    ends = set(boundaries(gait).tolist())
+    first = 0
+    actual = []
+    for c, record in enumerate(records):
+        struct.pack_into("<6h", raw, (c % capacity) * 12, *record.tolist())
+        if c in ends:
+            length = c + 1 - first
+            assert length <= capacity
+            actual.append(step_fpa.compute(raw, first, length))
+            first = c + 1
+    assert len(actual) > 20
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=0.01)
+
+
+def test_tail_start_matches():
+    for length in (1, 28, 29, 30, 100, 157, 300, 1000):
+        assert fpa_edge.step_tail_start(length) == FPA.step_tail_start(length)
+
+
+def test_left_foot_and_smoothing(session):
+    records, sensor = session
+    gait = GaitPhase(datarate=RATE).update_gaitphase_batch(sensor)
+    ends = boundaries(gait)
+    expected = FPA(False, RATE, alpha=0.5).update_FPA_batch(sensor, gait)[ends[:5]]
+    raw = bytearray(records[:ends[4] + 1].tobytes())
+    step_fpa = fpa_edge.StepFPA(len(records), RATE, GYRO_SCALE, is_right_foot=False, alpha=0.5)
+    starts = np.concatenate([[0], ends[:4] + 1])
+    actual = [step_fpa.compute(raw, int(a), int(b + 1 - a)) for a, b in zip(starts, ends[:5])]
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=0.01)
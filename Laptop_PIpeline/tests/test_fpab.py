@@ -0,0 +1,148 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+from fpab import CHUNK_HEADER, FILE_HEADER, MAGIC, STEP_DTYPE, VERSION, FpabReader, FpabWriter, export_csv
+from session_log import BinarySessionLog, SessionLog
+
+HEADER = ["time", "step", "fpa", "drv", "effect", "ax", "ay", "az", "gx", "gy", "gz"]
+
+
+def session(seed=0, sizes=(9, 9, 4, 9)):
+    rng = np.random.default_rng(seed)
+    parts = []
+    t = 0.0
+    for n in sizes:
+        parts.append((t + np.arange(n) / 100, rng.normal(size=(n, 6)).astype(np.float32)))
+        t += n / 100
+    return parts
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "log.fpab")
+    parts = session()
+    writer = FpabWriter(path, {"algorithm": "sage_motion", "csv_header": HEADER})
+    writer.append(*parts[0], np.array([(3, 0.03, 1, 12.5, b"2", b"B")], dtype=STEP_DTYPE))
+    writer.update_meta({"base_fpa": 4.5})
+    for times, block in parts[1:]:
+        writer.append(times, block)
+    writer.append(np.empty(0), np.empty((0, 6)), np.array([(20, 0.2, 2, -3.0, b"1", b"A")], dtype=STEP_DTYPE))
+    writer.close()
+
+    reader = FpabReader(path)
+    assert reader.meta == {"algorithm": "sage_motion", "csv_header": HEADER, "base_fpa": 4.5}
+    times, block = reader.samples()
+    np.testing.assert_array_equal(times, np.concatenate([t for t, _ in parts]))
+    np.testing.assert_array_equal(block, np.concatenate([b for _, b in parts]))
+    assert [first for first, _, _ in reader.sample_chunks()] == [0, 9, 18, 22]
+    steps = reader.steps()
+    assert steps["row"].tolist() == [3, 20] and steps["step"].tolist() == [1, 2]
+    assert steps["fpa"].tolist() == [12.5, -3.0] and steps["drv"].tolist() == [b"2", b"1"]
+
+
+def test_truncated_last_chunk_is_ignored(tmp_path):
+    path = tmp_path / "log.fpab"
+    parts = session()
+    writer = FpabWriter(str(path), {})
+    for times, block in parts:
+        writer.append(times, block)
+    writer.close()
+    path.write_bytes(path.read_bytes()[:-5])
+
+    times, block = FpabReader(str(path)).samples()
+    assert len(times) == sum(len(t) for t, _ in parts[:-1])
+    np.testing.assert_array_equal(block, np.concatenate([b for _, b in parts[:-1]]))
+
+
+def test_empty_log(tmp_path):
+    path = str(tmp_path / "log.fpab")
+    FpabWriter(path, {"csv_header": HEADER}).close()
+    reader = FpabReader(path)
+    times, block = reader.samples()
+    assert times.shape == (0,) and block.shape == (0, 6) and len(reader.steps()) == 0
+
+
+@pytest.mark.parametrize("header, message", [
+    (FILE_HEADER.pack(b"FPAX", 1, 0, 2), "not an .fpab"),
+    (FILE_HEADER.pack(MAGIC, 2, 0, 2), "unsupported .fpab version 2"),
+])
+def test_rejects_foreign_files(tmp_path, header, message):
+    path = tmp_path / "log.fpab"
+    path.write_bytes(header + b"{}")
+    with pytest.raises(ValueError, match=message):
+        FpabReader(str(path))
+
+
+def test_export_matches_the_csv_log(tmp_path):
+    # both session logs fed the same writes; the export must equal the CSV
+    csv_log = SessionLog(str(tmp_path / "log.csv"), HEADER, meta={"base_fpa": 0.0})
+    bin_log = BinarySessionLog(str(tmp_path / "log.fpab"), HEADER, meta={"base_fpa": 0.0}, flush_rows=10)
+    for i, (times, block) in enumerate(session(seed=1, sizes=(9,) * 6)):
+        steps = [(i % 9, i, 2.0 * i - 5, "1" if i % 2 else "", "B" if i % 3 else "")]
+        for log in (csv_log, bin_log):
+            log.write(times, block, steps)
+        if i == 2:
+            for log in (csv_log, bin_log):
+                log.meta(base_fpa=3.25)
+    csv_log.close()
+    bin_log.close()
+
+    assert export_csv(str(tmp_path / "log.fpab"), str(tmp_path / "export.csv")) == 54
+    assert (tmp_path / "export.csv").read_text() == (tmp_path / "log.csv").read_text()
+    assert FpabReader(str(tmp_path / "log.fpab")).meta["base_fpa"] == 3.25
+
+
+
+# Data_Processing/utils/fpab.py, the analysis side's reader, keeps its own
+# copy of the layout
+
+def load_analysis_reader():
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "Data_Processing", "utils", "fpab.py")
+    spec = importlib.util.spec_from_file_location("analysis_fpab", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_analysis_reader_has_the_same_layout():
+    analysis = load_analysis_reader()
+    assert (analysis.MAGIC, analysis.VERSION) == (MAGIC, VERSION)
+    assert analysis.FILE_HEADER.format == FILE_HEADER.format
+    assert analysis.CHUNK_HEADER.format == CHUNK_HEADER.format
+    assert analysis.STEP_DTYPE == STEP_DTYPE
+
+
+def test_analysis_reader_round_trip(tmp_path):
+    analysis = load_analysis_reader()
+    path = str(tmp_path / "log.fpab")
+    parts = session()
+    steps = np.array([(3, 0.03, 1, 12.46, b"2", b"B"), (20, 0.2, 2, -3.04, b"", b"")], dtype=STEP_DTYPE)
+    writer = FpabWriter(path, {"algorithm": "sage_motion"})
+    writer.append(*parts[0], steps[:1])
+    writer.update_meta({"base_fpa": 4.5})
+    for times, block in parts[1:]:
+        writer.append(times, block)
+    writer.append(np.empty(0), np.empty((0, 6)), steps[1:])
+    writer.close()
+
+    meta, read_steps = analysis.read_fpab(path)
+    assert meta == {"algorithm": "sage_motion", "base_fpa": 4.5}
+    np.testing.assert_array_equal(read_steps, steps)
+    _, _, times, data = analysis.read_fpab(path, samples=True)
+    np.testing.assert_array_equal(times, np.concatenate([t for t, _ in parts]))
+    np.testing.assert_array_equal(data, np.concatenate([b for _, b in parts]))
+    np.testing.assert_array_equal(analysis.load_step_fpa(path), [12.5, -3.0])
+
+
+@pytest.mark.parametrize("header, message", [
+    (b"", "not an .fpab"),
+    (FILE_HEADER.pack(b"FPAX", 1, 0, 2), "not an .fpab"),
+    (FILE_HEADER.pack(MAGIC, VERSION + 1, 0, 2), f"unsupported .fpab version {VERSION + 1}"),
+])
+def test_analysis_reader_rejects_other_versions(tmp_path, header, message):
+    path = tmp_path / "log.fpab"
+    path.write_bytes(header + b"{}" if header else b"")
+    with pytest.raises(ValueError, match=message):
+        load_analysis_reader().read_fpab(str(path))
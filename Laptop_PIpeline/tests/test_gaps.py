@@ -0,0 +1,156 @@
+# Frame loss: SequenceTracker counts it, GapPolicy repairs or flags it, and
+# fpa_consumer discards the FPA of the step whose buffer a long gap fell in.
+
+import asyncio
+
+import numpy as np
+import pytest
+
+import run_device
+from algorithms.base import EARLY_STANCE, LATE_STANCE, MIDDLE_STANCE, SWING, V1StepAdapter
+from algorithms.sage_motion import FPA, GaitPhase
+from imu_packet import GapPolicy, SequenceTracker
+from ingest_ring import IngestRing
+from lra_scheduler import CommandScheduler
+from profiles import ProfileStore
+from reference_fpa import load_trial
+
+RATE = 100
+
+
+# SequenceTracker
+
+def test_sequence_counts_lost_frames():
+    seq = SequenceTracker()
+    assert [seq.update(s, 9) for s in (10, 11, 14, 15)] == [0, 0, 18, 0]
+    assert seq.stats()["lost_frames"] == 2 and seq.lost_samples == 18
+
+
+def test_sequence_uses_the_sample_counter_when_present():
+    # the counter also covers samples the board dropped within a frame run
+    seq = SequenceTracker()
+    assert seq.update(1, 9, sample=100) == 0
+    assert seq.update(2, 9, sample=109) == 0
+    assert seq.update(3, 9, sample=130) == 12
+    assert seq.update(5, 9, sample=148) == 9
+
+
+def test_sequence_duplicates_reorders_and_wraps():
+    seq = SequenceTracker(reorder_window=4)
+    assert seq.update(0xFFFF, 9) == 0
+    assert seq.update(0xFFFF, 9) is None  # duplicate
+    assert seq.update(0, 9) == 0  # wrap
+    assert seq.update(0xFFFE, 9) is None  # late frame, already superseded
+    assert seq.update(1000, 9) == 999 * 9
+    assert seq.update(10, 9) == 0  # far back: the board restarted
+    stats = seq.stats()
+    assert (stats["duplicates"], stats["reordered"], stats["restarts"]) == (1, 1, 1)
+
+
+# GapPolicy
+
+def rows(values):
+    return np.repeat(np.asarray(values, dtype=np.float64)[:, None], 6, axis=1)
+
+
+def test_short_gap_is_interpolated():
+    gaps = GapPolicy(max_interpolate=3)
+    gaps.repair_batch(rows([0.0]), np.array([0]))
+    block, index, long_gaps = gaps.repair_batch(rows([4.0, 5.0]), np.array([3, 0]))
+    np.testing.assert_allclose(block[:, 0], [1, 2, 3, 4, 5])
+    np.testing.assert_array_equal(index, [0, 0, 0, 0, 1])
+    assert long_gaps == [] and gaps.interpolated_samples == 3
+
+
+def test_long_gap_is_flagged_not_filled():
+    gaps = GapPolicy(max_interpolate=3)
+    block, index, long_gaps = gaps.repair_batch(rows([0, 1, 2, 3]), np.array([0, 0, 5, 0]))
+    np.testing.assert_array_equal(block, rows([0, 1, 2, 3]))
+    assert long_gaps == [(2, 5)] and gaps.long_gaps == 1
+
+
+def test_gaps_inside_a_batch():
+    gaps = GapPolicy(max_interpolate=2)
+    gaps.repair_batch(rows([0.0]), np.array([0]))
+    block, index, long_gaps = gaps.repair_batch(rows([3, 4, 10, 13]), np.array([2, 0, 5, 2]))
+    np.testing.assert_allclose(block[:, 0], [1, 2, 3, 4, 10, 11, 12, 13])
+    np.testing.assert_array_equal(index, [0, 0, 0, 1, 2, 3, 3, 3])
+    assert long_gaps == [(4, 5)]
+
+
+def test_batch_without_loss_is_untouched():
+    block = rows([1, 2, 3])
+    out, index, long_gaps = GapPolicy(2).repair_batch(block, np.zeros(3, dtype=np.int64))
+    assert out is block and index is None and long_gaps == []
+
+
+# fpa_consumer: which step a long gap discards
+
+class ListLog:
+    def __init__(self):
+        self.steps = []
+
+    def write(self, times, block, steps=()):
+        self.steps.extend(step for _, step, *_ in steps)
+
+    def meta(self, **fields):
+        pass
+
+
+def run_consumer(block, lost_at, lost, tmp_path, processor):
+    ring = IngestRing(len(block) + 16)
+    cuts = sorted({*range(0, len(block), 9), lost_at})
+    for a, b in zip(cuts, cuts[1:] + [len(block)]):
+        ts = np.arange(a, b) / RATE
+        ring.put(block[a:b].astype(np.float32), ts, 0.0, lost if a == lost_at else 0)
+    ring.close()
+    base_fpa_file = tmp_path / "base_fpa.csv"
+    base_fpa_file.write_text("base_fpa\n0.0\n")
+    gaps, log = GapPolicy(max_interpolate=2), ListLog()
+    asyncio.run(run_device.fpa_consumer(
+        ring, GaitPhase(datarate=RATE), FPA(True, RATE), log, CommandScheduler(clock=lambda: 0.0),
+        clock=lambda: 0.0, base_fpa_file=str(base_fpa_file), gaps=gaps,
+        profiles=ProfileStore(str(tmp_path / "profiles.json")),
+    ))
+    return gaps.invalid_steps, log.steps
+
+
+@pytest.fixture(scope="module")
+def walk():
+    # the trial in rad/s, as the IMU sends it
+    block = load_trial("Trial_1_Slow_TreadmillWalking_Rhea")[:2500]
+    block[:, 3:] = np.radians(block[:, 3:])
+    return block
+
+
+@pytest.mark.parametrize("processor", ["batch", "v1"])
+@pytest.mark.parametrize("phase", [SWING, EARLY_STANCE, MIDDLE_STANCE, LATE_STANCE])
+def test_long_gap_discards_the_step_whose_buffer_it_is_in(walk, tmp_path, monkeypatch, phase, processor):
+    monkeypatch.setattr(run_device, "CALIBRATION", False)
+    if processor == "v1":
+        monkeypatch.setattr(run_device, "make_step_processor", V1StepAdapter)
+
+    # 10 samples lost right after a sample in `phase` during step 12 (late
+    # stance lasts one sample in this trial, so that gap is at toe-off)
+    removed = 10
+    degrees = walk.copy()
+    degrees[:, 3:] = np.degrees(walk[:, 3:])
+    gait = GaitPhase(datarate=RATE).update_gaitphase_batch(degrees)
+    in_phase = np.flatnonzero((gait[:, 1] == phase) & (gait[:, 2] == 12))
+    start = in_phase[len(in_phase) // 2] + 1
+    block = np.delete(walk, range(start, start + removed), axis=0)
+
+    gapped = np.delete(degrees, range(start, start + removed), axis=0)
+    gait = GaitPhase(datarate=RATE).update_gaitphase_batch(gapped)
+    assert gait[start - 1, 1] == phase
+    # its samples belong to the buffer that closes at the next EARLY -> MIDDLE
+    # transition: this step's during early stance, the next step's otherwise
+    step = int(gait[start, 2])
+    expected = step if phase == EARLY_STANCE else step + 1
+    boundaries = np.flatnonzero((gait[:, 0] == EARLY_STANCE) & (gait[:, 1] == MIDDLE_STANCE))
+    assert gait[boundaries[boundaries >= start][0], 2] == expected
+
+    invalid, logged = run_consumer(block, start, removed, tmp_path, processor)
+    assert invalid == [expected]
+    assert expected not in logged
+    assert expected - 1 in logged and expected + 1 in logged
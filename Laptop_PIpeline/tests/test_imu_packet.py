@@ -0,0 +1,65 @@
+import struct
+
+import numpy as np
+import pytest
+
+from imu_packet import (
+    SAMPLE, frame_capacity, pack_event, pack_frame, pack_info, pack_pong, pack_step,
+    parse_block, parse_event, parse_info, parse_packet, parse_payload, parse_pong, parse_step,
+)
+
+BLOCK = np.arange(54, dtype=np.float32).reshape(9, 6) / 7
+
+
+def test_frame_round_trip():
+    header, block = parse_packet(pack_frame(70000, 123456, BLOCK))
+    assert (header.version, header.count, header.seq, header.tick) == (2, 9, 70000 & 0xFFFF, 123456)
+    np.testing.assert_array_equal(block, BLOCK)
+
+
+def test_legacy_sample():
+    payload = struct.pack("<6f", *BLOCK[0])
+    header, block = parse_packet(payload)
+    assert header is None
+    np.testing.assert_array_equal(block, BLOCK[:1])
+    gyr, acc = parse_payload(payload)
+    np.testing.assert_allclose(acc + gyr, BLOCK[0], rtol=1e-6)
+
+
+@pytest.mark.parametrize("payload", [
+    b"",
+    b"\x00" * 23,
+    pack_frame(1, 0, BLOCK)[:-1],
+    pack_frame(1, 0, BLOCK)[:-SAMPLE.size],  # count says 9, 8 present
+    bytes([9]) + pack_frame(1, 0, BLOCK)[1:],  # unknown version
+])
+def test_malformed_payloads(payload):
+    assert parse_packet(payload) == (None, None)
+    assert parse_block(payload) is None
+
+
+def test_parse_block_is_float64():
+    block = parse_block(pack_frame(0, 0, BLOCK))
+    assert block.dtype == np.float64
+    np.testing.assert_array_equal(block, BLOCK.astype(np.float64))
+
+
+def test_frame_capacity():
+    assert frame_capacity(247) == 9
+    assert frame_capacity(23) == 1
+
+
+def test_control_payloads_round_trip():
+    info = parse_info(pack_info(416, 412.5, fifo=True, edge=True, feedback=False))
+    assert (info.fifo, info.edge, info.feedback, info.odr, info.rate) == (True, True, False, 416, 412.5)
+    assert tuple(parse_step(pack_step(70001, 120, 60, 2**32 + 5))) == (70001 & 0xFFFF, 120, 60, 5)
+    event = parse_event(pack_event(12, 2, 999, -7.5, cue_ms=70000, link=False))
+    assert (event.step, event.drv, event.sample, event.fpa, event.cue_ms, event.link) == (12, 2, 999, -7.5, 0xFFFF, False)
+    assert tuple(parse_pong(pack_pong(3, 44))) == (3, 44)
+
+
+def test_control_payloads_are_not_samples():
+    # their lengths never match a legacy sample or a frame
+    for payload in (pack_info(100, 100.0), pack_step(1, 2, 3, 4), pack_event(1, 0, 0, 0.0), pack_pong(1, 1)):
+        assert parse_packet(payload) == (None, None)
+    assert parse_info(pack_pong(1, 1)) is None and parse_pong(pack_info(100, 100.0)) is None
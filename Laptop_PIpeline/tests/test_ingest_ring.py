@@ -0,0 +1,139 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from ingest_ring import OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, IngestRing
+
+
+def rows(start, stop):
+    return np.arange(start, stop, dtype=np.float32)[:, None] * np.ones(6, dtype=np.float32)
+
+
+def put(ring, start, stop, lost=0):
+    ring.put(rows(start, stop), np.arange(start, stop) / 100, float(start), lost)
+
+
+def drained(ring):
+    batch = ring.drain()
+    return batch.samples[:, 0].tolist(), batch.lost.tolist()
+
+
+def drained_part(ring, n):
+    return ring.drain(n).samples[:, 0].tolist()
+
+
+def test_drain_is_contiguous_across_the_wrap():
+    ring = IngestRing(8)
+    put(ring, 0, 6)
+    assert drained(ring)[0] == list(range(6))
+    put(ring, 6, 10, lost=3)
+    put(ring, 10, 13)
+    batch = ring.drain()
+    assert batch.samples.base is not None  # views, not copies
+    np.testing.assert_array_equal(batch.samples, rows(6, 13))
+    np.testing.assert_array_equal(batch.ts, np.arange(6, 13) / 100)
+    assert batch.t_notify.tolist() == [6.0] * 4 + [10.0] * 3
+    assert batch.lost.tolist() == [3, 0, 0, 0, 0, 0, 0]
+    assert len(ring) == 0
+
+
+def test_drain_max_samples():
+    ring = IngestRing(8)
+    put(ring, 0, 5)
+    assert drained_part(ring, 3) == [0, 1, 2]
+    assert len(ring) == 2
+    assert drained(ring)[0] == [3, 4]
+
+
+def test_drop_oldest_carries_evicted_gaps():
+    ring = IngestRing(8)
+    put(ring, 0, 4, lost=2)
+    put(ring, 4, 8, lost=1)
+    put(ring, 8, 12)
+    # rows 0-3 and the 2 lost before them become one gap before row 4
+    assert drained(ring) == (list(range(4, 12)), [1 + 4 + 2, 0, 0, 0, 0, 0, 0, 0])
+    assert ring.dropped_samples == 4 and ring.overflows == 1
+
+
+def test_drop_oldest_block_of_exactly_capacity():
+    ring = IngestRing(8)
+    put(ring, 0, 4, lost=2)
+    put(ring, 4, 7, lost=1)
+    put(ring, 7, 15, lost=5)
+    # everything pending is evicted: 7 rows and the 3 lost before them
+    samples, lost = drained(ring)
+    assert samples == list(range(7, 15))
+    assert lost == [5 + 7 + 3, 0, 0, 0, 0, 0, 0, 0]
+    assert ring.dropped_samples == 7
+
+
+@pytest.mark.parametrize("overflow", [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST])
+def test_block_larger_than_capacity_is_dropped(overflow):
+    ring = IngestRing(8, overflow=overflow)
+    put(ring, 0, 3, lost=1)
+    put(ring, 3, 12, lost=2)
+    assert ring.dropped_samples == 9
+    assert drained(ring) == ([0, 1, 2], [1, 0, 0])
+    put(ring, 12, 14)
+    assert drained(ring) == ([12, 13], [2 + 9, 0])
+
+
+def test_drop_newest_keeps_what_is_queued():
+    ring = IngestRing(8, overflow=OVERFLOW_DROP_NEWEST)
+    put(ring, 0, 6)
+    put(ring, 6, 10, lost=1)
+    put(ring, 10, 14)
+    assert drained(ring) == (list(range(6)), [0] * 6)
+    put(ring, 14, 15)
+    # two dropped blocks and the gap before the first
+    assert drained(ring) == ([14], [1 + 4 + 4])
+    assert ring.stats()["dropped_samples"] == 8 and ring.stats()["overflows"] == 2
+
+
+def test_lost_total_is_conserved():
+    # whatever the ring drops, every sample is either drained or counted lost
+    rng = np.random.default_rng(0)
+    for overflow in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+        ring = IngestRing(16, overflow=overflow)
+        sent = received = lost = 0
+        for _ in range(500):
+            n = int(rng.integers(1, 20))
+            gap = int(rng.integers(0, 3))
+            put(ring, 0, n, lost=gap)
+            sent += n + gap
+            if rng.random() < 0.3:
+                batch = ring.drain()
+                received += len(batch.samples)
+                lost += int(batch.lost.sum())
+        put(ring, 0, 1)
+        batch = ring.drain()
+        assert received + len(batch.samples) + lost + int(batch.lost.sum()) == sent + 1
+
+
+def test_get_waits_and_ends_on_close():
+    async def run():
+        ring = IngestRing(8)
+        got = []
+
+        async def consume():
+            while (batch := await ring.get()) is not None:
+                got.append(batch.samples[:, 0].tolist())
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        put(ring, 0, 2)
+        await asyncio.sleep(0)
+        put(ring, 2, 3)
+        ring.close()
+        await task
+        return got
+
+    assert asyncio.run(run()) == [[0, 1], [2]]
+
+
+def test_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        IngestRing(0)
+    with pytest.raises(ValueError):
+        IngestRing(4, overflow="block")
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from live_config import AppliedConfig, ConfigWatcher, LiveConfig, load_algorithm, validate
+
+BASE = {
+    "ALGORITHM": "sage_motion",
+    "FEEDBACK_TOE_OUT_THRESHOLD_DEG": -1,
+    "FEEDBACK_TOE_IN_THRESHOLD_DEG": -9,
+    "DATA_RATE": 100,
+}
+
+
+class ConfigFile:
+    def __init__(self, path):
+        self.path = str(path)
+        self.mtime = 1_000_000_000
+
+    def write(self, cfg=None, text=None):
+        with open(self.path, "w") as f:
+            f.write(json.dumps(cfg) if text is None else text)
+        # a distinct mtime per write, however fast the writes come
+        self.mtime += 1
+        os.utime(self.path, ns=(self.mtime, self.mtime))
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = ConfigFile(tmp_path / "config.json")
+    config.write(BASE)
+    return config
+
+
+def test_unchanged_file_is_not_reread(config):
+    watcher = ConfigWatcher(config.path, BASE)
+    assert watcher.current == LiveConfig(0, -1, -9, "sage_motion")
+    assert watcher.check() is False
+    os.remove(config.path)
+    assert watcher.check() is False and watcher.rejected == 0
+
+
+def test_valid_change_is_published(config, capsys):
+    watcher = ConfigWatcher(config.path, BASE)
+    config.write(dict(BASE, FEEDBACK_TOE_OUT_THRESHOLD_DEG=2.5))
+    assert watcher.check() is True
+    assert watcher.current == LiveConfig(1, 2.5, -9, "sage_motion")
+    assert "FEEDBACK_TOE_OUT_THRESHOLD_DEG -1 -> 2.5" in capsys.readouterr().out
+    assert watcher.check() is False  # same mtime
+    assert watcher.stats() == {"version": 1, "reloads": 1, "rejected": 0}
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("{not json", "Expecting property name"),
+    ("[1, 2]", "not a JSON object"),
+    (json.dumps(dict(BASE, FEEDBACK_TOE_IN_THRESHOLD_DEG=0)), "is above FEEDBACK_TOE_OUT_THRESHOLD_DEG"),
+    (json.dumps(dict(BASE, FEEDBACK_TOE_OUT_THRESHOLD_DEG="5")), "must be a number"),
+    (json.dumps(dict(BASE, FEEDBACK_TOE_OUT_THRESHOLD_DEG=True)), "must be a number"),
+    (json.dumps({k: v for k, v in BASE.items() if k != "ALGORITHM"}), "ALGORITHM is missing"),
+])
+def test_bad_file_keeps_the_running_settings(config, capsys, text, reason):
+    watcher = ConfigWatcher(config.path, BASE)
+    config.write(text=text)
+    assert watcher.check() is False
+    assert watcher.current.version == 0 and watcher.rejected == 1
+    assert reason in capsys.readouterr().out
+    # a fixed file is taken up afterwards
+    config.write(dict(BASE, FEEDBACK_TOE_IN_THRESHOLD_DEG=-5))
+    assert watcher.check() is True and watcher.current.toe_in == -5
+
+
+def test_algorithm_needs_reload_algorithm(config, capsys):
+    watcher = ConfigWatcher(config.path, BASE)
+    config.write(dict(BASE, ALGORITHM="streaming", FEEDBACK_TOE_OUT_THRESHOLD_DEG=0))
+    assert watcher.check() is False
+    assert "CONFIG_RELOAD_ALGORITHM is off" in capsys.readouterr().out
+    assert watcher.current.toe_out == -1  # nothing from the rejected file
+
+    watcher = ConfigWatcher(config.path, BASE, reload_algorithm=True)
+    config.write(dict(BASE, ALGORITHM="streaming"))
+    assert watcher.check() is True and watcher.current.algorithm == "streaming"
+    config.write(dict(BASE, ALGORITHM="no_such_plugin"))
+    assert watcher.check() is False and watcher.current.algorithm == "streaming"
+    assert "cannot be imported" in capsys.readouterr().out
+
+
+def test_restart_only_keys_are_reported_not_published(config, capsys):
+    watcher = ConfigWatcher(config.path, BASE)
+    config.write(dict(BASE, DATA_RATE=200, LOG_FORMAT="fpab"))
+    assert watcher.check() is False
+    assert watcher.current.version == 0 and watcher.rejected == 0
+    assert "DATA_RATE, LOG_FORMAT changed; takes effect on restart" in capsys.readouterr().out
+    config.write(dict(BASE, DATA_RATE=200, LOG_FORMAT="fpab", FEEDBACK_TOE_IN_THRESHOLD_DEG=-8))
+    assert watcher.check() is True
+    assert "takes effect on restart" not in capsys.readouterr().out  # already reported
+
+
+def test_applied_config_changes_at_step_boundaries(config):
+    watcher = ConfigWatcher(config.path, BASE)
+    applied = AppliedConfig(watcher)
+    assert applied.update(3) is None
+    config.write(dict(BASE, FEEDBACK_TOE_OUT_THRESHOLD_DEG=1))
+    watcher.check()
+    config.write(dict(BASE, FEEDBACK_TOE_OUT_THRESHOLD_DEG=2, FEEDBACK_TOE_IN_THRESHOLD_DEG=-3))
+    watcher.check()
+    assert applied.current.version == 0  # not until the next step
+    change = applied.update(4)
+    # both reloads land together, against what this pipeline ran with
+    assert (change["version"], change["step"]) == (2, 4)
+    assert change["changed"] == {"FEEDBACK_TOE_OUT_THRESHOLD_DEG": [-1, 2], "FEEDBACK_TOE_IN_THRESHOLD_DEG": [-9, -3]}
+    assert applied.current is watcher.current and applied.update(5) is None
+    assert applied.changes == [change]
+
+
+def test_watch_polls_the_file(config):
+    async def run():
+        watcher = ConfigWatcher(config.path, BASE, interval=0.01)
+        task = asyncio.create_task(watcher.watch())
+        config.write(dict(BASE, FEEDBACK_TOE_IN_THRESHOLD_DEG=-4))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if watcher.reloads:
+                break
+        task.cancel()
+        return watcher.current.toe_in
+
+    assert asyncio.run(run()) == -4
+
+
+def test_validate_and_load_algorithm():
+    assert validate(BASE, 3) == LiveConfig(3, -1, -9, "sage_motion")
+    with pytest.raises(ValueError, match="must be a string"):
+        validate(dict(BASE, ALGORITHM=1))
+    assert hasattr(load_algorithm("sage_motion"), "FPA")
+    with pytest.raises(ValueError, match="does not export FPA and GaitPhase"):
+        load_algorithm("base")
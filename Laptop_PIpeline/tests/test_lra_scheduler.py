@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from lra_scheduler import ACK_WINDOW, CommandScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_newer_command_supersedes_a_waiting_one(clock):
+    scheduler = CommandScheduler(clock=clock)
+    scheduler.submit("1", drv=1, step=1)
+    scheduler.submit("2", drv=2, step=2)
+    command, wait = scheduler.poll()
+    assert (command.cmd, command.step, wait) == ("2", 2, None)
+    assert scheduler.poll() == (None, None)
+    assert scheduler.stats()["coalesced"] == 1
+
+
+def test_rate_limit_waits_within_the_deadline(clock):
+    scheduler = CommandScheduler(max_age=0.3, min_interval=0.5, clock=clock)
+    scheduler.sent(scheduler.submit("1", drv=1, step=1))
+    clock.now = 0.3
+    scheduler.submit("1", drv=1, step=2)
+    command, wait = scheduler.poll()
+    assert command is None and wait == pytest.approx(0.2)
+    clock.now = 0.5
+    assert scheduler.poll()[0].step == 2
+
+
+def test_rate_limit_drops_what_would_go_out_late(clock):
+    scheduler = CommandScheduler(max_age=0.3, min_interval=0.5, clock=clock)
+    scheduler.sent(scheduler.submit("1", drv=1, step=1))
+    clock.now = 0.1
+    scheduler.submit("1", drv=1, step=2)  # motor free at 0.5, deadline 0.4
+    assert scheduler.poll() == (None, None)
+    assert scheduler.dropped_rate_limit == 1
+
+
+def test_rate_limit_is_per_motor(clock):
+    scheduler = CommandScheduler(clock=clock)
+    scheduler.sent(scheduler.submit("1", drv=1, step=1))
+    scheduler.submit("2", drv=2, step=2)
+    assert scheduler.poll()[0].drv == 2
+
+
+def test_stale_command_is_dropped(clock):
+    scheduler = CommandScheduler(max_age=0.3, clock=clock)
+    scheduler.submit("1", drv=1, step=1)
+    clock.now = 0.31
+    assert scheduler.poll() == (None, None)
+    assert scheduler.dropped_stale == 1 and scheduler.sent_count == 0
+
+
+def test_retry_keeps_the_deadline_and_yields_to_newer(clock):
+    scheduler = CommandScheduler(max_age=0.3, clock=clock)
+    first = scheduler.submit("1", drv=1, step=1)
+    assert scheduler.poll()[0] is first
+    scheduler.retry(first)
+    assert scheduler.poll()[0] is first
+    scheduler.submit("2", drv=2, step=2)
+    scheduler.retry(first)
+    assert scheduler.poll()[0].step == 2
+    scheduler.retry(first)
+    clock.now = 0.4
+    assert scheduler.poll() == (None, None)
+    assert (scheduler.retried, scheduler.coalesced, scheduler.dropped_stale) == (3, 1, 1)
+
+
+def test_next_waits_for_the_motor(clock):
+    async def run():
+        scheduler = CommandScheduler(max_age=1.0, min_interval=0.02)
+        scheduler.sent(scheduler.submit("1", drv=1, step=1))
+        scheduler.submit("1", drv=1, step=2)
+        return await asyncio.wait_for(scheduler.next(), 1.0)
+
+    assert asyncio.run(run()).step == 2
+
+
+def test_encode(clock):
+    command = CommandScheduler(clock=clock).submit("2", drv=2, step=1)
+    assert CommandScheduler(clock=clock).encode(command) == f"2!#{command.tag}\n".encode()
+    assert CommandScheduler(clock=clock, preempt=False, ack=False).encode(command) == b"2\n"
+
+
+def test_acks_split_across_notifications(clock):
+    scheduler = CommandScheduler(min_interval=0, clock=clock)
+    tags = []
+    for step in range(3):
+        command = scheduler.submit("1", drv=1, step=step)
+        scheduler.sent(scheduler.poll()[0])
+        tags.append(command.tag)
+    clock.now = 0.05
+    scheduler.feed_acks(f"ack {tags[0]} play 12 900\nack {tags[1]} dr".encode())
+    assert scheduler.played == 1 and scheduler.dropped_device == 0
+    scheduler.feed_acks(f"op 3\nnoise\nack x play 1\nack {tags[2]} play 8\n".encode())
+    stats = scheduler.stats()
+    assert (stats["played"], stats["dropped_device"]) == (2, 1)
+    assert stats["mean_device_delay_ms"] == 10 and stats["max_device_delay_ms"] == 12
+    assert stats["mean_ack_rtt_ms"] == 50.0
+    scheduler.feed_acks(f"ack {tags[0]} play 1\n".encode())  # already acked
+    assert scheduler.played == 2
+
+
+def test_ack_measures_the_write_radio_time(clock):
+    class Sync:
+        def to_host(self, tick):
+            return tick / 1e3
+
+    scheduler = CommandScheduler(clock=clock)
+    scheduler.sync = Sync()
+    clock.now = 1.0
+    command = scheduler.submit("1", drv=1, step=1)
+    scheduler.sent(scheduler.poll()[0])
+    # actuated at 1.030 s, 20 ms after receipt: the write took 10 ms
+    scheduler.feed_acks(f"ack {command.tag} play 20 1030\n".encode())
+    assert scheduler.radio_acks == 1
+    assert scheduler.stats()["mean_write_radio_ms"] == pytest.approx(10.0)
+
+
+def test_unacked_commands_fall_out_of_the_window(clock):
+    scheduler = CommandScheduler(min_interval=0, clock=clock)
+    first = scheduler.submit("1", drv=1, step=0)
+    scheduler.sent(scheduler.poll()[0])
+    for step in range(1, ACK_WINDOW + 1):
+        scheduler.sent(scheduler.submit("1", drv=1, step=step))
+    assert scheduler.ack_missing == 1
+    scheduler.feed_acks(f"ack {first.tag} play 5\n".encode())
+    assert scheduler.played == 0
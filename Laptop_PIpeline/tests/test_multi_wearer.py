@@ -0,0 +1,47 @@
+# One wearer's failure must not end the other wearers' sessions.
+
+import asyncio
+import json
+
+import run_device
+
+
+class FakePipeline:
+    # stands in for WearerPipeline: "bad" fails at once, the others run a while
+    def __init__(self, wearer, csv_file, *args, **kwargs):
+        self.label = wearer.user
+        self.finished = False
+
+    async def run(self):
+        if self.label == "bad":
+            raise ValueError("no such profile")
+        await asyncio.sleep(0.05)
+        self.finished = True
+
+
+def test_failing_wearer_leaves_the_others_running(tmp_path, monkeypatch, capsys):
+    registry = tmp_path / "devices.json"
+    registry.write_text(json.dumps({"wearers": [
+        {"user": "alice", "imu": "imu-a", "lra": "lra-a"},
+        {"user": "bad", "imu": "imu-b", "lra": "lra-b"},
+        {"user": "carol", "imu": "imu-c", "lra": "lra-c"},
+    ]}))
+    pipelines = []
+
+    def make_pipeline(*args, **kwargs):
+        pipelines.append(FakePipeline(*args, **kwargs))
+        return pipelines[-1]
+
+    monkeypatch.setattr(run_device, "WearerPipeline", make_pipeline)
+    monkeypatch.setattr(run_device, "DEVICE_CACHE_FILE", str(tmp_path / "device_cache.json"))
+    monkeypatch.setattr(run_device, "PROFILE_FILE", str(tmp_path / "profiles.json"))
+    monkeypatch.setattr(run_device, "CONFIG_RELOAD_INTERVAL", 0)
+
+    errors = asyncio.run(run_device.main(registry=str(registry)))
+
+    assert [p.finished for p in pipelines] == [True, False, True]
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], ValueError)
+    out = capsys.readouterr().out
+    assert "[bad] Session stopped by an error: ValueError: no such profile" in out
+    assert "[Session] 1 of 3 wearer(s) stopped by an error: bad (ValueError: no such profile)" in out
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from algorithms.ring_buffer import (
+    OVERFLOW_COUNT, OVERFLOW_DROP_OLDEST, OVERFLOW_POLICIES, OVERFLOW_RESET, SampleRingBuffer,
+)
+
+
+def rows(start, stop):
+    return np.arange(start, stop, dtype=np.float64)[:, None] * np.ones(6)
+
+
+@pytest.mark.parametrize("overflow", OVERFLOW_POLICIES)
+def test_holds_rows_in_order_below_capacity(overflow):
+    buf = SampleRingBuffer(8, overflow=overflow)
+    buf.extend(rows(0, 3))
+    buf.append(rows(3, 4)[0])
+    buf.extend(rows(4, 8))
+    assert len(buf) == 8
+    np.testing.assert_array_equal(buf.view(), rows(0, 8))
+    assert buf.overflow_count == 0 and buf.dropped_samples == 0
+
+
+def test_drop_oldest_keeps_the_latest_rows_contiguous():
+    buf = SampleRingBuffer(5, overflow=OVERFLOW_DROP_OLDEST)
+    buf.extend(rows(0, 4))
+    buf.extend(rows(4, 12))
+    np.testing.assert_array_equal(buf.view(), rows(7, 12))
+    assert buf.view().base is not None  # a view, not a copy
+    assert buf.overflow_count == 7 and buf.dropped_samples == 7
+    for i in range(12, 20):
+        buf.append(rows(i, i + 1)[0])
+        np.testing.assert_array_equal(buf.view(), rows(i - 4, i + 1))
+
+
+def test_reset_starts_over_at_each_overflow():
+    buf = SampleRingBuffer(5, overflow=OVERFLOW_RESET)
+    buf.extend(rows(0, 5))
+    buf.append(rows(5, 6)[0])
+    np.testing.assert_array_equal(buf.view(), rows(5, 6))
+    assert buf.overflow_count == 1 and buf.dropped_samples == 5
+    buf.extend(rows(6, 12))
+    np.testing.assert_array_equal(buf.view(), rows(10, 12))
+    assert buf.overflow_count == 2 and buf.dropped_samples == 10
+
+
+def test_count_keeps_the_first_rows():
+    buf = SampleRingBuffer(5, overflow=OVERFLOW_COUNT)
+    buf.extend(rows(0, 9))
+    np.testing.assert_array_equal(buf.view(), rows(0, 5))
+    assert buf.overflow_count == 4 and buf.dropped_samples == 4
+
+
+@pytest.mark.parametrize("overflow", OVERFLOW_POLICIES)
+def test_clear(overflow):
+    buf = SampleRingBuffer(4, overflow=overflow)
+    buf.extend(rows(0, 7))
+    buf.clear()
+    assert len(buf) == 0 and buf.view().shape == (0, 6)
+    buf.extend(rows(20, 23))
+    np.testing.assert_array_equal(buf.view(), rows(20, 23))
+
+
+def test_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        SampleRingBuffer(0)
+    with pytest.raises(ValueError):
+        SampleRingBuffer(4, overflow="wrap")
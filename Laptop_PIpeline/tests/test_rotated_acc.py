@@ -0,0 +1,41 @@
+# FPA.get_rotated_acc_batch against the original per-sample transforms3d loop.
+
+import numpy as np
+import pytest
+
+from algorithms.sage_motion.fpa import FPA
+from benchmarks.fixtures import make_step, to_dicts
+
+
+@pytest.mark.parametrize("rate", [100, 400, 1000])
+def test_batch_matches_transforms3d(rate):
+    pytest.importorskip("transforms3d")
+    from benchmarks.rotated_acc import reference_get_rotated_acc
+
+    gyr, acc = make_step(rate)
+    euler_angles = FPA.get_euler_angles_batch(gyr, acc, rate)
+    expected = reference_get_rotated_acc(to_dicts(gyr, acc), euler_angles)
+    np.testing.assert_allclose(FPA.get_rotated_acc_batch(acc, euler_angles), expected, rtol=0, atol=1e-10)
+
+
+def test_rotation_matrices_are_pitch_after_roll():
+    rng = np.random.default_rng(0)
+    euler_angles = rng.uniform(-np.pi, np.pi, (50, 3))
+    for (roll, pitch, _), dcm in zip(euler_angles, FPA.get_rotation_matrices(euler_angles)):
+        rx = np.array([[1, 0, 0], [0, np.cos(roll), -np.sin(roll)], [0, np.sin(roll), np.cos(roll)]])
+        ry = np.array([[np.cos(pitch), 0, np.sin(pitch)], [0, 1, 0], [-np.sin(pitch), 0, np.cos(pitch)]])
+        np.testing.assert_allclose(dcm, ry @ rx, atol=1e-12)
+
+
+def test_yaw_is_ignored():
+    gyr, acc = make_step(100)
+    euler_angles = FPA.get_euler_angles_batch(gyr, acc, 100)
+    no_yaw = euler_angles.copy()
+    no_yaw[:, 2] = 0.0
+    np.testing.assert_array_equal(FPA.get_rotated_acc_batch(acc, euler_angles), FPA.get_rotated_acc_batch(acc, no_yaw))
+
+
+def test_dict_buffer_matches_batch():
+    gyr, acc = make_step(100)
+    euler_angles = FPA.get_euler_angles_batch(gyr, acc, 100)
+    np.testing.assert_array_equal(FPA.get_rotated_acc(to_dicts(gyr, acc), euler_angles), FPA.get_rotated_acc_batch(acc, euler_angles))
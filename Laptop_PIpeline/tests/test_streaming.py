@@ -0,0 +1,75 @@
+# The streaming plugin: its batch and per-sample paths agree, it stays within
+# the deviation from sage_motion stated in its module header, and edge mode
+# refuses it.
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from algorithms import sage_motion, streaming
+from algorithms.base import EARLY_STANCE, MIDDLE_STANCE, SensorSample, supports_edge
+from reference_fpa import load_trial
+
+RATE = 100
+
+
+def step_fpas(algo, block):
+    gait = algo.GaitPhase(datarate=RATE).update_gaitphase_batch(block)
+    fpas = algo.FPA(True, RATE).update_FPA_batch(block, gait)
+    return fpas[(gait[:, 0] == EARLY_STANCE) & (gait[:, 1] == MIDDLE_STANCE)]
+
+
+def deviation(name):
+    block = load_trial(name)
+    expected, actual = step_fpas(sage_motion, block), step_fpas(streaming, block)
+    computed = ~np.isnan(expected)  # sage_motion skips pauses
+    return actual[computed] - expected[computed]
+
+
+@pytest.mark.parametrize("name", [
+    "Trial_1_Haptic_TreadmillWalking_ToeIn_Rhea",
+    "Trial_1_Haptic_TreadmillWalking_ToeOut_Rhea",
+    "Trial_1_Slow_TreadmillWalking_Rhea",
+    "Trial_3_Slower_TreadillWalking_Lakshmi",
+])
+def test_treadmill_deviation(name):
+    diff = deviation(name)
+    assert np.median(np.abs(diff)) < 2.5
+    assert abs(np.mean(diff)) < 3
+
+
+@pytest.mark.parametrize("name", [
+    "Trial_1_Baseline_OvergroundWalking_Lakshmi",
+    "Trial_2_Faster_TreadmillWalking_Lakshmi",
+])
+def test_overground_and_fast_deviation(name):
+    diff = deviation(name)
+    assert np.median(np.abs(diff)) < 10
+    assert abs(np.mean(diff)) < 6.5
+
+
+def test_batch_matches_per_sample():
+    block = load_trial("Trial_1_Slow_TreadmillWalking_Rhea")[:3000]
+    gp, fpa = streaming.GaitPhase(datarate=RATE), streaming.FPA(True, RATE)
+    expected = []
+    for row in block.tolist():
+        sample = SensorSample(row)
+        gp.update_gaitphase(sample)
+        fpa.update_FPA(sample, gp.gaitphase_old, gp.gaitphase)
+        expected.append(fpa.FPA_this_step)
+    gp, fpa = streaming.GaitPhase(datarate=RATE), streaming.FPA(True, RATE)
+    actual = np.concatenate([
+        fpa.update_FPA_batch(block[i:i + 9], gp.update_gaitphase_batch(block[i:i + 9]))
+        for i in range(0, len(block), 9)
+    ])
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-12)
+
+
+def test_edge_mode_refuses_it():
+    import run_device
+
+    fpa = streaming.FPA(True, RATE)
+    assert not supports_edge(fpa)
+    with pytest.raises(ValueError, match="edge-mode"):
+        asyncio.run(run_device.edge_consumer(None, fpa, None, None, clock=lambda: 0.0))
@@ -2,7 +2,7 @@ import { FPA } from '@/lib/wearable/fpaAlgorithm';
 import { GaitPhase } from '@/lib/wearable/gaitPhase';
 import {
   base64ToUint8Array,
-  imuPayloadToSensorData,
+  imuPacketsToSensorData,
 } from '@/lib/wearable/imuPayload';
 import type { SensorData } from '@/lib/wearable/sensorTypes';
 
@@ -83,12 +83,22 @@ export class FpaPipeline {
     };
   }
 
+  /**
+   * Runs every sample of a legacy or framed notification; returns the last
+   * sample's output, with `fpaUpdated` set if any sample in it updated FPA.
+   */
   processPayloadBytes(payload: Uint8Array, monoSec: number): FpaPipelineOutput | null {
-    const sensorData = imuPayloadToSensorData(payload);
-    if (!sensorData) {
+    const samples = imuPacketsToSensorData(payload);
+    if (!samples || samples.length === 0) {
       return null;
     }
-    return this.processSensorData(sensorData, monoSec);
+    let out: FpaPipelineOutput | null = null;
+    let fpaUpdated = false;
+    for (const sensorData of samples) {
+      out = this.processSensorData(sensorData, monoSec);
+      fpaUpdated = fpaUpdated || out.fpaUpdated;
+    }
+    return out && { ...out, fpaUpdated };
   }
 
   /** Value from `characteristic.value` (base64) on react-native-ble-plx. */
@@ -27,9 +27,58 @@ export function parseImuPayload(payload: ArrayBufferView): {
   return { acc: [ax, ay, az], gyrRad: [gx, gy, gz] };
 }
 
-export function imuPayloadToSensorData(payload: ArrayBufferView): SensorData | null {
-  const p = parseImuPayload(payload);
-  if (!p) return null;
+const SAMPLE_SIZE = 24;
+const FRAME_HEADER_SIZE = 8;
+const FRAME_VERSIONS = [1, 2];
+const INFO_SIZE = 12;
+const STEP_SIZE = 16;
+const EVENT_SIZE = 20;
+
+/**
+ * Decode a whole notification: one legacy 24-byte sample, or a frame of
+ * `<BBHI` [version, count, seq, tick] followed by `count` samples
+ * — same as Laptop_PIpeline/imu_packet.parse_packet. The 12-byte device info
+ * payload sent on connect carries no samples, nor do the 12-byte clock sync
+ * pong (only sent when pinged), the 16-byte edge-mode step header and the
+ * 20-byte on-device feedback step event (the app expects the board's default
+ * streaming mode).
+ */
+export function parseImuPackets(payload: ArrayBufferView): {
+  acc: [number, number, number];
+  gyrRad: [number, number, number];
+}[] | null {
+  const buf =
+    payload instanceof Uint8Array
+      ? payload
+      : new Uint8Array(payload.buffer, payload.byteOffset, payload.byteLength);
+  const n = buf.byteLength;
+  let offset = 0;
+  let count: number;
+  if (n >= SAMPLE_SIZE && n % SAMPLE_SIZE === 0) {
+    count = n / SAMPLE_SIZE;
+  } else if (n === INFO_SIZE || n === STEP_SIZE || n === EVENT_SIZE) {
+    return [];
+  } else if (n % SAMPLE_SIZE === FRAME_HEADER_SIZE) {
+    count = buf[1];
+    if (!FRAME_VERSIONS.includes(buf[0]) || count * SAMPLE_SIZE !== n - FRAME_HEADER_SIZE) {
+      return null;
+    }
+    offset = FRAME_HEADER_SIZE;
+  } else {
+    return null;
+  }
+  const out: { acc: [number, number, number]; gyrRad: [number, number, number] }[] = [];
+  for (let i = 0; i < count; i++) {
+    const p = parseImuPayload(buf.subarray(offset + i * SAMPLE_SIZE, offset + (i + 1) * SAMPLE_SIZE));
+    if (p) out.push(p);
+  }
+  return out;
+}
+
+function toSensorData(p: {
+  acc: [number, number, number];
+  gyrRad: [number, number, number];
+}): SensorData {
   const [ax, ay, az] = p.acc;
   const [gx, gy, gz] = p.gyrRad;
   return {
@@ -42,6 +91,19 @@ export function imuPayloadToSensorData(payload: ArrayBufferView): SensorData | n
   };
 }
 
+export function imuPayloadToSensorData(payload: ArrayBufferView): SensorData | null {
+  const p = parseImuPayload(payload);
+  if (!p) return null;
+  return toSensorData(p);
+}
+
+/** Every sample in a legacy or framed notification. */
+export function imuPacketsToSensorData(payload: ArrayBufferView): SensorData[] | null {
+  const samples = parseImuPackets(payload);
+  if (!samples) return null;
+  return samples.map(toSensorData);
+}
+
 /** react-native-ble-plx passes base64; Hermes provides `atob`. */
 export function base64ToUint8Array(b64: string): Uint8Array {
   if (typeof atob !== 'function') {
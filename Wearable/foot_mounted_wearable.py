@@ -4,6 +4,7 @@
 
 # https://www.ubiqueiot.com/posts/xiao-circuitpy-ble
 
+import _bleio
 from adafruit_ble import BLERadio
 from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
 from adafruit_ble.services.nordic import UARTService
@@ -14,7 +15,86 @@ import busio
 from adafruit_lsm6ds.lsm6ds3trc import LSM6DS3TRC
 import adafruit_drv2605
 import adafruit_tca9548a
+from adafruit_lsm6ds import AccelRange, GyroRange, Rate
+import math
 import struct
+import supervisor
+from fpa_edge import EARLY_STANCE, LATE_STANCE, MIDDLE_STANCE, GaitPhase, StepFPA, step_tail_start
+
+# Framed packets (Laptop_PIpeline/imu_packet.py): an 8-byte header
+# <version u8, count u8, seq u16, tick u32> followed by `count` samples of
+# <6f ax, ay, az, gx, gy, gz>; tick is the sensor sample counter at the first
+# sample. Set FRAMED = False for one 24-byte sample per notification (what
+# older laptop and phone builds expect).
+FRAMED = True
+FRAME_VERSION = 2
+MAX_PAYLOAD = 244         # TX max_length; ATT MTU 247 minus 3 bytes of overhead
+FRAME_SAMPLES = (MAX_PAYLOAD - 8) // 24  # 9
+MAX_FRAME_AGE_MS = 20     # flush a partial frame once its first sample is this old
+TICKS_MASK = (1 << 29) - 1  # supervisor.ticks_ms() wraps at 2**29
+
+# IMU sampling: the LSM6DS3TR-C samples at its own output data rate into its
+# FIFO and the loop reads whatever has accumulated in one I2C burst, so sample
+# timing no longer depends on how long I2C and BLE take. Each sample is
+# stamped with its index in that stream. The rate the FIFO really delivers is
+# measured against the MCU clock at boot and reported on every connect as a
+# 12-byte info payload <4s magic "IMUI", version u8, fifo u8, odr u16, rate f32>.
+IMU_ODR_HZ = 104
+RATE_WINDOW_MS = 3000     # boot-time measurement of the effective rate
+INFO_VERSION = 1
+ACCEL_SCALE = 0.122e-3 * 9.80665        # ±4 g: m/s² per LSB
+GYRO_SCALE = 8.75e-3 * math.pi / 180    # ±250 dps: rad/s per LSB
+
+_FIFO_CTRL3 = 0x08        # DEC_FIFO_GYRO[5:3], DEC_FIFO_XL[2:0]
+_FIFO_CTRL5 = 0x0A        # ODR_FIFO[6:3], FIFO_MODE[2:0]
+_FIFO_STATUS1 = 0x3A      # STATUS1..4: unread words, overrun flag, next word's pattern
+_FIFO_DATA_OUT_L = 0x3E   # burst reads roll back over DATA_OUT_L/H
+_FIFO_GYRO_XL = 0x09      # both in the FIFO, no decimation
+_FIFO_ODR_104 = 0x04
+_FIFO_BYPASS = 0x00       # also empties the FIFO
+_FIFO_CONTINUOUS = 0x06   # oldest sample overwritten when full
+_SAMPLE_WORDS = 6         # gyro x, y, z then accel x, y, z, int16 each
+
+# Edge mode (Laptop_PIpeline/edge_steps.py): run the laptop's gait phase state
+# machine here (fpa_edge.py, copied to CIRCUITPY as well) and send, per step, only the tail of its FPA window that the
+# FPA depends on (as version 2 frames), then a 16-byte step header
+# <4s magic "IMUS", version u8, reserved u8, step u16, length u16, count u16,
+# first u32> when the feedback window opens. While no steps are taken a header
+# with count 0 goes out every KEEPALIVE_MS. The phone app needs EDGE_MODE = False.
+EDGE_MODE = False
+STEP_VERSION = 1
+KEEPALIVE_MS = 1000
+MAX_STEP_S = 3.0          # FPA max_step_duration on the laptop
+GYRO_DPS = 8.75e-3        # ±250 dps: deg/s per LSB
+
+# On-device feedback (EDGE_FEEDBACK = True): segment steps as in edge mode,
+# compute each step's FPA here (fpa_edge.StepFPA) and, when the feedback window
+# opens, write the cue straight to the shank board over this board's own BLE
+# connection to it (as central). The laptop is optional; if connected it gets a
+# 20-byte step event per step instead of samples: <4s magic "IMUF",
+# version u8, drv u8 (0: no cue), step u16, sample u32 (counter when the
+# feedback window opened), fpa f32, cue_ms u16 (window open to cue written),
+# link u8 (1: shank board connected), reserved u8>. It may write
+# "c<base>,<toe_out>,<toe_in>,<right>,<enable>" to replace the defaults below.
+EDGE_FEEDBACK = False
+EVENT_VERSION = 1
+SHANK_NAME = "CIRCUITPY174d"
+SHANK_RETRY_MS = 5000     # between scans for the shank board while unlinked
+# Scanning and connecting both block the sampling loop. Together (at most
+# SCAN_TIMEOUT_S + CONNECT_TIMEOUT_S, 1.3 s) they stay well inside the FIFO's
+# ~3.3 s of headroom, so a failed attempt never overruns it.
+SCAN_TIMEOUT_S = 0.3
+CONNECT_TIMEOUT_S = 1.0
+BASE_FPA_DEG = 0.0        # base_fpa.csv on the laptop
+TOE_OUT_THRESHOLD_DEG = -1
+TOE_IN_THRESHOLD_DEG = -9
+IS_RIGHT_FOOT = True
+CUES = {1: b"1!\n", 2: b"2!\n"}  # preempting commands (Wearable/shank_mounted_wearable.py)
+
+# Clock sync (Laptop_PIpeline/clock_sync.py): the laptop writes "p<seq>\n" and
+# gets back a 12-byte pong <4s magic "IMUP", version u8, reserved u8, seq u16,
+# tick u32>, tick being the sample counter the IMU has reached on arrival.
+PONG_VERSION = 1
 
 ble = BLERadio()
 uart = UARTService()
@@ -29,19 +109,284 @@ imupwr.value = True
 time.sleep(0.1)
 imu_i2c = busio.I2C(board.IMU_SCL, board.IMU_SDA)
 sensor = LSM6DS3TRC(imu_i2c)
+sensor.accelerometer_range = AccelRange.RANGE_4G
+sensor.gyro_range = GyroRange.RANGE_250_DPS
+sensor.accelerometer_data_rate = Rate.RATE_104_HZ
+sensor.gyro_data_rate = Rate.RATE_104_HZ
+
+fifo_status = bytearray(4)
+fifo_raw = bytearray(FRAME_SAMPLES * 2 * _SAMPLE_WORDS)
+
+def imu_write(reg, val):
+    with sensor.i2c_device as dev:
+        dev.write(bytes([reg, val]))
+
+def imu_read(reg, buf, n):
+    with sensor.i2c_device as dev:
+        dev.write_then_readinto(bytes([reg]), buf, in_end=n)
+
+def fifo_reset():
+    imu_write(_FIFO_CTRL5, _FIFO_BYPASS)
+    imu_write(_FIFO_CTRL3, _FIFO_GYRO_XL)
+    imu_write(_FIFO_CTRL5, (_FIFO_ODR_104 << 3) | _FIFO_CONTINUOUS)
+
+def fifo_read(max_samples):
+    # (samples read into fifo_raw, whether the FIFO overran since the last read)
+    imu_read(_FIFO_STATUS1, fifo_status, 4)
+    words = fifo_status[0] | (fifo_status[1] & 0x07) << 8
+    overrun = bool(fifo_status[1] & 0x40)
+    pattern = fifo_status[2] | (fifo_status[3] & 0x03) << 8
+    if pattern:
+        # an overrun left the next word mid-sample: skip to the next gyro x
+        skip = _SAMPLE_WORDS - pattern
+        imu_read(_FIFO_DATA_OUT_L, fifo_raw, 2 * skip)
+        words -= skip
+    n = min(words // _SAMPLE_WORDS, max_samples)
+    if n > 0:
+        imu_read(_FIFO_DATA_OUT_L, fifo_raw, 2 * _SAMPLE_WORDS * n)
+    return max(n, 0), overrun
+
+def measure_rate(window_ms):
+    # samples per second the FIFO delivers, timed on the MCU clock from the
+    # first sample to the last one seen within the window
+    fifo_reset()
+    total = 0
+    start = None
+    while True:
+        n, _ = fifo_read(FRAME_SAMPLES)
+        now = supervisor.ticks_ms()
+        if n and start is None:
+            start = now
+        elif n:
+            total += n
+            last = now
+        if start is not None and ((now - start) & TICKS_MASK) >= window_ms and total:
+            return total * 1000 / ((last - start) & TICKS_MASK)
+        time.sleep(0.001)
+
+effective_rate = measure_rate(RATE_WINDOW_MS)
+flags = 1 | (2 if EDGE_MODE else 0) | (4 if EDGE_FEEDBACK else 0)
+info = struct.pack('<4sBBHf', b"IMUI", INFO_VERSION, flags, IMU_ODR_HZ, effective_rate)
+print(f"IMU: ODR {IMU_ODR_HZ} Hz, effective {effective_rate:.2f} Hz")
 ble.start_advertising(advertisement)
 
+frame = bytearray(8 + FRAME_SAMPLES * 24)
+count = 0
+frame_started = 0
+frame_sample = 0   # sensor sample counter at the frame's first sample
+sample = 0         # sensor sample counter of the next sample read
+last_read = supervisor.ticks_ms()
+connected = False
+
+# edge mode: the open step window, as raw FIFO records indexed by sample counter
+MAX_WINDOW = math.ceil(MAX_STEP_S * effective_rate)
+window_raw = bytearray(MAX_WINDOW * 12) if EDGE_MODE or EDGE_FEEDBACK else None
+window_first = 0      # sample counter where the open window starts
+window_hole = False   # samples are missing from the open window (reconnect, FIFO overrun)
+pending_step = None   # step header (or, with EDGE_FEEDBACK, FPA) waiting for the feedback window
+last_tx = 0
+gait = GaitPhase(effective_rate)
+
+# on-device feedback: the step FPA, the settings the laptop may replace, the shank link
+step_fpa = StepFPA(MAX_WINDOW, effective_rate, GYRO_SCALE, IS_RIGHT_FOOT) if EDGE_FEEDBACK else None
+base_fpa = BASE_FPA_DEG
+toe_out = TOE_OUT_THRESHOLD_DEG
+toe_in = TOE_IN_THRESHOLD_DEG
+feedback_enabled = True
+shank_conn = None
+shank_uart = None
+last_scan = -SHANK_RETRY_MS
+
+def send_frame():
+    global count, seq
+    struct.pack_into('<BBHI', frame, 0, FRAME_VERSION, count, seq & 0xFFFF, frame_sample & 0xFFFFFFFF)
+    uart.write(memoryview(frame)[:8 + count * 24])
+    seq += 1
+    count = 0
+
+def handle_rx(received):
+    # clock sync pings and on-device feedback settings from the laptop
+    global base_fpa, toe_out, toe_in, feedback_enabled
+    for token in received.split():
+        if token.startswith(b"p"):
+            try:
+                ping = int(token[1:])
+            except ValueError:
+                continue
+            # samples already read plus those still waiting in the FIFO
+            imu_read(_FIFO_STATUS1, fifo_status, 2)
+            taken = sample + (fifo_status[0] | (fifo_status[1] & 0x07) << 8) // _SAMPLE_WORDS
+            uart.write(struct.pack('<4sBBHI', b"IMUP", PONG_VERSION, 0, ping & 0xFFFF, taken & 0xFFFFFFFF))
+        elif token.startswith(b"c") and step_fpa is not None:
+            try:
+                base, out, inward, right, enable = token[1:].decode().split(",")
+                base_fpa, toe_out, toe_in = float(base), float(out), float(inward)
+            except ValueError:
+                continue
+            step_fpa.is_right_foot = right == "1"
+            feedback_enabled = enable == "1"
+            print(f"Feedback: base {base_fpa:.2f} deg, thresholds {toe_out}/{toe_in}, {'on' if feedback_enabled else 'off'}")
+
+def shank_linked():
+    return shank_conn is not None and shank_conn.connected
+
+def laptop_connected():
+    # any central other than the shank board, which this board connects to itself
+    return len(ble.connections) > (1 if shank_linked() else 0)
+
+def link_shank(now):
+    # (re)connect to the shank board, one short scan every SHANK_RETRY_MS
+    global shank_conn, shank_uart, last_scan
+    if shank_linked() or ((now - last_scan) & TICKS_MASK) < SHANK_RETRY_MS:
+        return
+    shank_conn = shank_uart = None
+    last_scan = now
+    for adv in ble.start_scan(ProvideServicesAdvertisement, timeout=SCAN_TIMEOUT_S):
+        if adv.complete_name == SHANK_NAME and UARTService in adv.services:
+            ble.stop_scan()
+            try:
+                shank_conn = ble.connect(adv, timeout=CONNECT_TIMEOUT_S)
+            except (ConnectionError, _bleio.BluetoothError):
+                print(f"Could not connect to {SHANK_NAME}; retrying in {SHANK_RETRY_MS} ms")
+                break
+            shank_uart = shank_conn[UARTService]
+            print(f"Linked to {SHANK_NAME}")
+            break
+    ble.stop_scan()
+
+def give_feedback():
+    # the feedback window is open: cue the shank board, then tell the laptop
+    opened = supervisor.ticks_ms()
+    diff = pending_step - base_fpa
+    drv = 0
+    if feedback_enabled:
+        drv = 1 if diff > toe_out else 2 if diff < toe_in else 0
+    link = shank_linked()
+    cue_ms = 0
+    if drv and link:
+        shank_uart.write(CUES[drv])
+        cue_ms = (supervisor.ticks_ms() - opened) & TICKS_MASK
+    if connected:
+        uart.write(struct.pack('<4sBBHIfHBB', b"IMUF", EVENT_VERSION, drv, gait.step_count & 0xFFFF,
+                               sample & 0xFFFFFFFF, pending_step, min(cue_ms, 0xFFFF), int(link), 0))
+
+def to_si(raw, offset):
+    gyro_x, gyro_y, gyro_z, accel_x, accel_y, accel_z = struct.unpack_from('<6h', raw, offset)
+    return (accel_x * ACCEL_SCALE, accel_y * ACCEL_SCALE, accel_z * ACCEL_SCALE,
+            gyro_x * GYRO_SCALE, gyro_y * GYRO_SCALE, gyro_z * GYRO_SCALE)
+
+def edge_sample(offset):
+    # one FIFO record in edge mode: into the window, through the gait phase,
+    # and on the phase transitions out as a step tail and step header, or with
+    # EDGE_FEEDBACK into the step's FPA and then its cue
+    global window_first, window_hole, pending_step, last_tx, count, frame_sample
+    slot = (sample % MAX_WINDOW) * 12
+    window_raw[slot:slot + 12] = fifo_raw[offset:offset + 12]
+    gyro_x, gyro_y, gyro_z = struct.unpack_from('<3h', fifo_raw, offset)
+    gait.update(math.sqrt(gyro_x * gyro_x + gyro_y * gyro_y + gyro_z * gyro_z) * GYRO_DPS)
+    if gait.gaitphase_old == EARLY_STANCE and gait.gaitphase == MIDDLE_STANCE:
+        length = min(sample + 1 - window_first, MAX_WINDOW)
+        if window_hole:
+            # no FPA from a window with samples missing: skip this step
+            window_first = sample + 1
+            window_hole = False
+            return
+        if EDGE_FEEDBACK:
+            pending_step = step_fpa.compute(window_raw, sample + 1 - length, length)
+            window_first = sample + 1
+            return
+        first = sample + 1 - length + step_tail_start(length)
+        for c in range(first, sample + 1):
+            if count == 0:
+                frame_sample = c
+            slot = (c % MAX_WINDOW) * 12
+            struct.pack_into('<6f', frame, 8 + count * 24, *to_si(window_raw, slot))
+            count += 1
+            if count == FRAME_SAMPLES:
+                send_frame()
+        if count:
+            send_frame()
+        pending_step = struct.pack('<4sBBHHHI', b"IMUS", STEP_VERSION, 0, gait.step_count & 0xFFFF,
+                                   length, sample + 1 - first, first & 0xFFFFFFFF)
+        window_first = sample + 1
+        last_tx = supervisor.ticks_ms()
+    elif gait.gaitphase_old == MIDDLE_STANCE and gait.gaitphase == LATE_STANCE and pending_step is not None:
+        if EDGE_FEEDBACK:
+            give_feedback()
+            last_tx = supervisor.ticks_ms()
+        elif connected:
+            uart.write(pending_step)
+        pending_step = None
+
 seq = 0
 while True:
-    if ble.connected:
+    linked = laptop_connected()
+    if linked and not connected:
+        # every central gets the rate first
         led.value = False
-        accel_x, accel_y, accel_z = sensor.acceleration
-        gyro_x, gyro_y, gyro_z = sensor.gyro
-        payload = struct.pack('<6f', accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z)
-        uart.write(payload)
-        time.sleep(1/160)  # 140 Hz
-    else:
+        uart.write(info)
+        if not EDGE_FEEDBACK:
+            # then samples from an empty FIFO. The counter skips the samples
+            # flushed with it, so across a reconnect it still counts time and
+            # the laptop sees the outage as a gap; the open step window has a
+            # hole, so its step is skipped
+            fifo_reset()
+            now = supervisor.ticks_ms()
+            sample += round(((now - last_read) & TICKS_MASK) * effective_rate / 1000)
+            last_read = now
+            window_first = sample
+            window_hole = True
+            pending_step = None
+        last_tx = supervisor.ticks_ms()
+        connected = True
+    elif not linked:
         led.value = True
+        count = 0
+        connected = False
         if not ble.advertising:
             ble.start_advertising(advertisement)
-
+        if not EDGE_FEEDBACK:
+            continue
+    if connected:
+        waiting = uart.in_waiting
+        if waiting:
+            received = uart.read(waiting)
+            if received is not None:
+                handle_rx(received)
+    if EDGE_FEEDBACK:
+        link_shank(supervisor.ticks_ms())
+    n, overrun = fifo_read(FRAME_SAMPLES - count)
+    now = supervisor.ticks_ms()
+    if overrun:
+        # the oldest samples were overwritten; skip the counter past them so
+        # the host sees the gap, and keep a frame's samples contiguous
+        if count:
+            send_frame()
+        missed = round(((now - last_read) & TICKS_MASK) * effective_rate / 1000) - n
+        sample += max(missed, 0)
+        window_first = sample  # the open step window has a hole; restart it
+        window_hole = True
+    last_read = now
+    if EDGE_MODE or EDGE_FEEDBACK:
+        for i in range(n):
+            edge_sample(12 * i)
+            sample += 1
+        if connected and ((now - last_tx) & TICKS_MASK) >= KEEPALIVE_MS:
+            uart.write(struct.pack('<4sBBHHHI', b"IMUS", STEP_VERSION, 0, gait.step_count & 0xFFFF, 0, 0, sample & 0xFFFFFFFF))
+            last_tx = now
+        time.sleep(0.002)
+        continue
+    for i in range(n):
+        values = to_si(fifo_raw, 12 * i)
+        if not FRAMED:
+            uart.write(struct.pack('<6f', *values))
+        else:
+            if count == 0:
+                frame_started = now
+                frame_sample = sample
+            struct.pack_into('<6f', frame, 8 + count * 24, *values)
+            count += 1
+        sample += 1
+    if count and (count == FRAME_SAMPLES or ((now - frame_started) & TICKS_MASK) >= MAX_FRAME_AGE_MS):
+        send_frame()
+    time.sleep(0.002)
@@ -0,0 +1,178 @@
+# Fixed-size port of the laptop's sage_motion gait phase and per-step FPA
+# (Laptop_PIpeline/algorithms/sage_motion/) for the foot board's edge modes.
+# Copy it to CIRCUITPY next to code.py.
+#
+# The step window is the firmware's ring of raw FIFO records (12 bytes each:
+# gyro x, y, z then accel x, y, z, int16 little-endian), read in place.
+# StepFPA keeps two float arrays sized for the longest window tail. Computing
+# a step allocates nothing, so it can run inside the sampling loop without
+# waking the garbage collector. Only the window tail from step_tail_start() is
+# read, the same rows the laptop's FPA depends on.
+#
+# Keep in step with GaitPhase.update_gaitphase_gyromag and
+# FPA.update_FPA_this_step on the laptop.
+
+import math
+from array import array
+
+EARLY_STANCE, MIDDLE_STANCE, LATE_STANCE, SWING = range(4)
+EULER_INIT_LEN = 5        # algorithms/base.py
+SMOOTH_WIN_LEN = 29       # FPA.smooth_acc_rotated
+PEAK_CHECK_PCT = 56       # FPA.get_FPA_via_max_acc_ratio_at_norm_peak
+
+
+def step_tail_start(length):
+    # same as FPA.step_tail_start on the laptop: the first window row the FPA uses
+    return max(0, min((PEAK_CHECK_PCT * length) // 100 - SMOOTH_WIN_LEN // 2, length - SMOOTH_WIN_LEN))
+
+
+class GaitPhase:
+    # Port of update_gaitphase_gyromag in
+    # Laptop_PIpeline/algorithms/sage_motion/gaitphase.py.
+    def __init__(self, datarate):
+        self.last_stance_time = 0.6
+        self.datarate = datarate
+        self.middlestance_iters = self.last_stance_time * 0.25 * datarate
+        self.latestance_iters = self.last_stance_time * 0.5 * datarate
+        self.heelstrike_iters = 0.1 * datarate
+        self.gaitphase = LATE_STANCE
+        self.gaitphase_old = LATE_STANCE
+        self.step_count = 0
+        self.iters_below = 0
+        self.iters_stance = 0
+
+    def update(self, gyro_mag):
+        # gyro_mag in deg/s; thresholds of 45 deg/s for heel strike and toe off
+        phase = self.gaitphase
+        self.gaitphase_old = phase
+        if phase == SWING:
+            if gyro_mag < 45:
+                self.iters_below += 1
+                if self.iters_below > self.heelstrike_iters:
+                    self.iters_below = 0
+                    self.iters_stance = 0
+                    self.step_count += 1
+                    self.gaitphase = EARLY_STANCE
+            else:
+                self.iters_below = 0
+        elif phase == EARLY_STANCE:
+            self.iters_stance += 1
+            if self.iters_stance > self.middlestance_iters:
+                self.gaitphase = MIDDLE_STANCE
+        elif phase == MIDDLE_STANCE:
+            self.iters_stance += 1
+            if self.iters_stance > self.latestance_iters:
+                self.gaitphase = LATE_STANCE
+        else:
+            self.iters_stance += 1
+            if gyro_mag > 45:
+                self.last_stance_time = min(max(self.iters_stance / self.datarate, 0.4), 2)
+                self.gaitphase = SWING
+
+
+def _i16(raw, offset):
+    value = raw[offset] | raw[offset + 1] << 8
+    return value - 65536 if value & 0x8000 else value
+
+
+class StepFPA:
+    # Port of FPA.update_FPA_this_step over a window of the raw ring.
+    #   capacity     samples the ring holds (the longest window)
+    #   gyro_scale   rad/s per gyro LSB; the accelerometer scale cancels out
+    def __init__(self, capacity, datarate, gyro_scale, is_right_foot=True, alpha=0.8):
+        self.capacity = capacity
+        self.rad_per_lsb = gyro_scale / datarate  # per-sample rotation of one LSB
+        self.is_right_foot = is_right_foot
+        self.alpha = alpha
+        self.fpa_last_step = 0.0
+        tail = capacity - step_tail_start(capacity)
+        self.rot_x = array('f', (0.0 for _ in range(tail)))  # rotated accel of the tail rows
+        self.rot_y = array('f', (0.0 for _ in range(tail)))
+        self.window = array('f', (0.0 for _ in range(SMOOTH_WIN_LEN)))
+        self.window_len = 0
+        self._hanning(SMOOTH_WIN_LEN)
+
+    def compute(self, raw, first, length):
+        # FPA (deg) of the `length`-sample window starting at sample counter `first`
+        n = length
+        start = step_tail_start(n)
+        cap = self.capacity
+        g0 = g1 = g2 = 0
+        for c in range(first + max(n - EULER_INIT_LEN, 0), first + n):
+            o = (c % cap) * 12
+            g0 += _i16(raw, o + 6)
+            g1 += _i16(raw, o + 8)
+            g2 += _i16(raw, o + 10)
+        roll = math.atan2(g1, g2)
+        pitch = math.atan2(-g0, math.sqrt(g1 * g1 + g2 * g2))
+        init = n - (EULER_INIT_LEN + 1) // 2
+        for i in range(max(init, start), n):
+            self._rotate(raw, first + i, i - start, roll, pitch)
+        # integrate the gyro backward from the end of the window, as on the laptop
+        k = self.rad_per_lsb
+        for i in range(min(init, n) - 1, start - 1, -1):
+            o = ((first + i) % cap) * 12
+            gx = _i16(raw, o) * k
+            gy = _i16(raw, o + 2) * k
+            gz = _i16(raw, o + 4) * k
+            sin_r = math.sin(roll)
+            cos_r = math.cos(roll)
+            tan_p = math.tan(pitch)
+            roll = roll - (gx + sin_r * tan_p * gy + cos_r * tan_p * gz)
+            pitch = pitch - (cos_r * gy - sin_r * gz)
+            self._rotate(raw, first + i, i - start, roll, pitch)
+
+        # "same"-mode Hanning smoothing, evaluated only where the peak is searched
+        win_len = min(n, SMOOTH_WIN_LEN)
+        if win_len != self.window_len:
+            self._hanning(win_len)
+        w = self.window
+        rot_x, rot_y = self.rot_x, self.rot_y
+        off = (win_len - 1) // 2
+        best = -1.0
+        best_x = best_y = 0.0
+        for j in range((PEAK_CHECK_PCT * n) // 100, n):
+            sx = sy = 0.0
+            for m in range(max(0, j + off - win_len + 1), min(n, j + off + 1)):
+                wk = w[j + off - m]
+                sx += wk * rot_x[m - start]
+                sy += wk * rot_y[m - start]
+            norm = sx * sx + sy * sy
+            if norm > best:
+                best = norm
+                best_x = sx
+                best_y = sy
+
+        fpa = math.degrees(math.atan2(best_x, best_y))
+        if fpa > 90:
+            fpa -= 180
+        elif fpa < -90:
+            fpa += 180
+        if self.is_right_foot:
+            fpa = -fpa
+        fpa = fpa * self.alpha + (1 - self.alpha) * self.fpa_last_step
+        self.fpa_last_step = fpa
+        return fpa
+
+    def _rotate(self, raw, c, row, roll, pitch):
+        # horizontal components of the accel rotated by Ry(pitch) @ Rx(roll)
+        o = (c % self.capacity) * 12
+        ax = _i16(raw, o + 6)
+        ay = _i16(raw, o + 8)
+        az = _i16(raw, o + 10)
+        sin_r = math.sin(roll)
+        cos_r = math.cos(roll)
+        sin_p = math.sin(pitch)
+        self.rot_x[row] = math.cos(pitch) * ax + sin_p * sin_r * ay + sin_p * cos_r * az
+        self.rot_y[row] = cos_r * ay - sin_r * az
+
+    def _hanning(self, win_len):
+        # np.hanning(win_len) / its sum, into the first win_len entries of window
+        w = self.window
+        total = 0.0
+        for k in range(win_len):
+            w[k] = 0.5 - 0.5 * math.cos(2 * math.pi * k / (win_len - 1)) if win_len > 1 else 1.0
+            total += w[k]
+        for k in range(win_len):
+            w[k] /= total
+        self.window_len = win_len
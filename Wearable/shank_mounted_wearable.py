@@ -13,6 +13,7 @@ import busio
 from adafruit_lsm6ds.lsm6ds3trc import LSM6DS3TRC
 import adafruit_tca9548a
 import struct
+import supervisor
 
 _DRV_ADDR = 0x5A
 
@@ -22,6 +23,13 @@ MUX_CH1 = 1
 # right LRA
 MUX_CH2 = 2
 
+# Haptic playback (see Player): each cue is a PLAYBACK_MS burst of full-scale RTP.
+# LRA_MIN_INTERVAL on the laptop matches PLAYBACK_MS.
+PLAYBACK_MS = 500
+QUEUE_DEPTH = 4           # commands waiting for the motor; oldest dropped beyond this
+TICKS_MASK = (1 << 29) - 1  # supervisor.ticks_ms() wraps at 2**29
+MAX_LINE = 64             # longest command kept while waiting for its newline
+
 # Calibrated per-device values — limits set by auto-calibration, do not raise
 _CAL = {
     1: {"rated_voltage": 0x24, "od_clamp": 0x4C, "a_cal_comp": 0x0E, "a_cal_bemf": 0xB6, "bemf_gain": 1},
@@ -47,10 +55,82 @@ def drv_init(ch, cal):
     _drv_write(ch, 0x01, 0x05)                               # RTP mode
     _drv_write(ch, 0x02, 0x00)                               # RTP input = 0 (idle)
 
-def drv_buzz(ch, duration=0.5):
+def drv_start(ch):
     _drv_write(ch, 0x02, 0x7F)  # RTP = 0x7F (full scale within calibrated limits)
-    time.sleep(duration)
-    _drv_write(ch, 0x02, 0x00)  # stop
+
+def drv_stop(ch):
+    _drv_write(ch, 0x02, 0x00)  # RTP input = 0 (idle)
+
+def ticks_diff(later, earlier):
+    return (later - earlier) & TICKS_MASK
+
+def parse_command(token):
+    # "<drv>[!][#tag]" -> (drv, preempt, tag); a bare "1\n" works too
+    body, _, tag = token.partition("#")
+    preempt = body.endswith("!")
+    return int(body.rstrip("!")), preempt, (int(tag) if tag else None)
+
+def send_ack(tag, status, ms, now):
+    # "ack <tag> play <receive-to-actuate ms> <ticks>" or "ack <tag> drop <ms queued> <ticks>",
+    # ticks being ticks_ms when it happened, for the laptop's clock sync
+    if tag is not None:
+        uart.write(f"ack {tag} {status} {ms} {now}\n".encode())
+
+
+class Player:
+    # One cue at a time, without blocking the main loop: start() switches the RTP
+    # output on and returns; update() switches it off once PLAYBACK_MS have
+    # passed and starts the next queued command, if any.
+    #   preempt  stop the current cue, drop everything queued, play now
+    #   replace  play now if idle; otherwise take the place of a queued command
+    #            for the same motor, or join the queue (oldest dropped when full)
+
+    def __init__(self, channels):
+        self.channels = channels  # drv id -> mux channel
+        self.drv = None           # motor playing, None when idle
+        self.started = 0
+        self.queue = []           # [drv, tag, received ticks]
+
+    def submit(self, drv, preempt, tag, received):
+        if preempt:
+            self.stop()
+            for _, queued_tag, queued_at in self.queue:
+                send_ack(queued_tag, "drop", ticks_diff(received, queued_at), received)
+            self.queue = []
+        if self.drv is None:
+            self.start(drv, tag, received)
+            return
+        for entry in self.queue:
+            if entry[0] == drv:
+                send_ack(entry[1], "drop", ticks_diff(received, entry[2]), received)
+                entry[1], entry[2] = tag, received
+                return
+        if len(self.queue) == QUEUE_DEPTH:
+            _, old_tag, old_at = self.queue.pop(0)
+            send_ack(old_tag, "drop", ticks_diff(received, old_at), received)
+        self.queue.append([drv, tag, received])
+
+    def start(self, drv, tag, received):
+        drv_start(self.channels[drv])
+        self.drv = drv
+        self.started = supervisor.ticks_ms()
+        send_ack(tag, "play", ticks_diff(self.started, received), self.started)
+
+    def stop(self):
+        if self.drv is not None:
+            drv_stop(self.channels[self.drv])
+            self.drv = None
+
+    def update(self, now):
+        if self.drv is not None and ticks_diff(now, self.started) >= PLAYBACK_MS:
+            self.stop()
+        if self.drv is None and self.queue:
+            self.start(*self.queue.pop(0))
+
+    def reset(self):
+        # on disconnect: motors off, nothing left to play
+        self.stop()
+        self.queue = []
 
 ble = BLERadio()
 uart = UARTService()
@@ -73,33 +153,49 @@ drv_init(mux[MUX_CH2], _CAL[2])
 
 ble.start_advertising(advertisement)
 
-seq = 0
+player = Player({1: mux[MUX_CH1], 2: mux[MUX_CH2]})
+rx_buf = b""  # bytes after the last newline, completed by the next read
+
 while True:
     if ble.connected:
-        led.value = False 
+        led.value = False
         waiting = uart.in_waiting
         if waiting:
             received = uart.read(waiting)
+            received_at = supervisor.ticks_ms()
             if received is not None:
-                try:
-                    received_str = received.decode("utf-8").strip()
-                except Exception as e:
-                    print(f"Error decoding UART data: {e}")
-                    received_str = None
-                print(f"Received: {received_str}")
-                
-                
-                try:
-                    drv_id = int(received_str[0])
-                    if drv_id == 1:
-                        drv_buzz(mux[MUX_CH1])
-                    elif drv_id == 2:
-                        drv_buzz(mux[MUX_CH2])
+                # one read may end mid-command and the next may carry several;
+                # only newline-terminated commands are handled, the rest waits
+                lines = (rx_buf + received).split(b"\n")
+                rx_buf = lines.pop()
+                if len(rx_buf) > MAX_LINE:
+                    print(f"Dropping {len(rx_buf)} bytes without a newline")
+                    rx_buf = b""
+                for line in lines:
+                    try:
+                        token = line.decode("utf-8").strip()
+                    except Exception as e:
+                        print(f"Error decoding UART data: {e}")
+                        continue
+                    if not token:
+                        continue
+                    if token.startswith("p"):
+                        # clock sync ping (Laptop_PIpeline/clock_sync.py)
+                        uart.write(f"pong {token[1:]} {received_at}\n".encode())
+                        continue
+                    try:
+                        drv_id, preempt, tag = parse_command(token)
+                    except Exception as e:
+                        print(f"Error parsing command '{token}': {e}")
+                        continue
+                    if drv_id in player.channels:
+                        player.submit(drv_id, preempt, tag, received_at)
                     else:
                         print(f"Unknown driver: {drv_id}")
-                except Exception as e:
-                    print(f"Error parsing command '{received_str}': {e}")
+        player.update(supervisor.ticks_ms())
     else:
         led.value = True
+        player.reset()
+        rx_buf = b""
         if not ble.advertising:
             ble.start_advertising(advertisement)